@@ -1,31 +1,78 @@
-from flask import Flask, render_template, redirect, url_for, flash, request
+from flask import Flask, render_template, redirect, url_for, flash, request, Response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from flask_migrate import Migrate
+from flask_migrate import Migrate, upgrade
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import hashlib
+import io
+import json
 import os
+import database
 
 # Initialize Flask app
 app = Flask(__name__)
 from datetime import datetime
 app.jinja_env.globals['now'] = datetime.now
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///edms.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = database.database_uri()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['PROFILING'] = os.environ.get('PROFILING') == '1'
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['LIVE_EVENTS'] = os.environ.get('LIVE_EVENTS', 'auto')
 
 # Import and initialize database
 from models import db, User, Class, Subject, LessonPlan, Attendance, Grade, Message, Schedule, Notification, Holiday
 db.init_app(app)
+database.init_engine_profile(app, db)
+
+import queries
+from queries import query_budget
+queries.init_query_budget(app)
+import cache_versions
+cache_versions.init_cache_versions(app)
+import profiling
+profiling.init_profiling(app)
+import notifications
+import attendance as attendance_service
+import grade_stats
+import timetable
+import events
+import identity
+import school_stats
+import roster_import
+import exports
+import report_cards
+import people_search
+import rollover
+import schedule_conflicts
+import school_calendar
+import timetable_solver
 
 # Initialize extensions
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'),
+                  render_as_batch=True)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Bu sahypa görmek üçin giriň'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return identity.load(int(user_id))
+
+@app.context_processor
+def inject_unread_notifications():
+    if current_user.is_authenticated and current_user.role == 'student':
+        return {'unread_notifications': notifications.unread_count(current_user)}
+    return {'unread_notifications': 0}
+
+@app.context_processor
+def inject_live_events():
+    return {
+        'live_stream': events.streaming_enabled(app.config['LIVE_EVENTS']),
+        'live_poll_seconds': events.POLL_SECONDS,
+    }
 
 # Authentication Routes
 @app.route('/')
@@ -54,6 +101,7 @@ def login():
         
         if user and check_password_hash(user.password, password):
             login_user(user)
+            identity.remember(user)
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('index'))
         else:
@@ -71,31 +119,30 @@ def logout():
 # Director Routes
 @app.route('/director/dashboard')
 @login_required
+@query_budget(2)
 def director_dashboard():
     if current_user.role != 'director':
         flash('Siziň bu sahypa girmäge hukugyňyz ýok', 'danger')
         return redirect(url_for('index'))
     
-    stats = {
-        'total_students': User.query.filter_by(role='student').count(),
-        'total_teachers': User.query.filter_by(role='teacher').count(),
-        'total_classes': Class.query.count(),
-        'total_subjects': Subject.query.count()
-    }
-    
+    stats = school_stats.school_stats()
     return render_template('director/dashboard.html', stats=stats)
 
 @app.route('/director/users')
 @login_required
+@query_budget(2)
 def director_users():
     if current_user.role != 'director':
         return redirect(url_for('index'))
     
-    users = User.query.all()
-    return render_template('director/users.html', users=users)
+    users, next_cursor = queries.keyset_page(
+        queries.users_with_class(), [User.id], request.args.get('after'), descending=False
+    )
+    return render_template('director/users.html', users=users, next_cursor=next_cursor)
 
 @app.route('/director/user/create', methods=['GET', 'POST'])
 @login_required
+@query_budget(4)
 def director_create_user():
     if current_user.role != 'director':
         return redirect(url_for('index'))
@@ -121,14 +168,38 @@ def director_create_user():
         
         db.session.add(user)
         db.session.commit()
+        cache_versions.bump('school_stats', 'people_search')
         flash('Täze ulanyjy döredildi', 'success')
         return redirect(url_for('director_users'))
     
     classes = Class.query.all()
     return render_template('director/create_user.html', classes=classes)
 
+@app.route('/director/users/import', methods=['GET', 'POST'])
+@login_required
+def director_import_users():
+    if current_user.role != 'director':
+        return redirect(url_for('index'))
+    
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('roster')
+        if not upload or not upload.filename:
+            flash('CSV faýly saýlaň', 'danger')
+            return redirect(url_for('director_import_users'))
+        
+        # Stream the upload through the CSV reader instead of reading it whole
+        lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        report = roster_import.import_roster(lines, dry_run=bool(request.form.get('dry_run')))
+        if report['imported']:
+            flash(f"{sum(report['created'].values())} ulanyjy import edildi", 'success')
+            return redirect(url_for('director_users'))
+    
+    return render_template('director/import_users.html', report=report, columns=roster_import.COLUMNS)
+
 @app.route('/director/user/edit/<int:user_id>', methods=['GET', 'POST'])
 @login_required
+@query_budget(4)
 def director_edit_user(user_id):
     if current_user.role != 'director':
         return redirect(url_for('index'))
@@ -136,6 +207,7 @@ def director_edit_user(user_id):
     user = User.query.get_or_404(user_id)
     
     if request.method == 'POST':
+        audience = (user.role, user.class_id)
         user.username = request.form.get('username')
         user.full_name = request.form.get('full_name')
         user.role = request.form.get('role')
@@ -146,7 +218,13 @@ def director_edit_user(user_id):
         if new_password:
             user.password = generate_password_hash(new_password)
         
+        if (user.role, user.class_id) != audience:
+            # Class broadcasts the student now sees, or no longer sees
+            db.session.flush()
+            notifications.recompute_unread_counts([user.id])
         db.session.commit()
+        identity.forget(user_id)
+        cache_versions.bump('school_stats', 'people_search', 'timetable')
         flash('Ulanyjy maglumatlar täzelendi', 'success')
         return redirect(url_for('director_users'))
     
@@ -162,16 +240,19 @@ def director_delete_user(user_id):
     user = User.query.get_or_404(user_id)
     db.session.delete(user)
     db.session.commit()
+    identity.forget(user_id)
+    cache_versions.bump('school_stats', 'people_search', 'timetable')
     flash('Ulanyjy öçürildi', 'success')
     return redirect(url_for('director_users'))
 
 @app.route('/director/classes')
 @login_required
+@query_budget(4)
 def director_classes():
     if current_user.role != 'director':
         return redirect(url_for('index'))
     
-    classes = Class.query.all()
+    classes = queries.classes_with_teacher_and_students().all()
     teachers = User.query.filter_by(role='teacher').all()
     return render_template('director/classes.html', classes=classes, teachers=teachers)
 
@@ -191,16 +272,52 @@ def director_create_class():
     
     db.session.add(new_class)
     db.session.commit()
+    cache_versions.bump('school_stats', 'people_search')
     flash('Täze synp döredildi', 'success')
     return redirect(url_for('director_classes'))
 
+@app.route('/director/classes/rollover', methods=['GET', 'POST'])
+@login_required
+def director_classes_rollover():
+    if current_user.role != 'director':
+        return redirect(url_for('index'))
+    
+    classes = queries.classes_with_student_counts().all()
+    
+    if request.method == 'POST':
+        plan = {}
+        for class_row in classes:
+            target = request.form.get(f'target-{class_row.id}', '')
+            if target == rollover.GRADUATE:
+                plan[class_row.id] = rollover.GRADUATE
+            elif target == 'new':
+                plan[class_row.id] = request.form.get(f'name-{class_row.id}', '').strip()
+            elif target.isdigit() and int(target) != class_row.id:
+                plan[class_row.id] = int(target)
+        try:
+            report = rollover.rollover(plan, homeroom_follows=bool(request.form.get('homeroom_follows')))
+        except ValueError:
+            flash('Meýilnama nädogry: synplary we täze synp atlaryny barlaň', 'danger')
+            return redirect(url_for('director_classes_rollover'))
+        flash(f"{report['moved']} okuwçy geçirildi, {report['graduated']} okuwçy uçurym boldy, "
+              f"{len(report['created'])} täze synp döredildi", 'success')
+        if report['conflicts']:
+            flash(f"Göçürilen ders tertibinde {report['conflicts']} gabat gelme bar", 'warning')
+        if report['free_teachers']:
+            flash('Synpsyz galan mugallymlar: ' + ', '.join(report['free_teachers']), 'info')
+        return redirect(url_for('director_classes'))
+    
+    plan = rollover.suggest_plan([(c.id, c.name) for c in classes])
+    return render_template('director/rollover.html', classes=classes, plan=plan, graduate=rollover.GRADUATE)
+
 @app.route('/director/subjects')
 @login_required
+@query_budget(4)
 def director_subjects():
     if current_user.role != 'director':
         return redirect(url_for('index'))
     
-    subjects = Subject.query.all()
+    subjects = queries.subjects_with_class_and_teacher().all()
     classes = Class.query.all()
     teachers = User.query.filter_by(role='teacher').all()
     return render_template('director/subjects.html', subjects=subjects, classes=classes, teachers=teachers)
@@ -214,15 +331,18 @@ def director_create_subject():
     name = request.form.get('name')
     class_id = request.form.get('class_id')
     teacher_id = request.form.get('teacher_id')
+    weekly_hours = request.form.get('weekly_hours', 2, type=int)
     
     subject = Subject(
         name=name,
         class_id=int(class_id),
-        teacher_id=int(teacher_id)
+        teacher_id=int(teacher_id),
+        weekly_hours=max(weekly_hours, 1)
     )
     
     db.session.add(subject)
     db.session.commit()
+    cache_versions.bump('school_stats')
     flash('Täze ders döredildi', 'success')
     return redirect(url_for('director_subjects'))
 
@@ -233,8 +353,10 @@ def director_delete_subject(subject_id):
         return redirect(url_for('index'))
     
     subject = Subject.query.get_or_404(subject_id)
+    grade_stats.forget_subjects([subject.id])
     db.session.delete(subject)
     db.session.commit()
+    cache_versions.bump('school_stats', 'timetable')
     flash('Ders öçürildi', 'success')
     return redirect(url_for('director_subjects'))
 
@@ -245,32 +367,37 @@ def director_delete_class(class_id):
         return redirect(url_for('index'))
     
     class_obj = Class.query.get_or_404(class_id)
-    db.session.delete(class_obj)
+    rollover.delete_classes([class_obj.id])
     db.session.commit()
+    # Students of the class lost their class_id
+    cache_versions.bump('identity', 'school_stats', 'people_search', 'timetable')
     flash('Synp öçürildi', 'success')
     return redirect(url_for('director_classes'))
 
 @app.route('/director/schedules')
 @login_required
+@query_budget(4)
 def director_schedules():
     if current_user.role != 'director':
         return redirect(url_for('index'))
     
-    classes = Class.query.all()
-    return render_template('director/schedules.html', classes=classes)
+    classes = queries.classes_with_teacher_and_students().all()
+    conflicts = [schedule_conflicts.describe(c) for c in schedule_conflicts.school_conflicts()]
+    return render_template('director/schedules.html', classes=classes, conflicts=conflicts)
 
 @app.route('/director/schedule/<int:class_id>')
 @login_required
+@query_budget(4)
 def director_view_schedule(class_id):
     if current_user.role != 'director':
         return redirect(url_for('index'))
     
     class_obj = Class.query.get_or_404(class_id)
-    subjects = Subject.query.filter_by(class_id=class_id).all()
-    schedules = Schedule.query.filter_by(class_id=class_id).order_by(Schedule.day_of_week, Schedule.lesson_number).all()
+    subjects = queries.subjects_with_class_and_teacher(class_id=class_id).all()
+    schedules = queries.schedules_with_subject(class_id=class_id).all()
     
     # Organize schedules by day
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+    days = list(schedule_conflicts.WEEKDAYS)
     schedule_by_day = {day: [] for day in days}
     
     for schedule in schedules:
@@ -294,6 +421,22 @@ def director_create_schedule(class_id):
     start_time = request.form.get('start_time')
     end_time = request.form.get('end_time')
     
+    subject = queries.subjects_with_class_and_teacher(class_id=class_id).filter(Subject.id == int(subject_id)).first_or_404()
+    try:
+        slot = schedule_conflicts.Slot(
+            None, class_id, subject.teacher_id, subject.id, day_of_week, int(lesson_number),
+            schedule_conflicts.to_minutes(start_time), schedule_conflicts.to_minutes(end_time),
+            subject.class_obj.name, subject.name, subject.teacher.full_name
+        )
+    except ValueError:
+        flash('Sapagyň wagty nädogry', 'danger')
+        return redirect(url_for('director_view_schedule', class_id=class_id))
+    conflicts = schedule_conflicts.find_conflicts([slot], schedule_conflicts.load_slots())
+    if conflicts:
+        for conflict in conflicts:
+            flash(schedule_conflicts.describe(conflict), 'danger')
+        return redirect(url_for('director_view_schedule', class_id=class_id))
+    
     schedule = Schedule(
         class_id=class_id,
         day_of_week=day_of_week,
@@ -305,9 +448,92 @@ def director_create_schedule(class_id):
     
     db.session.add(schedule)
     db.session.commit()
+    cache_versions.bump('timetable')
+    publish_schedule_change(schedule)
     flash('Ders jadwala goşuldy', 'success')
     return redirect(url_for('director_view_schedule', class_id=class_id))
 
+@app.route('/director/schedule/<int:class_id>/week', methods=['GET', 'POST'])
+@login_required
+@query_budget(9)
+def director_edit_week(class_id):
+    if current_user.role != 'director':
+        return redirect(url_for('index'))
+    
+    class_obj = Class.query.get_or_404(class_id)
+    subjects = queries.subjects_with_class_and_teacher(class_id=class_id).all()
+    by_id = {subject.id: subject for subject in subjects}
+    days = list(schedule_conflicts.WEEKDAYS)
+    
+    if request.method == 'POST':
+        lessons = min(max(request.form.get('lessons', timetable_solver.LESSONS_PER_DAY, type=int), 1), 12)
+        grid, times, slots, errors = {}, {}, [], []
+        for number in range(1, lessons + 1):
+            times[number] = (request.form.get('start-%d' % number, ''), request.form.get('end-%d' % number, ''))
+            for day in days:
+                subject = by_id.get(request.form.get('cell-%s-%d' % (day, number), type=int))
+                if subject is None:
+                    continue
+                grid[day, number] = subject.id
+                try:
+                    start, end = (schedule_conflicts.to_minutes(value) for value in times[number])
+                except ValueError:
+                    errors.append('№%d sapagyň wagty nädogry' % number)
+                    continue
+                slots.append(schedule_conflicts.Slot(
+                    None, class_id, subject.teacher_id, subject.id, day, number, start, end,
+                    class_obj.name, subject.name, subject.teacher.full_name
+                ))
+        errors = sorted(set(errors))
+        errors += [schedule_conflicts.describe(c) for c in schedule_conflicts.find_conflicts(
+            slots, schedule_conflicts.load_slots(exclude_class_id=class_id)
+        )]
+        if errors:
+            for error in errors[:10]:
+                flash(error, 'danger')
+            if len(errors) > 10:
+                flash('... we ýene %d ýalňyşlyk' % (len(errors) - 10), 'danger')
+            return render_template('director/edit_week.html', class_obj=class_obj, subjects=subjects, days=days,
+                                   day_names=schedule_conflicts.DAY_NAMES, lessons=lessons, grid=grid, times=times,
+                                   classes=Class.query.filter(Class.id != class_id).order_by(Class.name).all())
+        
+        # Replace the whole week in one transaction
+        old_rows = db.session.query(Schedule.day_of_week, Subject.teacher_id).join(
+            Subject, Subject.id == Schedule.subject_id
+        ).filter(Schedule.class_id == class_id).all()
+        Schedule.query.filter_by(class_id=class_id).delete()
+        db.session.add_all(Schedule(
+            class_id=class_id, day_of_week=slot.day, lesson_number=slot.lesson_number, subject_id=slot.subject_id,
+            start_time=schedule_conflicts.format_minutes(slot.start), end_time=schedule_conflicts.format_minutes(slot.end)
+        ) for slot in slots)
+        db.session.commit()
+        cache_versions.bump('timetable')
+        publish_week_change(class_id, [tuple(row) for row in old_rows] + [(slot.day, slot.teacher_id) for slot in slots])
+        flash('Hepdelik ders jadwaly ýatda saklandy', 'success')
+        return redirect(url_for('director_view_schedule', class_id=class_id))
+    
+    # Start from the class's own timetable, or from another class's when copying
+    source_id = request.args.get('copy_from', type=int)
+    source = queries.schedules_with_subject(class_id=source_id or class_id).all()
+    if source_id:
+        by_name = {subject.name: subject.id for subject in subjects}
+        missing = sorted({row.subject.name for row in source if row.subject.name not in by_name})
+        if missing:
+            flash('Bu synpda ýok dersler göçürilmedi: %s' % ', '.join(missing), 'warning')
+        grid = {(row.day_of_week, row.lesson_number): by_name[row.subject.name]
+                for row in source if row.subject.name in by_name}
+    else:
+        grid = {(row.day_of_week, row.lesson_number): row.subject_id for row in source}
+    lessons = max([row.lesson_number for row in source] + [timetable_solver.LESSONS_PER_DAY])
+    lessons = request.args.get('lessons', lessons, type=int)
+    times = {number: timetable_solver.lesson_times(number) for number in range(1, lessons + 1)}
+    for row in source:
+        times[row.lesson_number] = (row.start_time, row.end_time)
+    return render_template('director/edit_week.html', class_obj=class_obj, subjects=subjects, days=days,
+                           day_names=schedule_conflicts.DAY_NAMES, lessons=lessons, grid=grid, times=times,
+                           classes=Class.query.filter(Class.id != class_id).order_by(Class.name).all(),
+                           copy_from=source_id)
+
 @app.route('/director/schedule/delete/<int:schedule_id>', methods=['POST'])
 @login_required
 def director_delete_schedule(schedule_id):
@@ -316,20 +542,50 @@ def director_delete_schedule(schedule_id):
     
     schedule = Schedule.query.get_or_404(schedule_id)
     class_id = schedule.class_id
+    # Read before the row goes; subscribers only hear about committed deletes
+    teacher_id = db.session.query(Subject.teacher_id).filter(Subject.id == schedule.subject_id).scalar()
+    day_teachers = [(schedule.day_of_week, teacher_id)]
     db.session.delete(schedule)
     db.session.commit()
+    cache_versions.bump('timetable')
+    publish_week_change(class_id, day_teachers)
     flash('Ders jadwaldan öçürildi', 'success')
     return redirect(url_for('director_view_schedule', class_id=class_id))
 
+def publish_week_change(class_id, day_teachers):
+    """Tell a class and the teachers involved which days of its timetable changed"""
+    for day in sorted({day for day, _ in day_teachers}):
+        events.publish('class:%d' % class_id, 'schedule', {'day': day})
+    for day, teacher_id in set(day_teachers):
+        if teacher_id:
+            events.publish('teacher:%d' % teacher_id, 'schedule', {'day': day})
+
+def publish_schedule_change(schedule):
+    """Tell the class and the subject's teacher that a day's timetable changed"""
+    teacher_id = db.session.query(Subject.teacher_id).filter(Subject.id == schedule.subject_id).scalar()
+    payload = {'day': schedule.day_of_week}
+    events.publish('class:%d' % schedule.class_id, 'schedule', payload)
+    if teacher_id:
+        events.publish('teacher:%d' % teacher_id, 'schedule', payload)
+
 @app.route('/director/parents')
 @login_required
+@query_budget(3)
 def director_parents():
     if current_user.role != 'director':
         return redirect(url_for('index'))
     
-    parents = User.query.filter_by(role='parent').all()
-    students = User.query.filter_by(role='student').all()
-    return render_template('director/parents.html', parents=parents, students=students)
+    parents, next_cursor = queries.keyset_page(
+        User.query.filter_by(role='parent'), [User.id], request.args.get('after'), descending=False
+    )
+    children = queries.children_by_parent([parent.id for parent in parents])
+    return render_template('director/parents.html', parents=parents, children=children, next_cursor=next_cursor)
+
+@app.route('/director/parents/students')
+@login_required
+def director_search_unlinked_students():
+    # Older URL for the parent-link picker; the search lives in api_people_search
+    return redirect(url_for('api_people_search', q=request.args.get('q', ''), role='student', unlinked=1, limit=20))
 
 @app.route('/director/parent/<int:parent_id>/add-child', methods=['POST'])
 @login_required
@@ -337,10 +593,14 @@ def director_add_child_to_parent(parent_id):
     if current_user.role != 'director':
         return redirect(url_for('index'))
     
-    student_id = request.form.get('student_id')
+    student_id = request.form.get('student_id', type=int)
+    if not student_id:
+        flash('Okuwçy saýlaň', 'danger')
+        return redirect(url_for('director_parents'))
     student = User.query.get_or_404(student_id)
     student.parent_id = parent_id
     db.session.commit()
+    cache_versions.bump('people_search')
     flash('Çaga ene-ata baglandy', 'success')
     return redirect(url_for('director_parents'))
 
@@ -353,11 +613,13 @@ def director_remove_child_from_parent(parent_id, student_id):
     student = User.query.get_or_404(student_id)
     student.parent_id = None
     db.session.commit()
+    cache_versions.bump('people_search')
     flash('Çaga ene-atadan aýryldy', 'success')
     return redirect(url_for('director_parents'))
 
 @app.route('/director/holidays')
 @login_required
+@query_budget(2)
 def director_holidays():
     if current_user.role != 'director':
         return redirect(url_for('index'))
@@ -385,6 +647,7 @@ def director_create_holiday():
     
     db.session.add(holiday)
     db.session.commit()
+    cache_versions.bump('school_calendar')
     flash('Baýramçylyk döredildi', 'success')
     return redirect(url_for('director_holidays'))
 
@@ -397,18 +660,19 @@ def director_delete_holiday(holiday_id):
     holiday = Holiday.query.get_or_404(holiday_id)
     db.session.delete(holiday)
     db.session.commit()
+    cache_versions.bump('school_calendar')
     flash('Baýramçylyk öçürildi', 'success')
     return redirect(url_for('director_holidays'))
 
 @app.route('/director/notifications')
 @login_required
+@query_budget(2)
 def director_notifications():
     if current_user.role != 'director':
         return redirect(url_for('index'))
     
-    students = User.query.filter_by(role='student').all()
     classes = Class.query.all()
-    return render_template('director/notifications.html', students=students, classes=classes)
+    return render_template('director/notifications.html', classes=classes)
 
 @app.route('/director/send-notification', methods=['POST'])
 @login_required
@@ -420,79 +684,52 @@ def director_send_notification():
     title = request.form.get('title')
     message = request.form.get('message')
     
-    receivers = []
-    
-    if receiver_type == 'all_students':
-        receivers = User.query.filter_by(role='student').all()
-    elif receiver_type == 'class':
-        class_id = request.form.get('class_id')
-        receivers = User.query.filter_by(role='student', class_id=int(class_id)).all()
-    elif receiver_type == 'individual':
-        student_id = request.form.get('student_id')
-        receivers = [User.query.get(int(student_id))]
-    
-    for receiver in receivers:
-        notification = Notification(
-            sender_id=current_user.id,
-            receiver_id=receiver.id,
-            title=title,
-            message=message
+    class_id = request.form.get('class_id')
+    student_id = request.form.get('student_id')
+    if receiver_type == 'individual' and not student_id:
+        flash('Okuwçy saýlaň', 'danger')
+        return redirect(url_for('director_notifications'))
+    
+    sent = 0
+    if receiver_type in ('all_students', 'class', 'individual'):
+        sent = notifications.send_notification(
+            current_user.id, title, message, receiver_type,
+            class_id=int(class_id) if receiver_type == 'class' else None,
+            receiver_id=int(student_id) if receiver_type == 'individual' else None
         )
-        db.session.add(notification)
     
-    db.session.commit()
-    flash(f'{len(receivers)} okuwça bildirim iberildi', 'success')
+    flash(f'{sent} okuwça bildirim iberildi', 'success')
     return redirect(url_for('director_notifications'))
 
+@app.route('/director/metrics')
+@login_required
+@query_budget(1)
+def director_metrics():
+    if current_user.role != 'director':
+        return redirect(url_for('index'))
+    
+    return render_template('director/metrics.html', enabled=app.config['PROFILING'],
+                           endpoints=profiling.metrics.summary(), samples=profiling.RECENT_SAMPLES,
+                           slow_query_ms=app.config['SLOW_QUERY_MS'])
+
 # Teacher Routes
 @app.route('/teacher/dashboard')
 @login_required
+@query_budget(8)
 def teacher_dashboard():
     if current_user.role != 'teacher':
         return redirect(url_for('index'))
     
-    my_classes = Class.query.filter_by(teacher_id=current_user.id).all()
-    my_subjects = Subject.query.filter_by(teacher_id=current_user.id).all()
+    my_classes = queries.classes_with_teacher_and_students(teacher_id=current_user.id).all()
+    my_subjects = queries.subjects_with_class_and_teacher(teacher_id=current_user.id).all()
     
     # Get current lesson info
-    from datetime import date, timedelta
+    from datetime import date
     today = date.today()
     day_name = today.strftime('%A')
     
-    subject_ids = [s.id for s in my_subjects]
-    schedules = Schedule.query.filter(
-        Schedule.subject_id.in_(subject_ids),
-        Schedule.day_of_week == day_name
-    ).order_by(Schedule.lesson_number).all()
-    
-    # Convert to JSON-serializable format
-    current_schedule = []
-    for schedule in schedules:
-        current_schedule.append({
-            'id': schedule.id,
-            'lesson_number': schedule.lesson_number,
-            'start_time': schedule.start_time,
-            'end_time': schedule.end_time,
-            'subject': {
-                'id': schedule.subject.id,
-                'name': schedule.subject.name,
-                'teacher': {
-                    'id': schedule.subject.teacher.id,
-                    'full_name': schedule.subject.teacher.full_name
-                }
-            },
-            'class': {
-                'id': schedule.class_obj.id,
-                'name': schedule.class_obj.name
-            }
-        })
-    
-    # Check for upcoming holidays
-    one_week_later = today + timedelta(days=7)
-    upcoming_holidays = Holiday.query.filter(
-        Holiday.start_date >= today,
-        Holiday.start_date <= one_week_later
-    ).all()
+    current_schedule = timetable.teacher_day(current_user.id, day_name) if school_calendar.is_school_day(today) else '[]'
+    upcoming_holidays = school_calendar.upcoming_holidays(today)
     
     return render_template('teacher/dashboard.html', 
                          classes=my_classes, 
@@ -502,18 +739,20 @@ def teacher_dashboard():
 
 @app.route('/teacher/students')
 @login_required
+@query_budget(3)
 def teacher_students():
     if current_user.role != 'teacher':
         return redirect(url_for('index'))
     
     my_classes = Class.query.filter_by(teacher_id=current_user.id).all()
     class_ids = [c.id for c in my_classes]
-    students = User.query.filter(User.role == 'student', User.class_id.in_(class_ids)).all()
+    students = queries.students_with_class(class_ids=class_ids).all()
     
     return render_template('teacher/students.html', students=students)
 
 @app.route('/teacher/attendance', methods=['GET', 'POST'])
 @login_required
+@query_budget(4)
 def teacher_attendance():
     if current_user.role != 'teacher':
         return redirect(url_for('index'))
@@ -522,27 +761,20 @@ def teacher_attendance():
         date = request.form.get('date')
         student_ids = request.form.getlist('student_ids')
         
-        for student_id in student_ids:
-            status = request.form.get(f'status_{student_id}')
-            attendance = Attendance(
-                student_id=int(student_id),
-                date=datetime.strptime(date, '%Y-%m-%d'),
-                status=status
-            )
-            db.session.add(attendance)
-        
-        db.session.commit()
+        marks = {int(student_id): request.form.get(f'status_{student_id}') for student_id in student_ids}
+        attendance_service.record_attendance(datetime.strptime(date, '%Y-%m-%d').date(), marks)
         flash('Gatnaşyk bellenildi', 'success')
         return redirect(url_for('teacher_attendance'))
     
     my_classes = Class.query.filter_by(teacher_id=current_user.id).all()
     class_ids = [c.id for c in my_classes]
-    students = User.query.filter(User.role == 'student', User.class_id.in_(class_ids)).all()
+    students = queries.students_with_class(class_ids=class_ids).all()
     
     return render_template('teacher/attendance.html', students=students)
 
 @app.route('/teacher/grades', methods=['GET', 'POST'])
 @login_required
+@query_budget(8)
 def teacher_grades():
     if current_user.role != 'teacher':
         return redirect(url_for('index'))
@@ -551,6 +783,9 @@ def teacher_grades():
         student_id = request.form.get('student_id')
         subject_id = request.form.get('subject_id')
         grade_value = request.form.get('grade')
+        if not student_id:
+            flash('Okuwçy saýlaň', 'danger')
+            return redirect(url_for('teacher_grades'))
         
         grade = Grade(
             student_id=int(student_id),
@@ -558,31 +793,34 @@ def teacher_grades():
             grade=int(grade_value),
             date=datetime.now()
         )
-        db.session.add(grade)
-        db.session.commit()
+        grade_stats.record_grade(grade)
         flash('Baha girizildi', 'success')
         return redirect(url_for('teacher_grades'))
     
-    my_subjects = Subject.query.filter_by(teacher_id=current_user.id).all()
-    my_classes = Class.query.filter_by(teacher_id=current_user.id).all()
-    class_ids = [c.id for c in my_classes]
-    students = User.query.filter(User.role == 'student', User.class_id.in_(class_ids)).all()
+    my_subjects = queries.subjects_with_class_and_teacher(teacher_id=current_user.id).all()
+    roster = people_search.index()
+    has_students = roster.has(roles=('student',), class_ids=roster.homeroom_class_ids(current_user.id))
     
     # Get all grades for teacher's subjects
     subject_ids = [s.id for s in my_subjects]
-    all_grades = Grade.query.filter(Grade.subject_id.in_(subject_ids)).order_by(Grade.date.desc()).all()
+    all_grades, next_cursor = queries.keyset_page(
+        queries.grades_with_student(subject_ids), [Grade.date, Grade.id], request.args.get('after'),
+        partition=(Grade.subject_id, subject_ids)
+    )
+    grade_summary = grade_stats.subjects_summary(subject_ids)
     
-    return render_template('teacher/grades.html', subjects=my_subjects, students=students, all_grades=all_grades)
+    return render_template('teacher/grades.html', subjects=my_subjects, has_students=has_students, all_grades=all_grades, grade_summary=grade_summary, next_cursor=next_cursor)
 
 @app.route('/teacher/lesson-plans')
 @login_required
+@query_budget(3)
 def teacher_lesson_plans():
     if current_user.role != 'teacher':
         return redirect(url_for('index'))
     
-    my_subjects = Subject.query.filter_by(teacher_id=current_user.id).all()
+    my_subjects = queries.subjects_with_class_and_teacher(teacher_id=current_user.id).all()
     subject_ids = [s.id for s in my_subjects]
-    plans = LessonPlan.query.filter(LessonPlan.subject_id.in_(subject_ids)).all()
+    plans = queries.lesson_plans_with_subject(subject_ids).all()
     
     return render_template('teacher/lesson_plans.html', plans=plans, subjects=my_subjects)
 
@@ -610,11 +848,13 @@ def teacher_create_plan():
     
     db.session.add(plan)
     db.session.commit()
+    cache_versions.bump('homework')
     flash('Okuw meýilnamasy döredildi', 'success')
     return redirect(url_for('teacher_lesson_plans'))
 
 @app.route('/teacher/schedule')
 @login_required
+@query_budget(5)
 def teacher_schedule():
     if current_user.role != 'teacher':
         return redirect(url_for('index'))
@@ -625,28 +865,27 @@ def teacher_schedule():
     # Get schedules for teacher's subjects
     my_subjects = Subject.query.filter_by(teacher_id=current_user.id).all()
     subject_ids = [s.id for s in my_subjects]
-    schedules = Schedule.query.filter(Schedule.subject_id.in_(subject_ids)).order_by(Schedule.day_of_week, Schedule.lesson_number).all()
+    schedules = queries.schedules_with_subject(subject_ids=subject_ids).all()
     
     # Organize by day
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+    days = list(schedule_conflicts.WEEKDAYS)
     schedule_by_day = {day: [] for day in days}
     
     for schedule in schedules:
         schedule_by_day[schedule.day_of_week].append(schedule)
     
-    return render_template('teacher/schedule.html', schedule_by_day=schedule_by_day, days=days)
+    return render_template('teacher/schedule.html', schedule_by_day=schedule_by_day, days=days,
+                           school_day=school_calendar.is_school_day(), next_school_day=school_calendar.next_school_day())
 
 @app.route('/teacher/notifications')
 @login_required
+@query_budget(2)
 def teacher_notifications():
     if current_user.role != 'teacher':
         return redirect(url_for('index'))
     
     my_classes = Class.query.filter_by(teacher_id=current_user.id).all()
-    class_ids = [c.id for c in my_classes]
-    students = User.query.filter(User.role == 'student', User.class_id.in_(class_ids)).all()
-    
-    return render_template('teacher/notifications.html', students=students, my_classes=my_classes)
+    return render_template('teacher/notifications.html', my_classes=my_classes)
 
 @app.route('/teacher/send-notification', methods=['POST'])
 @login_required
@@ -658,76 +897,42 @@ def teacher_send_notification():
     title = request.form.get('title')
     message = request.form.get('message')
     
-    receivers = []
-    
-    if receiver_type == 'class':
-        class_id = request.form.get('class_id')
-        receivers = User.query.filter_by(role='student', class_id=int(class_id)).all()
-    elif receiver_type == 'individual':
-        student_id = request.form.get('student_id')
-        receivers = [User.query.get(int(student_id))]
-    
-    for receiver in receivers:
-        notification = Notification(
-            sender_id=current_user.id,
-            receiver_id=receiver.id,
-            title=title,
-            message=message
+    class_id = request.form.get('class_id')
+    student_id = request.form.get('student_id')
+    if receiver_type == 'individual' and not student_id:
+        flash('Okuwçy saýlaň', 'danger')
+        return redirect(url_for('teacher_notifications'))
+    
+    sent = 0
+    if receiver_type in ('class', 'individual'):
+        sent = notifications.send_notification(
+            current_user.id, title, message, receiver_type,
+            class_id=int(class_id) if receiver_type == 'class' else None,
+            receiver_id=int(student_id) if receiver_type == 'individual' else None
         )
-        db.session.add(notification)
     
-    db.session.commit()
-    flash(f'{len(receivers)} okuwça bildirim iberildi', 'success')
+    flash(f'{sent} okuwça bildirim iberildi', 'success')
     return redirect(url_for('teacher_notifications'))
 
 # Student Routes
 @app.route('/student/dashboard')
 @login_required
+@query_budget(5)
 def student_dashboard():
     if current_user.role != 'student':
         return redirect(url_for('index'))
     
     my_class = Class.query.get(current_user.class_id) if current_user.class_id else None
-    subjects = Subject.query.filter_by(class_id=current_user.class_id).all() if current_user.class_id else []
+    subjects = queries.subjects_with_class_and_teacher(class_id=current_user.class_id).all() if current_user.class_id else []
     
     # Get current lesson info
-    from datetime import date, timedelta
+    from datetime import date
     today = date.today()
     day_name = today.strftime('%A')
     
-    schedules = Schedule.query.filter(
-        Schedule.class_id == current_user.class_id,
-        Schedule.day_of_week == day_name
-    ).order_by(Schedule.lesson_number).all() if current_user.class_id else []
-    
-    # Convert to JSON-serializable format
-    current_schedule = []
-    for schedule in schedules:
-        current_schedule.append({
-            'id': schedule.id,
-            'lesson_number': schedule.lesson_number,
-            'start_time': schedule.start_time,
-            'end_time': schedule.end_time,
-            'subject': {
-                'id': schedule.subject.id,
-                'name': schedule.subject.name,
-                'teacher': {
-                    'id': schedule.subject.teacher.id,
-                    'full_name': schedule.subject.teacher.full_name
-                }
-            },
-            'class': {
-                'id': schedule.class_obj.id,
-                'name': schedule.class_obj.name
-            }
-        })
-    
-    # Check for upcoming holidays
-    one_week_later = today + timedelta(days=7)
-    upcoming_holidays = Holiday.query.filter(
-        Holiday.start_date >= today,
-        Holiday.start_date <= one_week_later
-    ).all()
+    school_day = school_calendar.is_school_day(today)
+    current_schedule = timetable.class_day(current_user.class_id, day_name) if current_user.class_id and school_day else '[]'
+    upcoming_holidays = school_calendar.upcoming_holidays(today)
     
     return render_template('student/dashboard.html', 
                          my_class=my_class, 
@@ -737,36 +942,47 @@ def student_dashboard():
 
 @app.route('/student/grades')
 @login_required
+@query_budget(4)
 def student_grades():
     if current_user.role != 'student':
         return redirect(url_for('index'))
     
-    grades = Grade.query.filter_by(student_id=current_user.id).all()
-    return render_template('student/grades.html', grades=grades)
+    grades = queries.grades_with_subject(current_user.id).all()
+    grade_summary = grade_stats.student_summary(current_user.id)
+    return render_template('student/grades.html', grades=grades, grade_summary=grade_summary)
 
 @app.route('/student/attendance')
 @login_required
+@query_budget(6)
 def student_attendance():
     if current_user.role != 'student':
         return redirect(url_for('index'))
     
-    attendance = Attendance.query.filter_by(student_id=current_user.id).order_by(Attendance.date.desc()).all()
-    return render_template('student/attendance.html', attendance=attendance)
+    # One mark per day: the date alone is the page key
+    attendance, next_cursor = queries.keyset_page(
+        Attendance.query.filter_by(student_id=current_user.id), [Attendance.date], request.args.get('after')
+    )
+    attendance_stats = attendance_service.attendance_summary(current_user.id)
+    year_stats = attendance_service.school_year_attendance(current_user.id)
+    return render_template('student/attendance.html', attendance=attendance, attendance_stats=attendance_stats,
+                           year_stats=year_stats, next_cursor=next_cursor)
 
 @app.route('/student/lesson-plans')
 @login_required
+@query_budget(4)
 def student_lesson_plans():
     if current_user.role != 'student':
         return redirect(url_for('index'))
     
     subjects = Subject.query.filter_by(class_id=current_user.class_id).all() if current_user.class_id else []
     subject_ids = [s.id for s in subjects]
-    plans = LessonPlan.query.filter(LessonPlan.subject_id.in_(subject_ids)).all()
+    plans = queries.lesson_plans_with_subject(subject_ids).all()
     
     return render_template('student/lesson_plans.html', plans=plans)
 
 @app.route('/student/schedule')
 @login_required
+@query_budget(4)
 def student_schedule():
     if current_user.role != 'student':
         return redirect(url_for('index'))
@@ -775,26 +991,30 @@ def student_schedule():
         flash('Sizä entek synp bellenmedi', 'warning')
         return redirect(url_for('student_dashboard'))
     
-    schedules = Schedule.query.filter_by(class_id=current_user.class_id).order_by(Schedule.day_of_week, Schedule.lesson_number).all()
+    schedules = queries.schedules_with_subject(class_id=current_user.class_id).all()
     
     # Organize by day
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+    days = list(schedule_conflicts.WEEKDAYS)
     schedule_by_day = {day: [] for day in days}
     
     for schedule in schedules:
         schedule_by_day[schedule.day_of_week].append(schedule)
     
-    return render_template('student/schedule.html', schedule_by_day=schedule_by_day, days=days)
+    return render_template('student/schedule.html', schedule_by_day=schedule_by_day, days=days,
+                           school_day=school_calendar.is_school_day(), next_school_day=school_calendar.next_school_day())
 
 @app.route('/student/notifications')
 @login_required
+@query_budget(3)
 def student_notifications():
     if current_user.role != 'student':
         return redirect(url_for('index'))
     
-    notifications = Notification.query.filter_by(receiver_id=current_user.id).order_by(Notification.created_at.desc()).all()
+    inbox, next_cursor = queries.keyset_page(
+        notifications.inbox(current_user), [Notification.created_at, Notification.id], request.args.get('after')
+    )
     
-    return render_template('student/notifications.html', notifications=notifications)
+    return render_template('student/notifications.html', notifications=inbox, next_cursor=next_cursor)
 
 @app.route('/student/notification/<int:notif_id>/read', methods=['POST'])
 @login_required
@@ -802,25 +1022,32 @@ def student_mark_notification_read(notif_id):
     if current_user.role != 'student':
         return redirect(url_for('index'))
     
-    notification = Notification.query.get_or_404(notif_id)
-    if notification.receiver_id == current_user.id:
-        notification.is_read = True
-        db.session.commit()
+    notifications.mark_read(notif_id, current_user)
+    return redirect(url_for('student_notifications'))
+
+@app.route('/student/notifications/read-all', methods=['POST'])
+@login_required
+def student_mark_all_notifications_read():
+    if current_user.role != 'student':
+        return redirect(url_for('index'))
     
+    notifications.mark_all_read(current_user)
     return redirect(url_for('student_notifications'))
 
 # Parent Routes
 @app.route('/parent/dashboard')
 @login_required
+@query_budget(2)
 def parent_dashboard():
     if current_user.role != 'parent':
         return redirect(url_for('index'))
     
-    children = User.query.filter_by(role='student', parent_id=current_user.id).all()
+    children = queries.students_with_class(parent_id=current_user.id).all()
     return render_template('parent/dashboard.html', children=children)
 
 @app.route('/parent/child/<int:child_id>/grades')
 @login_required
+@query_budget(5)
 def parent_child_grades(child_id):
     if current_user.role != 'parent':
         return redirect(url_for('index'))
@@ -830,11 +1057,13 @@ def parent_child_grades(child_id):
         flash('Siziň bu sahypa girmäge hukugyňyz ýok', 'danger')
         return redirect(url_for('parent_dashboard'))
     
-    grades = Grade.query.filter_by(student_id=child_id).all()
-    return render_template('parent/child_grades.html', child=child, grades=grades)
+    grades = queries.grades_with_subject(child_id).all()
+    grade_summary = grade_stats.student_summary(child_id)
+    return render_template('parent/child_grades.html', child=child, grades=grades, grade_summary=grade_summary)
 
 @app.route('/parent/child/<int:child_id>/attendance')
 @login_required
+@query_budget(7)
 def parent_child_attendance(child_id):
     if current_user.role != 'parent':
         return redirect(url_for('index'))
@@ -844,12 +1073,216 @@ def parent_child_attendance(child_id):
         flash('Siziň bu sahypa girmäge hukugyňyz ýok', 'danger')
         return redirect(url_for('parent_dashboard'))
     
-    attendance = Attendance.query.filter_by(student_id=child_id).order_by(Attendance.date.desc()).all()
-    return render_template('parent/child_attendance.html', child=child, attendance=attendance)
+    attendance, next_cursor = queries.keyset_page(
+        Attendance.query.filter_by(student_id=child_id), [Attendance.date], request.args.get('after')
+    )
+    attendance_stats = attendance_service.attendance_summary(child_id)
+    year_stats = attendance_service.school_year_attendance(child_id)
+    return render_template('parent/child_attendance.html', child=child, attendance=attendance,
+                           attendance_stats=attendance_stats, year_stats=year_stats, next_cursor=next_cursor)
+
+@app.route('/parent/child/<int:child_id>/report-card')
+@login_required
+@query_budget(7)
+def parent_child_report_card(child_id):
+    if current_user.role != 'parent':
+        return redirect(url_for('index'))
+    
+    child = User.query.get_or_404(child_id)
+    if child.parent_id != current_user.id:
+        flash('Siziň bu sahypa girmäge hukugyňyz ýok', 'danger')
+        return redirect(url_for('parent_dashboard'))
+    
+    cards = report_cards.class_cards(child.class_id, student_ids=[child.id]) if child.class_id else []
+    if not cards:
+        flash('Okuwçy synpa bellenmedik', 'warning')
+        return redirect(url_for('parent_dashboard'))
+    return report_cards.render_card(cards[0])
+
+# Export Routes
+def export_scope():
+    """Classes and subjects the current user may export (None means all)"""
+    if current_user.role == 'director':
+        return None, None
+    subject_ids = [s.id for s in Subject.query.filter_by(teacher_id=current_user.id).with_entities(Subject.id)]
+    class_ids = [c.id for c in Class.query.filter_by(teacher_id=current_user.id).with_entities(Class.id)]
+    return class_ids, subject_ids
+
+def export_filters():
+    """Class, subject and date range from the query string"""
+    def parse_date(name):
+        value = request.args.get(name)
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    
+    class_id = request.args.get('class_id', type=int)
+    subject_id = request.args.get('subject_id', type=int)
+    return class_id, subject_id, parse_date('start'), parse_date('end')
+
+def export_response(rows, name, sheet_title):
+    if request.args.get('format') == 'xlsx':
+        if not exports.xlsx_available():
+            return 'XLSX eksporty üçin openpyxl gurnalmaly', 501
+        body = exports.xlsx_chunks(rows, sheet_title)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        filename = name + '.xlsx'
+    else:
+        body = exports.csv_chunks(rows)
+        mimetype = 'text/csv'
+        filename = name + '.csv'
+    # stream_with_context keeps the database session alive while the body is sent
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@app.route('/metrics')
+def metrics_text():
+    # Scrapers authenticate with METRICS_TOKEN; a logged-in director may look too
+    token = app.config['METRICS_TOKEN']
+    authorized = token and request.headers.get('Authorization') == 'Bearer ' + token
+    if not authorized and not (current_user.is_authenticated and current_user.role == 'director'):
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    if not app.config['PROFILING']:
+        return Response('profiling is disabled\n', status=404, mimetype='text/plain')
+    return Response(profiling.metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/exports')
+@login_required
+@query_budget(3)
+def export_index():
+    if current_user.role not in ('director', 'teacher'):
+        return redirect(url_for('index'))
+    
+    if current_user.role == 'director':
+        classes = Class.query.order_by(Class.name).all()
+        subjects = queries.subjects_with_class_and_teacher().all()
+    else:
+        classes = Class.query.filter_by(teacher_id=current_user.id).order_by(Class.name).all()
+        subjects = queries.subjects_with_class_and_teacher(teacher_id=current_user.id).all()
+    return render_template('exports.html', classes=classes, subjects=subjects)
+
+@app.route('/exports/grades')
+@login_required
+def export_grades():
+    if current_user.role not in ('director', 'teacher'):
+        return redirect(url_for('index'))
+    
+    try:
+        class_id, subject_id, start, end = export_filters()
+    except ValueError:
+        flash('Nädogry sene', 'danger')
+        return redirect(url_for('export_index'))
+    
+    _, allowed_subjects = export_scope()
+    subject_ids = [subject_id] if subject_id else allowed_subjects
+    if allowed_subjects is not None and subject_id and subject_id not in allowed_subjects:
+        flash('Siziň bu sahypa girmäge hukugyňyz ýok', 'danger')
+        return redirect(url_for('export_index'))
+    
+    rows = exports.grade_rows(
+        class_ids=[class_id] if class_id else None, subject_ids=subject_ids, start=start, end=end
+    )
+    return export_response(rows, 'bahalar', 'Bahalar')
+
+@app.route('/exports/attendance')
+@login_required
+def export_attendance():
+    if current_user.role not in ('director', 'teacher'):
+        return redirect(url_for('index'))
+    
+    try:
+        class_id, _, start, end = export_filters()
+    except ValueError:
+        flash('Nädogry sene', 'danger')
+        return redirect(url_for('export_index'))
+    
+    allowed_classes, _ = export_scope()
+    class_ids = [class_id] if class_id else allowed_classes
+    if allowed_classes is not None and class_id and class_id not in allowed_classes:
+        flash('Siziň bu sahypa girmäge hukugyňyz ýok', 'danger')
+        return redirect(url_for('export_index'))
+    
+    rows = exports.attendance_rows(class_ids=class_ids, start=start, end=end)
+    return export_response(rows, 'gatnasyk', 'Gatnaşyk')
+
+# API Routes
+@app.route('/api/lessons/today')
+@login_required
+@query_budget(3)
+def api_today_lessons():
+    if current_user.role not in ('teacher', 'student'):
+        return {'error': 'forbidden'}, 403
+    
+    from datetime import date
+    today = date.today()
+    day_name = today.strftime('%A')
+    
+    if not school_calendar.is_school_day(today):
+        lessons = []
+    elif current_user.role == 'teacher':
+        lessons = timetable.teacher_lessons(current_user.id, day_name)
+    elif current_user.class_id:
+        lessons = timetable.class_lessons(current_user.class_id, day_name)
+    else:
+        lessons = []
+    
+    homework = timetable.homework_for({lesson['subject']['id'] for lesson in lessons}, today)
+    body = json.dumps({
+        'date': today.isoformat(),
+        'lessons': [dict(lesson, homework=homework.get(lesson['subject']['id'])) for lesson in lessons]
+    })
+    
+    # Strong ETag over the payload: unchanged polls get an empty 304
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(hashlib.sha1(body.encode('utf-8')).hexdigest())
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/people/search')
+@login_required
+@query_budget(3)
+def api_people_search():
+    if current_user.role not in ('director', 'teacher'):
+        return {'error': 'forbidden'}, 403
+    
+    roster = people_search.index()
+    roles = request.args.getlist('role') or None
+    class_ids = request.args.getlist('class_id', type=int) or None
+    if current_user.role == 'teacher':
+        # Teachers reach the students of the classes they lead, as on their own pages
+        own = roster.homeroom_class_ids(current_user.id)
+        class_ids = [c for c in class_ids if c in own] if class_ids else own
+        roles = ['student']
+    limit = min(max(request.args.get('limit', people_search.DEFAULT_LIMIT, type=int), 1), people_search.MAX_LIMIT)
+    results = roster.search(
+        request.args.get('q', ''), roles=roles, class_ids=class_ids,
+        unlinked=request.args.get('unlinked') == '1', limit=limit
+    )
+    return {'results': results}
+
+@app.route('/events')
+@login_required
+def event_stream():
+    if not events.streaming_enabled(app.config['LIVE_EVENTS']):
+        # No cooperative worker to hold the stream; 204 stops EventSource reconnecting
+        return '', 204
+    # Resolve the channels now: the generator outlives the request context
+    # and must not keep a database connection checked out while idle
+    channels = events.channels_for(current_user)
+    response = Response(events.stream(channels), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/events/poll')
+@login_required
+@query_budget(2)
+def event_poll():
+    # Fallback for pages without a stream: the counter comes with the session identity
+    return {'unread': notifications.unread_count(current_user) if current_user.role == 'student' else 0}
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade()
         # Create default director if not exists
         if not User.query.filter_by(username='director').first():
             director = User(
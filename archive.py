@@ -0,0 +1,174 @@
+import re
+from datetime import date, datetime
+
+from sqlalchemy import Column, Index, MetaData, Table, func, insert, select, union_all
+
+import attendance
+import grade_stats
+import notifications
+from models import db, Grade, Attendance, Notification, NotificationRead, ArchivedYear
+from school_calendar import YEAR_START, academic_year
+
+# Academic-year archive
+#
+# Grades, attendance marks and notifications are only ever appended to, so
+# the live tables would grow by a year's worth of rows every year and the
+# student pages with them. Once an academic year is over, archive_year()
+# moves its rows into per-year tables (grades_2024, attendance_2024,
+# notifications_2024 for 2024/2025) with the same columns and values, and
+# deletes them from the live tables, in one transaction. The live tables
+# then hold about one year, which is all the student pages show.
+#
+# Derived data follows the live tables: the grade rollups and unread
+# counters are recomputed and the attendance rollups of the archived months
+# are dropped in the same transaction. Read receipts of archived
+# notifications are deleted, as archived notifications count as read.
+#
+# Historical reports read through source(), which is the live table alone
+# or, when the requested range reaches into archived years, a UNION ALL of
+# the live table and those years' tables with the same columns. The list of
+# archived years is read from archived_years on every call rather than
+# cached, so a year archived by one process (the CLI, another worker) is
+# seen by every report at once; it is a primary-key scan of a few rows.
+#
+# The per-year tables are created here at runtime, not by migrations, so
+# migrations/env.py leaves them out of autogenerate (is_archive_table).
+
+ARCHIVED_MODELS = (Grade, Attendance, Notification)
+DATE_COLUMNS = {Grade: 'date', Attendance: 'date', Notification: 'created_at'}
+
+_metadata = MetaData()
+_archive_name = re.compile(r'(%s)_\d{4}$' % '|'.join(model.__tablename__ for model in ARCHIVED_MODELS))
+
+
+def year_bounds(first_year):
+    """First day of the academic year and first day of the next one"""
+    return date(first_year, *YEAR_START), date(first_year + 1, *YEAR_START)
+
+
+def is_archive_table(name):
+    """Whether a table name is one of the per-year archive tables"""
+    return _archive_name.match(name) is not None
+
+
+def archive_table(model, first_year):
+    """The archive table of ``model`` for an academic year, with the live table's columns"""
+    live = model.__table__
+    name = '%s_%d' % (live.name, first_year)
+    table = _metadata.tables.get(name)
+    if table is not None:
+        return table
+    # Plain columns, no foreign keys: archived rows outlive the users and subjects they name
+    table = Table(name, _metadata, *[
+        Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+        for column in live.columns
+    ])
+    indexed = set()
+    for index in live.indexes:
+        # ix_grades_subject_date -> ix_grades_2024_subject_date
+        Index(index.name.replace(live.name, name, 1), *[table.c[column.name] for column in index.columns])
+        indexed.add(index.columns[0].name)
+    for column in live.columns:
+        if column.foreign_keys and column.name not in indexed:
+            Index('ix_%s_%s' % (name, column.name), table.c[column.name])
+    return table
+
+
+def _in_year(model, first_year):
+    column = getattr(model, DATE_COLUMNS[model])
+    start, end = year_bounds(first_year)
+    if model is Notification:
+        start, end = datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+    return (column >= start) & (column < end)
+
+
+def archived_years():
+    """Academic years (by first calendar year) that have archive tables, oldest first"""
+    return list(db.session.execute(
+        select(ArchivedYear.first_year).order_by(ArchivedYear.first_year)
+    ).scalars())
+
+
+def source(model, start=None, end=None):
+    """Table to select ``model`` rows from (dates inclusive).
+
+    The live table itself, or a UNION ALL of it and the archive tables of
+    the years between ``start`` and ``end``. Columns are the same either
+    way, so callers select from ``source(...).c``.
+    """
+    first = academic_year(start) if start is not None else None
+    last = academic_year(end) if end is not None else None
+    years = [
+        year for year in archived_years()
+        if (first is None or year >= first) and (last is None or year <= last)
+    ]
+    if not years:
+        return model.__table__
+    return union_all(
+        select(model.__table__), *[select(archive_table(model, year)) for year in years]
+    ).subquery(model.__tablename__)
+
+
+def live_years():
+    """Academic years that still have rows in any live table, oldest first"""
+    firsts = [
+        db.session.query(func.min(getattr(model, DATE_COLUMNS[model]))).scalar()
+        for model in ARCHIVED_MODELS
+    ]
+    firsts = [value.date() if isinstance(value, datetime) else value for value in firsts if value is not None]
+    if not firsts:
+        return []
+    return list(range(academic_year(min(firsts)), academic_year(date.today()) + 1))
+
+
+def pending_counts(first_year):
+    """Live rows per table that archive_year() would move"""
+    return {
+        model.__tablename__: db.session.query(func.count()).select_from(model).filter(
+            _in_year(model, first_year)).scalar()
+        for model in ARCHIVED_MODELS
+    }
+
+
+def archive_year(first_year):
+    """Move a finished academic year out of the live tables; returns rows moved per table.
+
+    Archiving a year again (rows entered late) appends to its archive tables.
+    """
+    if first_year >= academic_year(date.today()):
+        raise ValueError('%d/%d is not over yet' % (first_year, first_year + 1))
+
+    tables = {model: archive_table(model, first_year) for model in ARCHIVED_MODELS}
+    _metadata.create_all(bind=db.session.connection(), tables=list(tables.values()), checkfirst=True)
+
+    moved = {}
+    try:
+        for model, table in tables.items():
+            live = model.__table__
+            in_year = _in_year(model, first_year)
+            columns = [column.name for column in live.columns]
+            moved[model.__tablename__] = db.session.execute(
+                insert(table).from_select(columns, select(live).where(in_year))
+            ).rowcount
+            if model is Notification:
+                NotificationRead.query.filter(NotificationRead.notification_id.in_(
+                    select(Notification.id).where(in_year)
+                )).delete(synchronize_session=False)
+            model.query.filter(in_year).delete(synchronize_session=False)
+
+        attendance.forget_months(*year_bounds(first_year))
+        grade_stats.recompute_grade_stats()
+        notifications.recompute_unread_counts()
+
+        record = db.session.get(ArchivedYear, first_year) or ArchivedYear(
+            first_year=first_year, grades=0, attendance=0, notifications=0)
+        record.grades += moved['grades']
+        record.attendance += moved['attendance']
+        record.notifications += moved['notifications']
+        record.archived_at = datetime.utcnow()
+        db.session.add(record)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return moved
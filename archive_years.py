@@ -0,0 +1,54 @@
+import argparse
+import sys
+from datetime import date
+
+from flask_migrate import upgrade
+
+from app import app, db
+from models import ArchivedYear
+from school_calendar import academic_year
+import archive
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Move finished academic years of grades, attendance and notifications into archive tables')
+    parser.add_argument('--year', type=int, action='append', metavar='YYYY',
+                        help='academic year by its first calendar year, e.g. 2024 for 2024/2025; '
+                             'repeat for several (default: every finished year)')
+    parser.add_argument('--list', action='store_true', help='show archived years and exit')
+    parser.add_argument('--dry-run', action='store_true', help='count the rows without moving them')
+    args = parser.parse_args()
+
+    with app.app_context():
+        upgrade()
+        if args.list:
+            for record in ArchivedYear.query.order_by(ArchivedYear.first_year):
+                print("%d/%d  %8d grades  %8d attendance  %8d notifications  (%s)" % (
+                    record.first_year, record.first_year + 1, record.grades, record.attendance,
+                    record.notifications, record.archived_at.strftime('%Y-%m-%d %H:%M')))
+            return 0
+
+        current = academic_year(date.today())
+        years = args.year or [year for year in archive.live_years() if year < current]
+        if any(year >= current for year in years):
+            print("%d/%d is not over yet" % (current, current + 1))
+            return 1
+        if not years:
+            print("Nothing to archive")
+            return 0
+
+        for year in sorted(years):
+            counts = archive.pending_counts(year)
+            if not any(counts.values()):
+                print("%d/%d: nothing left in the live tables" % (year, year + 1))
+                continue
+            if not args.dry_run:
+                counts = archive.archive_year(year)
+            print("%s %d/%d: %d grades, %d attendance marks, %d notifications" % (
+                'Would archive' if args.dry_run else '✓ Archived', year, year + 1,
+                counts['grades'], counts['attendance'], counts['notifications']))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, false, func, insert, literal, or_, select, union_all
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+import school_calendar
+from models import db, Attendance, AttendanceMonthStat
+
+ATTENDANCE_STATUSES = ('present', 'absent', 'late', 'excused')
+
+# Monthly rollups
+#
+# attendance_month_stats holds per-student status counts for every month.
+# record_attendance() refreshes the affected month in the same transaction,
+# so summaries over long ranges read one row per month and status instead
+# of one row per school day. rebuild_attendance_stats() recomputes the
+# table from scratch.
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def record_attendance(day, marks):
+    """Write a day's roll call as one upsert on (student_id, date).
+
+    ``marks`` maps student ids to statuses. Submitting the same day again
+    overwrites the earlier marks instead of adding rows.
+    """
+    now = datetime.utcnow()
+    rows = [
+        {'student_id': student_id, 'date': day, 'status': status, 'created_at': now}
+        for student_id, status in marks.items()
+        if status in ATTENDANCE_STATUSES
+    ]
+    if not rows:
+        return 0
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(Attendance).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Attendance.student_id, Attendance.date],
+            set_={'status': stmt.excluded.status}
+        )
+        db.session.execute(stmt)
+    elif dialect in ('mysql', 'mariadb'):
+        stmt = mysql.insert(Attendance).values(rows)
+        db.session.execute(stmt.on_duplicate_key_update(status=stmt.inserted.status))
+    else:
+        # No native upsert: replace the day's marks for these students
+        Attendance.query.filter(
+            Attendance.date == day,
+            Attendance.student_id.in_([row['student_id'] for row in rows])
+        ).delete(synchronize_session=False)
+        db.session.execute(db.insert(Attendance), rows)
+    _refresh_month([row['student_id'] for row in rows], _month_start(day))
+    db.session.commit()
+    return len(rows)
+
+
+def _refresh_month(student_ids, month):
+    """Recompute one month of rollups for the given students (caller commits)"""
+    stat_filter = [AttendanceMonthStat.month == month]
+    day_filter = [Attendance.date >= month, Attendance.date < _next_month(month)]
+    if student_ids is not None:
+        stat_filter.append(AttendanceMonthStat.student_id.in_(student_ids))
+        day_filter.append(Attendance.student_id.in_(student_ids))
+    AttendanceMonthStat.query.filter(*stat_filter).delete(synchronize_session=False)
+    db.session.execute(insert(AttendanceMonthStat).from_select(
+        ['student_id', 'month', 'status', 'count'],
+        select(Attendance.student_id, literal(month), Attendance.status, func.count(Attendance.id))
+        .where(*day_filter)
+        .group_by(Attendance.student_id, Attendance.status)
+    ))
+
+
+def forget_months(start, end):
+    """Drop the rollups of the months from ``start`` up to ``end`` (exclusive; caller commits)"""
+    AttendanceMonthStat.query.filter(
+        AttendanceMonthStat.month >= start, AttendanceMonthStat.month < end
+    ).delete(synchronize_session=False)
+
+
+def rebuild_attendance_stats():
+    """Recompute every monthly rollup from the attendance table"""
+    AttendanceMonthStat.query.delete(synchronize_session=False)
+    first, last = db.session.query(func.min(Attendance.date), func.max(Attendance.date)).one()
+    month = _month_start(first) if first else None
+    while month and month <= last:
+        _refresh_month(None, month)
+        month = _next_month(month)
+    db.session.commit()
+
+
+def attendance_summary(student_id, start=None, end=None, use_rollup=True):
+    """Status counts and attendance rate of a student between two dates (inclusive).
+
+    Whole months inside the range are read from the monthly rollups and the
+    partial months at either end from the attendance table, combined in a
+    single GROUP BY query.
+    """
+    raw = select(Attendance.status, func.count(Attendance.id).label('n')).where(
+        Attendance.student_id == student_id
+    )
+    if use_rollup:
+        # [months_from, months_to) is the run of whole months inside the range
+        months_from = None if start is None else (
+            start if start.day == 1 else _next_month(start))
+        months_to = None if end is None else (
+            _next_month(end) if end + timedelta(days=1) == _next_month(end) else _month_start(end))
+        if months_from and months_to and months_from >= months_to:
+            use_rollup = False
+
+    if use_rollup:
+        rolled = select(AttendanceMonthStat.status, func.sum(AttendanceMonthStat.count).label('n')).where(
+            AttendanceMonthStat.student_id == student_id
+        )
+        edges = []
+        if months_from is not None:
+            rolled = rolled.where(AttendanceMonthStat.month >= months_from)
+            edges.append(and_(Attendance.date >= start, Attendance.date < months_from))
+        if months_to is not None:
+            rolled = rolled.where(AttendanceMonthStat.month < months_to)
+            edges.append(and_(Attendance.date >= months_to, Attendance.date <= end))
+        raw = raw.where(or_(*edges)) if edges else raw.where(false())
+        parts = union_all(
+            raw.group_by(Attendance.status),
+            rolled.group_by(AttendanceMonthStat.status)
+        ).subquery()
+        rows = db.session.execute(
+            select(parts.c.status, func.sum(parts.c.n)).group_by(parts.c.status)
+        ).all()
+    else:
+        if start is not None:
+            raw = raw.where(Attendance.date >= start)
+        if end is not None:
+            raw = raw.where(Attendance.date <= end)
+        rows = db.session.execute(raw.group_by(Attendance.status)).all()
+
+    counts = dict.fromkeys(ATTENDANCE_STATUSES, 0)
+    counts.update({status: int(n) for status, n in rows})
+    total = sum(counts.values())
+    return {
+        'counts': counts,
+        'total': total,
+        'rates': {status: round(n / total * 100, 1) if total else 0 for status, n in counts.items()},
+    }
+
+
+def school_year_attendance(student_id, today=None):
+    """Share of this academic year's school days so far that a student attended.
+
+    One GROUP BY over the year's marks; marks on days that are not school
+    days (Sundays, holidays, the summer break) are left out in SQL.
+    """
+    today = today or date.today()
+    year = school_calendar.school_year(today)
+    school_days = year.count(year.start, today)
+    last = min(today, year.last_term_day)
+    counts = dict(db.session.execute(
+        select(Attendance.status, func.count(Attendance.id))
+        .where(
+            Attendance.student_id == student_id,
+            Attendance.date >= year.start,
+            Attendance.date <= last,
+            Attendance.date.notin_(year.closed_days(year.start, last))
+        )
+        .group_by(Attendance.status)
+    ).all())
+    marked = sum(counts.values())
+    attended = counts.get('present', 0) + counts.get('late', 0)
+    return {
+        'school_days': school_days,
+        'year_school_days': len(year),
+        'marked': marked,
+        'attended': attended,
+        'rate': round(attended / school_days * 100, 1) if school_days else None,
+    }
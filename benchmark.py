@@ -0,0 +1,224 @@
+"""End-to-end route benchmark.
+
+Logs in as a director, a teacher, a student and a parent and requests every
+GET route of app.py through the Flask test client. For each (role, route)
+pair that the role may open it reports p50/p95/p99 latency, the number of
+SQL statements per request and the peak Python memory of one request.
+Results can be saved as a baseline and later runs compared against it.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python seed_data.py --reset
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmark.py --save baseline.json
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmark.py --compare baseline.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from flask import url_for
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app, db
+from models import User, Class
+import identity
+import people_search
+import school_calendar
+import school_stats
+import timetable
+
+ROLES = ('director', 'teacher', 'student', 'parent')
+# Endpoints that cannot be benchmarked as plain requests
+SKIP_ENDPOINTS = {'static', 'login', 'logout', 'index', 'event_stream'}
+
+_statements = 0
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global _statements
+    _statements += 1
+
+
+def clear_caches():
+    """Drop the in-process caches so every request starts cold"""
+    identity.clear()
+    people_search.invalidate()
+    school_calendar.invalidate()
+    school_stats.invalidate()
+    timetable.invalidate()
+    timetable.invalidate_homework()
+
+
+def sample_users():
+    """One user per role, picked so that their pages have data to show"""
+    users = {'director': User.query.filter_by(role='director').order_by(User.id).first()}
+    users['teacher'] = User.query.filter(
+        User.role == 'teacher', User.id.in_(db.session.query(Class.teacher_id))
+    ).order_by(User.id).first()
+    users['student'] = User.query.filter(User.role == 'student', User.class_id.isnot(None)).order_by(User.id).first()
+    users['parent'] = User.query.filter(
+        User.role == 'parent', User.id.in_(db.session.query(User.parent_id).filter(User.parent_id.isnot(None)))
+    ).order_by(User.id).first()
+    return users
+
+
+def url_arguments(users):
+    """Values for the URL parameters of the GET routes, per role"""
+    student = users['student']
+    child = User.query.filter_by(parent_id=users['parent'].id).order_by(User.id).first() if users['parent'] else None
+    common = {'user_id': student.id if student else None, 'class_id': student.class_id if student else None}
+    return {role: dict(common, child_id=child.id if child else None) for role in ROLES}
+
+
+def get_routes(selected=None):
+    routes = []
+    for rule in app.url_map.iter_rules():
+        if 'GET' not in rule.methods or rule.endpoint in SKIP_ENDPOINTS:
+            continue
+        if selected and not any(name in rule.endpoint for name in selected):
+            continue
+        routes.append(rule)
+    return sorted(routes, key=lambda rule: rule.rule)
+
+
+def fetch(client, url):
+    """GET a URL and read the whole body, as a browser would for streamed responses"""
+    response = client.get(url)
+    response.get_data()
+    response.close()
+    return response
+
+
+def percentile(cuts, p):
+    return round(cuts[p - 1] * 1000, 2)
+
+
+def run(args):
+    global _statements
+    with app.app_context():
+        users = sample_users()
+        arguments = url_arguments(users)
+        logins = {role: user.username for role, user in users.items() if user is not None}
+
+    results = {}
+    for role in ROLES:
+        if role not in logins:
+            print("! no %s in the database, skipping" % role)
+            continue
+        client = app.test_client()
+        response = client.post('/login', data={'username': logins[role], 'password': args.password})
+        if response.status_code != 302 or '/login' in response.headers.get('Location', ''):
+            print("! could not log in as %s (%s); check --password" % (role, logins[role]))
+            continue
+
+        for rule in get_routes(args.only):
+            values = {name: arguments[role].get(name) for name in rule.arguments}
+            if any(value is None for value in values.values()):
+                continue
+            with app.test_request_context():
+                url = url_for(rule.endpoint, **values)
+
+            # Warm-up request; routes the role may not open redirect or refuse
+            response = fetch(client, url)
+            if response.status_code != 200:
+                continue
+
+            timings = []
+            statements = []
+            for _ in range(args.iterations):
+                if args.cold:
+                    clear_caches()
+                before = _statements
+                started = time.perf_counter()
+                fetch(client, url)
+                timings.append(time.perf_counter() - started)
+                statements.append(_statements - before)
+
+            if args.cold:
+                clear_caches()
+            tracemalloc.start()
+            fetch(client, url)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            cuts = statistics.quantiles(timings, n=100, method='inclusive') if len(timings) > 1 else timings * 99
+            key = '%s %s' % (role, rule.rule)
+            results[key] = {
+                'endpoint': rule.endpoint,
+                'url': url,
+                'p50_ms': percentile(cuts, 50),
+                'p95_ms': percentile(cuts, 95),
+                'p99_ms': percentile(cuts, 99),
+                'sql': max(statements),
+                'peak_kb': round(peak / 1024, 1),
+            }
+            print("%-48s %8.2f %8.2f %8.2f %5d %9.1f" % (
+                key[:48], results[key]['p50_ms'], results[key]['p95_ms'], results[key]['p99_ms'],
+                results[key]['sql'], results[key]['peak_kb']))
+    return results
+
+
+def compare(results, baseline, tolerance, partial=False):
+    """Print the differences to a baseline; returns the number of regressions"""
+    regressions = 0
+    print("\n%-48s %10s %10s %8s %8s" % ('route', 'p95 base', 'p95 now', 'sql', 'change'))
+    for key, now in results.items():
+        before = baseline.get(key)
+        if before is None:
+            print("%-48s %10s %10.2f %8d %8s" % (key[:48], '-', now['p95_ms'], now['sql'], 'new'))
+            continue
+        slower = now['p95_ms'] > before['p95_ms'] * (1 + tolerance) and now['p95_ms'] - before['p95_ms'] > 1
+        more_sql = now['sql'] > before['sql']
+        change = '%+.0f%%' % ((now['p95_ms'] / before['p95_ms'] - 1) * 100) if before['p95_ms'] else '-'
+        flag = '  <- REGRESSION' if slower or more_sql else ''
+        regressions += bool(flag)
+        print("%-48s %10.2f %10.2f %+8d %8s%s" % (
+            key[:48], before['p95_ms'], now['p95_ms'], now['sql'] - before['sql'], change, flag))
+    for key in baseline:
+        if key not in results and not partial:
+            print("%-48s %10.2f %10s %8s %8s" % (key[:48], baseline[key]['p95_ms'], '-', '-', 'gone'))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--password', default='password123', help='password of the sampled users (seed_data.py default)')
+    parser.add_argument('--iterations', type=int, default=20, help='timed requests per route and role')
+    parser.add_argument('--only', action='append', metavar='TEXT', help='only endpoints containing TEXT (repeatable)')
+    parser.add_argument('--cold', action='store_true', help='clear in-process caches before every request')
+    parser.add_argument('--save', metavar='FILE', help='write the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown before flagging (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    print("%-48s %8s %8s %8s %5s %9s" % ('role route', 'p50 ms', 'p95 ms', 'p99 ms', 'sql', 'peak KiB'))
+    results = run(args)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as output:
+            json.dump({
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'database': app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0],
+                'iterations': args.iterations,
+                'cold': args.cold,
+                'results': results,
+            }, output, indent=2, ensure_ascii=False)
+        print("\n✓ Baseline saved to %s" % args.save)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline['results'], args.tolerance, partial=bool(args.only))
+        print("\n%d regression(s)" % regressions)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
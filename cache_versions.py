@@ -0,0 +1,80 @@
+import threading
+import time
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, CacheVersion
+
+# Cross-process cache invalidation
+#
+# The caches of this app live in one process each. A write that changes
+# what a cache holds calls bump() with the cache's name: the cache is
+# cleared in the writing process right away and the name's counter in the
+# cache_versions table goes up by one. Every web worker compares the stored
+# counters with the ones it last saw before handling a request, at most
+# every CHECK_SECONDS, and clears the caches whose counter moved. A command
+# line run (the timetable solver, the year-end rollover) or another worker
+# is therefore seen everywhere within CHECK_SECONDS rather than when the
+# cache's own TTL runs out.
+#
+# The check is one small SELECT per process every few seconds and is not
+# counted against the route's query budget.
+
+CHECK_SECONDS = 5
+
+_invalidators = {}
+_seen = None
+_checked_at = float('-inf')
+_lock = threading.Lock()
+
+
+def register(name, invalidate):
+    """Call ``invalidate`` whenever the cache ``name`` is bumped in any process"""
+    _invalidators[name] = invalidate
+
+
+def bump(*names):
+    """Clear the named caches here and tell the other processes to (commits)"""
+    for name in names:
+        if name in _invalidators:
+            _invalidators[name]()
+    result = db.session.execute(
+        update(CacheVersion).where(CacheVersion.name.in_(names)).values(version=CacheVersion.version + 1)
+    )
+    if result.rowcount < len(names):
+        known = set(db.session.scalars(select(CacheVersion.name).where(CacheVersion.name.in_(names))))
+        missing = [{'name': name, 'version': 1} for name in names if name not in known]
+        if missing:
+            db.session.execute(insert(CacheVersion), missing)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another process added the same rows first; its bump is as good as ours
+        db.session.rollback()
+
+
+def sync():
+    """Clear the caches bumped by other processes since the last check"""
+    global _seen, _checked_at
+    if time.monotonic() - _checked_at < CHECK_SECONDS:
+        return
+    with _lock:
+        if time.monotonic() - _checked_at < CHECK_SECONDS:
+            return
+        versions = dict(db.session.execute(
+            select(CacheVersion.name, CacheVersion.version).execution_options(query_budget=False)
+        ).all())
+        if _seen is not None:
+            for name, version in versions.items():
+                if _seen.get(name) != version and name in _invalidators:
+                    _invalidators[name]()
+        _seen = versions
+        _checked_at = time.monotonic()
+
+
+def init_cache_versions(app):
+    """Check the shared counters before each request"""
+    @app.before_request
+    def sync_cache_versions():
+        sync()
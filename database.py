@@ -0,0 +1,89 @@
+import os
+import sqlite3
+
+from sqlalchemy import event
+
+# Database engine profile
+#
+# The database URI comes from DATABASE_URL (default: SQLite edms.db in the
+# instance folder), so the same models run on PostgreSQL or MySQL in
+# production. Pool sizing is explicit and tunable from the environment so a
+# multi-threaded WSGI server never waits on a too-small pool.
+#
+# SQLite connections are tuned on connect: WAL journaling lets readers
+# proceed while a teacher's attendance or grade write is in flight,
+# busy_timeout makes concurrent writers queue instead of failing with
+# "database is locked", synchronous=NORMAL is safe under WAL and avoids an
+# fsync per commit, and cache_size enlarges the page cache. Set
+# SQLITE_PRAGMAS=0 to open connections with SQLite's defaults.
+
+DEFAULT_DATABASE_URI = 'sqlite:///edms.db'
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def database_uri():
+    """Database URI from DATABASE_URL, accepting the legacy postgres:// scheme"""
+    uri = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URI)
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def engine_options(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for a database URI"""
+    if uri.startswith('sqlite'):
+        if uri in ('sqlite://', 'sqlite:///:memory:'):
+            # In-memory databases live on one connection; keep Flask-SQLAlchemy's defaults
+            return {}
+        return {
+            'pool_size': _env_int('DB_POOL_SIZE', 10),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+            # Threads of the WSGI server share the pool
+            'connect_args': {'check_same_thread': False},
+        }
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', 10),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+
+
+def sqlite_pragmas():
+    """PRAGMA statements run on every new SQLite connection"""
+    if os.environ.get('SQLITE_PRAGMAS', '1') == '0':
+        return []
+    return [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA busy_timeout=%d' % _env_int('SQLITE_BUSY_TIMEOUT_MS', 15000),
+        'PRAGMA synchronous=NORMAL',
+        # Negative cache_size is in KiB
+        'PRAGMA cache_size=-%d' % _env_int('SQLITE_CACHE_SIZE_KB', 65536),
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def init_engine_profile(app, db):
+    """Attach the connection hooks to the app's engine (call after db.init_app)"""
+    pragmas = sqlite_pragmas()
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _tune_sqlite(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
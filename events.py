@@ -0,0 +1,134 @@
+import json
+import queue
+import threading
+from collections import defaultdict
+
+# Push events
+#
+# Pages subscribe to a per-user Server-Sent Events stream instead of polling.
+# Routes publish small events (a new notification, a changed unread count, a
+# changed timetable) on named channels: 'user:<id>', 'class:<id>',
+# 'teacher:<id>' and 'students'. A stream listens on every channel that
+# concerns its user.
+#
+# EventBroker is an in-process fan-out: each open stream owns a bounded
+# queue and publish() drops events for subscribers that stopped reading.
+# It only reaches streams served by the same process; with several worker
+# processes replace it with a broker exposing the same publish/subscribe/
+# unsubscribe calls (e.g. Redis pub/sub).
+#
+# A stream spends its life blocked in queue.get(), so it is only served by
+# a cooperative worker (gunicorn -k gevent) where an idle connection costs a
+# greenlet rather than a whole worker thread. Under a sync or threaded
+# server every open page would hold a worker, so pages poll the unread
+# count every POLL_SECONDS instead (LIVE_EVENTS=auto detects gevent; set
+# LIVE_EVENTS=stream or poll to choose).
+
+HEARTBEAT_SECONDS = 20
+RETRY_MILLISECONDS = 5000
+POLL_SECONDS = 60
+
+
+class EventBroker:
+    """In-process publish/subscribe with one bounded queue per subscriber"""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            for channel in channels:
+                self._channels[channel].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channels, subscriber):
+        with self._lock:
+            for channel in channels:
+                listeners = self._channels.get(channel)
+                if listeners is not None:
+                    listeners.discard(subscriber)
+                    if not listeners:
+                        del self._channels[channel]
+
+    def publish(self, channel, event, data=None):
+        with self._lock:
+            listeners = list(self._channels.get(channel, ()))
+        for subscriber in listeners:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                # Slow or stalled client; it resyncs on reconnect
+                pass
+        return len(listeners)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(set().union(*self._channels.values())) if self._channels else 0
+
+
+broker = EventBroker()
+
+
+def publish(channel, event, data=None):
+    return broker.publish(channel, event, data)
+
+
+def streaming_enabled(mode='auto'):
+    """Whether pages should open an event stream rather than poll ('auto', 'stream' or 'poll')"""
+    if mode != 'auto':
+        return mode == 'stream'
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    # gunicorn's gevent worker patches the standard library before loading the app
+    return monkey.is_module_patched('socket')
+
+
+def channels_for(user):
+    """Channels a user's stream listens on"""
+    channels = ['user:%d' % user.id]
+    if user.role == 'student':
+        channels.append('students')
+        if user.class_id:
+            channels.append('class:%d' % user.class_id)
+    elif user.role == 'teacher':
+        channels.append('teacher:%d' % user.id)
+    return channels
+
+
+def notification_channel(audience, class_id=None, receiver_id=None):
+    """Channel reaching the recipients of a notification"""
+    if audience == 'class':
+        return 'class:%d' % class_id
+    if audience == 'individual':
+        return 'user:%d' % receiver_id
+    return 'students'
+
+
+def format_event(event, data):
+    return 'event: %s\ndata: %s\n\n' % (event, json.dumps(data, ensure_ascii=False))
+
+
+def stream(channels, heartbeat=HEARTBEAT_SECONDS):
+    """Generator of Server-Sent Events for the given channels.
+
+    Holds no request context or database connection while waiting; a comment
+    line is sent every ``heartbeat`` seconds so proxies keep the connection
+    open and dead clients are noticed.
+    """
+    subscriber = broker.subscribe(channels)
+    try:
+        yield 'retry: %d\n\n' % RETRY_MILLISECONDS
+        while True:
+            try:
+                event, data = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            yield format_event(event, data)
+    finally:
+        broker.unsubscribe(channels, subscriber)
@@ -0,0 +1,120 @@
+import csv
+import io
+import tempfile
+
+from sqlalchemy import select
+
+import archive
+from models import db, User, Class, Subject, Grade, Attendance
+
+# Gradebook and attendance exports
+#
+# Rows are read with yield_per, which streams them from a server-side cursor
+# in fixed-size batches, and are turned into the response body chunk by
+# chunk. Memory stays flat whether an export covers a week of one class or
+# years of the whole school. CSV is written straight into the response;
+# XLSX (needs the optional openpyxl package) is written in write-only mode
+# to a spooled temporary file and then sent in chunks. Ranges that reach into
+# archived academic years read the archive tables too (archive.source).
+
+YIELD_PER = 1000
+CHUNK_ROWS = 500
+CHUNK_BYTES = 64 * 1024
+
+GRADE_HEADER = ('Sene', 'Okuwçy', 'Synp', 'Ders', 'Baha', 'Bellik')
+ATTENDANCE_HEADER = ('Sene', 'Okuwçy', 'Synp', 'Ýagdaý')
+
+
+def _in_range(column, start, end):
+    criteria = []
+    if start is not None:
+        criteria.append(column >= start)
+    if end is not None:
+        criteria.append(column <= end)
+    return criteria
+
+
+def _stream(stmt):
+    result = db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+    try:
+        for row in result:
+            yield tuple(row)
+    finally:
+        result.close()
+
+
+def grade_rows(class_ids=None, subject_ids=None, start=None, end=None):
+    """Header and rows of the grades matching the filters, oldest first"""
+    grades = archive.source(Grade, start, end).c
+    stmt = (
+        select(grades.date, User.full_name, Class.name, Subject.name, grades.grade, grades.comment)
+        # Outer joins: archived grades outlive the students and subjects they name
+        .outerjoin(User, User.id == grades.student_id)
+        .outerjoin(Subject, Subject.id == grades.subject_id)
+        .outerjoin(Class, Class.id == Subject.class_id)
+        .where(*_in_range(grades.date, start, end))
+        .order_by(grades.date, grades.id)
+    )
+    if class_ids is not None:
+        stmt = stmt.where(Subject.class_id.in_(class_ids))
+    if subject_ids is not None:
+        stmt = stmt.where(grades.subject_id.in_(subject_ids))
+    yield GRADE_HEADER
+    yield from _stream(stmt)
+
+
+def attendance_rows(class_ids=None, start=None, end=None):
+    """Header and rows of the attendance marks matching the filters, oldest first"""
+    marks = archive.source(Attendance, start, end).c
+    stmt = (
+        select(marks.date, User.full_name, Class.name, marks.status)
+        .outerjoin(User, User.id == marks.student_id)
+        .outerjoin(Class, Class.id == User.class_id)
+        .where(*_in_range(marks.date, start, end))
+        .order_by(marks.date, Class.name, User.full_name)
+    )
+    if class_ids is not None:
+        stmt = stmt.where(User.class_id.in_(class_ids))
+    yield ATTENDANCE_HEADER
+    yield from _stream(stmt)
+
+
+def csv_chunks(rows):
+    """Encode rows as CSV, yielding one string per CHUNK_ROWS rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so spreadsheet programs pick UTF-8 for the Turkmen letters
+    buffer.write('\ufeff')
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if n % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def xlsx_available():
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def xlsx_chunks(rows, title):
+    """Write rows to a write-only workbook and yield the file in chunks"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title)
+    for row in rows:
+        sheet.append(row)
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,54 @@
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from app import app, db
+from models import Class
+from report_cards import generate
+from archive import year_bounds
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate printable report cards')
+    parser.add_argument('--out', default='report_cards', help='output directory (default: report_cards)')
+    parser.add_argument('--class', dest='classes', action='append', metavar='NAME',
+                        help='class name; repeat for several (default: whole school)')
+    parser.add_argument('--format', choices=('html', 'pdf'), default='html', help='pdf needs weasyprint')
+    parser.add_argument('--start', type=parse_date, help='first day of the period (YYYY-MM-DD)')
+    parser.add_argument('--end', type=parse_date, help='last day of the period (YYYY-MM-DD)')
+    parser.add_argument('--year', type=int, metavar='YYYY',
+                        help='whole academic year, e.g. 2024 for 2024/2025 (archived years included)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='rewrite cards that already exist')
+    args = parser.parse_args()
+    if args.year is not None:
+        if args.start or args.end:
+            parser.error('--year cannot be combined with --start/--end')
+        args.start, next_start = year_bounds(args.year)
+        args.end = next_start - timedelta(days=1)
+
+    def progress(done, total, path):
+        print("[%d/%d] %s" % (done, total, path))
+
+    with app.app_context():
+        class_ids = None
+        if args.classes:
+            found = dict(db.session.query(Class.name, Class.id).filter(Class.name.in_(args.classes)).all())
+            missing = [name for name in args.classes if name not in found]
+            if missing:
+                print("Unknown class: %s" % ', '.join(missing))
+                return 1
+            class_ids = [found[name] for name in args.classes]
+        written, skipped = generate(
+            args.out, class_ids=class_ids, fmt=args.format, start=args.start, end=args.end,
+            workers=args.workers, force=args.force, progress=progress
+        )
+    print("\n✓ %d report card(s) written, %d already present" % (written, skipped))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import argparse
+import sys
+from collections import Counter
+
+from app import app, db
+from models import User, Subject, Class
+import timetable_solver
+
+
+def parse_slot(value):
+    day, _, lesson = value.partition(':')
+    day = day.capitalize()
+    if day not in timetable_solver.WEEKDAYS or not lesson.isdigit():
+        raise argparse.ArgumentTypeError('expected Day:lesson, e.g. Monday:3')
+    return day, int(lesson)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a conflict-free timetable for the whole school')
+    parser.add_argument('--lessons-per-day', type=int, default=timetable_solver.LESSONS_PER_DAY)
+    parser.add_argument('--days', type=int, default=len(timetable_solver.WEEKDAYS), choices=range(1, 7),
+                        metavar='N', help='school days per week, from Monday (default: 6)')
+    parser.add_argument('--attempts', type=int, default=timetable_solver.ATTEMPTS, help='seeds to search')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--teacher', metavar='USERNAME',
+                        help='only re-place this teacher\'s lessons, keeping the rest of the timetable')
+    parser.add_argument('--unavailable', type=parse_slot, nargs='*', metavar='DAY:LESSON',
+                        help='with --teacher: replace the slots the teacher cannot teach in (none to clear)')
+    parser.add_argument('--dry-run', action='store_true', help='solve and report without writing')
+    args = parser.parse_args()
+
+    days = timetable_solver.WEEKDAYS[:args.days]
+    options = dict(days=days, lessons_per_day=args.lessons_per_day, attempts=args.attempts,
+                   workers=args.workers, seed=args.seed, dry_run=args.dry_run)
+    with app.app_context():
+        if args.teacher:
+            teacher = User.query.filter_by(username=args.teacher, role='teacher').first()
+            if teacher is None:
+                print("Unknown teacher: %s" % args.teacher)
+                return 1
+            if args.unavailable is not None:
+                timetable_solver.set_unavailable(teacher.id, args.unavailable)
+                print("✓ %s is unavailable in %d slot(s)" % (teacher.full_name, len(set(args.unavailable))))
+            report = timetable_solver.resolve_teacher(teacher.id, **options)
+        elif args.unavailable is not None:
+            parser.error('--unavailable needs --teacher')
+        else:
+            report = timetable_solver.generate(**options)
+
+        print("✓ %d lesson(s) placed (seed %d, score %d)" % (report['lessons'], report['seed'], report['penalty']))
+        if report['unplaced']:
+            missing = Counter((subject_id, class_id) for subject_id, class_id, _ in report['unplaced'])
+            names = dict(db.session.query(Subject.id, Subject.name).filter(Subject.id.in_([s for s, _ in missing])))
+            classes = dict(db.session.query(Class.id, Class.name))
+            print("\n%d lesson(s) did not fit:" % len(report['unplaced']))
+            for (subject_id, class_id), count in sorted(missing.items()):
+                print("  %-8s %-24s %d" % (classes.get(class_id), names.get(subject_id), count))
+        if args.dry_run:
+            print("\nDry run: the timetable was not changed")
+        else:
+            print("✓ %d timetable row(s) written" % report['written'])
+    return 1 if report['unplaced'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
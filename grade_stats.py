@@ -0,0 +1,117 @@
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from models import db, Grade, Subject, StudentGradeStat, ClassGradeStat
+
+# Grade rollups
+#
+# student_grade_stats and class_grade_stats hold count, sum, min and max of
+# the grades per (student, subject) and per (class, subject). They are
+# updated in the same transaction as every grade insert, so the grade pages
+# read a handful of precomputed rows instead of every Grade. If they ever
+# drift (manual edits, restored backups) rebuild_grade_stats() recomputes
+# them from the grades table.
+
+
+def _fold(model, key, value):
+    """Fold one grade into a rollup row, creating the row on first use.
+
+    One upsert on the row's primary key, so two first grades for the same
+    key in concurrent requests both land instead of one failing on INSERT.
+    """
+    row = dict(key, count=1, total=value, min_grade=value, max_grade=value)
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(model).values(row)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[getattr(model, name) for name in key],
+            set_=_folded(model, stmt.excluded)
+        ))
+        return
+    if dialect in ('mysql', 'mariadb'):
+        stmt = mysql.insert(model).values(row)
+        db.session.execute(stmt.on_duplicate_key_update(**_folded(model, stmt.inserted)))
+        return
+    # No native upsert
+    updated = model.query.filter_by(**key).update({
+        model.count: model.count + 1,
+        model.total: model.total + value,
+        model.min_grade: case((model.min_grade > value, value), else_=model.min_grade),
+        model.max_grade: case((model.max_grade < value, value), else_=model.max_grade),
+    }, synchronize_session=False)
+    if not updated:
+        db.session.add(model(**row))
+
+
+def _folded(model, new):
+    """Column updates that fold the ``new`` row into the stored one"""
+    return {
+        'count': model.count + new.count,
+        'total': model.total + new.total,
+        'min_grade': case((model.min_grade > new.min_grade, new.min_grade), else_=model.min_grade),
+        'max_grade': case((model.max_grade < new.max_grade, new.max_grade), else_=model.max_grade),
+    }
+
+
+def record_grade(grade):
+    """Insert a grade and update its rollups in one transaction"""
+    db.session.add(grade)
+    _fold(StudentGradeStat, {'student_id': grade.student_id, 'subject_id': grade.subject_id}, grade.grade)
+    class_id = db.session.query(Subject.class_id).filter(Subject.id == grade.subject_id).scalar()
+    if class_id is not None:
+        _fold(ClassGradeStat, {'class_id': class_id, 'subject_id': grade.subject_id}, grade.grade)
+    db.session.commit()
+
+
+def forget_subjects(subject_ids):
+    """Drop the rollups of subjects that are being deleted (caller commits)"""
+    for model in (StudentGradeStat, ClassGradeStat):
+        model.query.filter(model.subject_id.in_(subject_ids)).delete(synchronize_session=False)
+
+
+def rebuild_grade_stats():
+    """Recompute every rollup from the grades table"""
+    recompute_grade_stats()
+    db.session.commit()
+
+
+def recompute_grade_stats():
+    """Recompute every rollup from the grades table (caller commits)"""
+    StudentGradeStat.query.delete(synchronize_session=False)
+    ClassGradeStat.query.delete(synchronize_session=False)
+    aggregates = (func.count(Grade.id), func.sum(Grade.grade), func.min(Grade.grade), func.max(Grade.grade))
+    columns = ['count', 'total', 'min_grade', 'max_grade']
+    db.session.execute(insert(StudentGradeStat).from_select(
+        ['student_id', 'subject_id'] + columns,
+        select(Grade.student_id, Grade.subject_id, *aggregates).group_by(Grade.student_id, Grade.subject_id)
+    ))
+    db.session.execute(insert(ClassGradeStat).from_select(
+        ['class_id', 'subject_id'] + columns,
+        select(Subject.class_id, Grade.subject_id, *aggregates)
+        .join(Subject, Subject.id == Grade.subject_id)
+        .group_by(Subject.class_id, Grade.subject_id)
+    ))
+
+
+def _summary(model, *criteria):
+    count, total, lowest, highest = db.session.query(
+        func.sum(model.count), func.sum(model.total), func.min(model.min_grade), func.max(model.max_grade)
+    ).filter(*criteria).one()
+    count = count or 0
+    return {
+        'count': count,
+        'average': round(total / count, 2) if count else None,
+        'min': lowest,
+        'max': highest,
+    }
+
+
+def student_summary(student_id):
+    """Grade count, average, min and max over all of a student's subjects"""
+    return _summary(StudentGradeStat, StudentGradeStat.student_id == student_id)
+
+
+def subjects_summary(subject_ids):
+    """Grade count, average, min and max over a set of subjects"""
+    return _summary(ClassGradeStat, ClassGradeStat.subject_id.in_(subject_ids))
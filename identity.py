@@ -0,0 +1,70 @@
+from flask_login import UserMixin
+
+import cache_versions
+from cache import TTLCache
+from models import db, User
+
+# Session identity cache
+#
+# Flask-Login calls load_user on every authenticated request, including the
+# dashboard polls. Instead of loading the full User row each time, the
+# columns the routes read from current_user are cached per user id and
+# wrapped in a lightweight SessionUser, so a request that touches no other
+# table makes no database round-trip for identity. Entries are dropped
+# explicitly when a user is edited or deleted (forget), and in every process
+# when a change touches many users at once (cache_versions.bump('identity')
+# after a class deletion or the rollover). Another worker keeps its entry
+# for an edited user until IDENTITY_TTL runs out, so the TTL is kept short:
+# a demoted or deleted account loses its old identity everywhere within
+# that time.
+#
+# The unread counter changes with every notification and is not part of the
+# identity; the sidebar badge reads it on its own (notifications.py).
+
+IDENTITY_FIELDS = ('id', 'role', 'class_id', 'parent_id', 'full_name', 'created_at')
+IDENTITY_TTL = 30
+
+_identity_cache = TTLCache(maxsize=4096, ttl=IDENTITY_TTL)
+
+
+class SessionUser(UserMixin):
+    """Read-only stand-in for the logged-in User carrying only IDENTITY_FIELDS"""
+
+    __slots__ = IDENTITY_FIELDS
+
+    def __init__(self, fields):
+        for name, value in zip(IDENTITY_FIELDS, fields):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return '<SessionUser %s %s>' % (self.id, self.role)
+
+
+def load(user_id):
+    """SessionUser for an id, from the cache or a single narrow query"""
+    fields = _identity_cache.get(user_id)
+    if fields is None:
+        row = db.session.query(*(getattr(User, name) for name in IDENTITY_FIELDS)).filter(
+            User.id == user_id
+        ).first()
+        if row is None:
+            return None
+        fields = tuple(row)
+        _identity_cache.set(user_id, fields)
+    return SessionUser(fields)
+
+
+def remember(user):
+    """Prime the cache from a User row that is already loaded (e.g. at login)"""
+    _identity_cache.set(user.id, tuple(getattr(user, name) for name in IDENTITY_FIELDS))
+
+
+def forget(user_id):
+    _identity_cache.delete(user_id)
+
+
+def clear():
+    _identity_cache.clear()
+
+
+cache_versions.register('identity', clear)
@@ -0,0 +1,38 @@
+import argparse
+import sys
+
+from app import app
+from roster_import import COLUMNS, import_roster
+
+
+def print_report(report):
+    print("Rows read: %d" % report['rows'])
+    for role, count in report['created'].items():
+        if count:
+            print("  %-9s %d" % (role, count))
+    print("Parent links: %d" % report['parent_links'])
+    if report['errors']:
+        print("\n%d problem(s), nothing imported:" % len(report['errors']))
+        for line, message in report['errors']:
+            print("  line %d: %s" % (line, message))
+    elif report['dry_run']:
+        print("\nDry run: roster is valid, nothing written")
+    elif report['imported']:
+        print("\n✓ Users imported")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import users from a CSV roster')
+    parser.add_argument('csv_file', help='CSV with columns: %s' % ', '.join(COLUMNS))
+    parser.add_argument('--dry-run', action='store_true', help='validate and report without writing')
+    parser.add_argument('--workers', type=int, default=None, help='password hashing processes (default: all cores)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        with open(args.csv_file, newline='', encoding='utf-8-sig') as roster:
+            report = import_roster(roster, dry_run=args.dry_run, workers=args.workers, processes=True)
+    print_report(report)
+    return 1 if report['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,18 @@
+from flask_migrate import upgrade
+
 from app import app, db
 from models import User
+from notifications import rebuild_unread_counts
+from grade_stats import rebuild_grade_stats
+from attendance import rebuild_attendance_stats
 from werkzeug.security import generate_password_hash
 
 def init_database():
     """Initialize the database and create default users"""
     with app.app_context():
-        # Create all tables
-        db.create_all()
-        print("Database tables created successfully!")
+        # Create the tables, or bring an existing database up to date
+        upgrade()
+        print("Database schema is up to date!")
         
         # Create default director if not exists
         if not User.query.filter_by(username='director').first():
@@ -25,6 +30,12 @@ def init_database():
         else:
             print("✓ Director already exists")
         
+        # Rebuild derived counters and rollups from the source tables
+        rebuild_unread_counts()
+        rebuild_grade_stats()
+        rebuild_attendance_stats()
+        print("✓ Notification counters, grade and attendance statistics rebuilt")
+        
         print("\nDatabase initialization completed!")
         print("You can now run: python app.py")
 
@@ -0,0 +1,31 @@
+"""graduations recorded at year-end rollover
+
+Revision ID: 01e9f8d05384
+Revises: 8107443345ca
+Create Date: 2026-10-18 09:19:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '01e9f8d05384'
+down_revision = '8107443345ca'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('graduations',
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('first_year', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('class_name', sa.String(length=50), nullable=False),
+    sa.Column('graduated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['student_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('student_id', 'first_year')
+    )
+
+
+def downgrade():
+    op.drop_table('graduations')
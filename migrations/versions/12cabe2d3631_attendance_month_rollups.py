@@ -0,0 +1,51 @@
+"""attendance month rollups
+
+Revision ID: 12cabe2d3631
+Revises: f78c3c1bb8af
+Create Date: 2026-10-18 09:15:00.000000
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '12cabe2d3631'
+down_revision = 'f78c3c1bb8af'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    stats = op.create_table('attendance_month_stats',
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['student_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('student_id', 'month', 'status')
+    )
+
+    # Start the rollups from the marks already stored, a month at a time
+    # (as attendance.rebuild_attendance_stats), without dialect date functions
+    attendance = sa.table('attendance', sa.column('id', sa.Integer), sa.column('student_id', sa.Integer),
+                          sa.column('date', sa.Date), sa.column('status', sa.String))
+    bind = op.get_bind()
+    first, last = bind.execute(sa.select(sa.func.min(attendance.c.date), sa.func.max(attendance.c.date))).one()
+    month = date(first.year, first.month, 1) if first else None
+    while month and month <= last:
+        following = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        bind.execute(sa.insert(stats).from_select(
+            ['student_id', 'month', 'status', 'count'],
+            sa.select(attendance.c.student_id, sa.literal(month, sa.Date), attendance.c.status,
+                      sa.func.count(attendance.c.id))
+            .where(attendance.c.date >= month, attendance.c.date < following)
+            .group_by(attendance.c.student_id, attendance.c.status)
+        ))
+        month = following
+
+
+def downgrade():
+    op.drop_table('attendance_month_stats')
@@ -0,0 +1,35 @@
+"""weekly hours and teacher unavailability for the timetable generator
+
+Revision ID: 3fb5f45a212c
+Revises: af79b01c4318
+Create Date: 2026-10-18 09:17:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3fb5f45a212c'
+down_revision = 'af79b01c4318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('subjects', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('weekly_hours', sa.Integer(), server_default='2', nullable=False))
+
+    op.create_table('teacher_unavailability',
+    sa.Column('teacher_id', sa.Integer(), nullable=False),
+    sa.Column('day_of_week', sa.String(length=20), nullable=False),
+    sa.Column('lesson_number', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['teacher_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('teacher_id', 'day_of_week', 'lesson_number')
+    )
+
+
+def downgrade():
+    op.drop_table('teacher_unavailability')
+    with op.batch_alter_table('subjects', schema=None) as batch_op:
+        batch_op.drop_column('weekly_hours')
@@ -0,0 +1,68 @@
+"""broadcast notifications with per-reader receipts
+
+Revision ID: 5847ccf5824b
+Revises: 91de49d03423
+Create Date: 2026-10-18 09:12:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5847ccf5824b'
+down_revision = '91de49d03423'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_reads',
+    sa.Column('notification_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('read_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['notification_id'], ['notifications.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('notification_id', 'user_id')
+    )
+    # Read state moves to the receipts before is_read is dropped
+    op.execute(
+        "INSERT INTO notification_reads (notification_id, user_id, read_at) "
+        "SELECT id, receiver_id, created_at FROM notifications WHERE is_read = true"
+    )
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        # Every existing notification was addressed to one student
+        batch_op.add_column(sa.Column('audience', sa.String(length=20), server_default='individual', nullable=False))
+        batch_op.add_column(sa.Column('class_id', sa.Integer(), nullable=True))
+        batch_op.alter_column('receiver_id',
+               existing_type=sa.Integer(),
+               nullable=True)
+        batch_op.create_index('ix_notifications_audience_class', ['audience', 'class_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_notifications_receiver_id'), ['receiver_id'], unique=False)
+        batch_op.create_foreign_key('fk_notifications_class_id', 'classes', ['class_id'], ['id'])
+        batch_op.drop_column('is_read')
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_read', sa.Boolean(), server_default=sa.false(), nullable=True))
+    op.execute(
+        "UPDATE notifications SET is_read = true WHERE EXISTS ("
+        "SELECT 1 FROM notification_reads WHERE notification_reads.notification_id = notifications.id "
+        "AND notification_reads.user_id = notifications.receiver_id)"
+    )
+    op.drop_table('notification_reads')
+
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_notifications_class_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_notifications_receiver_id'))
+        batch_op.drop_index('ix_notifications_audience_class')
+        batch_op.drop_column('class_id')
+        batch_op.drop_column('audience')
+
+    # Broadcasts have no single receiver to go back to
+    op.execute("DELETE FROM notifications WHERE receiver_id IS NULL")
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.alter_column('receiver_id',
+               existing_type=sa.Integer(),
+               nullable=False)
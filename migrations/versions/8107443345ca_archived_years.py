@@ -0,0 +1,32 @@
+"""archived academic years
+
+Revision ID: 8107443345ca
+Revises: 3fb5f45a212c
+Create Date: 2026-10-18 09:18:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8107443345ca'
+down_revision = '3fb5f45a212c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The per-year tables (grades_2024, ...) are created by archive.py when a year is archived
+    op.create_table('archived_years',
+    sa.Column('first_year', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('grades', sa.Integer(), nullable=False),
+    sa.Column('attendance', sa.Integer(), nullable=False),
+    sa.Column('notifications', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('first_year')
+    )
+
+
+def downgrade():
+    op.drop_table('archived_years')
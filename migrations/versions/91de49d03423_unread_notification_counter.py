@@ -0,0 +1,34 @@
+"""unread notification counter
+
+Revision ID: 91de49d03423
+Revises: 7e84e674ae24
+Create Date: 2026-10-18 09:11:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '91de49d03423'
+down_revision = '7e84e674ae24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_notifications', sa.Integer(), server_default='0', nullable=False))
+
+    # Start the counters from the notifications already stored
+    op.execute(
+        "UPDATE users SET unread_notifications = ("
+        "SELECT COUNT(*) FROM notifications "
+        "WHERE notifications.receiver_id = users.id "
+        "AND (notifications.is_read IS NULL OR notifications.is_read = false))"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('unread_notifications')
@@ -0,0 +1,31 @@
+"""one attendance mark per student and day
+
+Revision ID: adf99a89935a
+Revises: 5847ccf5824b
+Create Date: 2026-10-18 09:13:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'adf99a89935a'
+down_revision = '5847ccf5824b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Repeated roll calls used to insert a row each time; the latest one counts
+    op.execute(
+        "DELETE FROM attendance WHERE id NOT IN ("
+        "SELECT id FROM (SELECT MAX(id) AS id FROM attendance GROUP BY student_id, date) AS latest)"
+    )
+    with op.batch_alter_table('attendance', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_attendance_student_date', ['student_id', 'date'])
+
+
+def downgrade():
+    with op.batch_alter_table('attendance', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_attendance_student_date', type_='unique')
@@ -0,0 +1,26 @@
+"""gradebook and inbox indexes for keyset pagination
+
+Revision ID: af79b01c4318
+Revises: 12cabe2d3631
+Create Date: 2026-10-18 09:16:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'af79b01c4318'
+down_revision = '12cabe2d3631'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_grades_subject_date', 'grades', ['subject_id', 'date', 'id'], unique=False)
+    op.create_index('ix_notifications_created', 'notifications', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_notifications_created', table_name='notifications')
+    op.drop_index('ix_grades_subject_date', table_name='grades')
@@ -0,0 +1,32 @@
+"""cache version counters shared across processes
+
+Revision ID: c4a9e2d7b513
+Revises: 01e9f8d05384
+Create Date: 2026-10-18 11:02:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a9e2d7b513'
+down_revision = '01e9f8d05384'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    cache_versions = op.create_table('cache_versions',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # One row per shared cache; bump() also adds a missing one, at two extra statements
+    op.bulk_insert(cache_versions, [{'name': name, 'version': 0} for name in (
+        'timetable', 'homework', 'school_stats', 'people_search', 'school_calendar', 'identity'
+    )])
+
+
+def downgrade():
+    op.drop_table('cache_versions')
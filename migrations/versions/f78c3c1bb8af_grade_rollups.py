@@ -0,0 +1,60 @@
+"""grade rollups per student and class
+
+Revision ID: f78c3c1bb8af
+Revises: adf99a89935a
+Create Date: 2026-10-18 09:14:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f78c3c1bb8af'
+down_revision = 'adf99a89935a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('student_grade_stats',
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('subject_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('min_grade', sa.Integer(), nullable=True),
+    sa.Column('max_grade', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['student_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+    sa.PrimaryKeyConstraint('student_id', 'subject_id')
+    )
+    op.create_table('class_grade_stats',
+    sa.Column('class_id', sa.Integer(), nullable=False),
+    sa.Column('subject_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('min_grade', sa.Integer(), nullable=True),
+    sa.Column('max_grade', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['class_id'], ['classes.id'], ),
+    sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+    sa.PrimaryKeyConstraint('class_id', 'subject_id')
+    )
+
+    # Start the rollups from the grades already stored (as grade_stats.recompute_grade_stats)
+    op.execute(
+        "INSERT INTO student_grade_stats (student_id, subject_id, count, total, min_grade, max_grade) "
+        "SELECT student_id, subject_id, COUNT(id), SUM(grade), MIN(grade), MAX(grade) "
+        "FROM grades GROUP BY student_id, subject_id"
+    )
+    op.execute(
+        "INSERT INTO class_grade_stats (class_id, subject_id, count, total, min_grade, max_grade) "
+        "SELECT subjects.class_id, grades.subject_id, COUNT(grades.id), SUM(grades.grade), "
+        "MIN(grades.grade), MAX(grades.grade) "
+        "FROM grades JOIN subjects ON subjects.id = grades.subject_id "
+        "GROUP BY subjects.class_id, grades.subject_id"
+    )
+
+
+def downgrade():
+    op.drop_table('class_grade_stats')
+    op.drop_table('student_grade_stats')
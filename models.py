@@ -15,6 +15,7 @@ class User(UserMixin, db.Model):
     role = db.Column(db.String(20), nullable=False)  # director, teacher, student, parent
     class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), nullable=True)
     parent_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # kept in step by notifications.py
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -51,6 +52,7 @@ class Subject(db.Model):
     name = db.Column(db.String(100), nullable=False)
     class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), nullable=False)
     teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    weekly_hours = db.Column(db.Integer, nullable=False, default=2, server_default='2')  # lessons per week, for timetable_solver.py
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -94,6 +96,9 @@ class Holiday(db.Model):
 
 class Attendance(db.Model):
     __tablename__ = 'attendance'
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'date', name='uq_attendance_student_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -105,8 +110,24 @@ class Attendance(db.Model):
         return f'<Attendance {self.student_id} - {self.date}>'
 
 
+class AttendanceMonthStat(db.Model):
+    # Per-student monthly status counts, maintained by attendance.py
+    __tablename__ = 'attendance_month_stats'
+    
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<AttendanceMonthStat {self.student_id} - {self.month} - {self.status}>'
+
+
 class Grade(db.Model):
     __tablename__ = 'grades'
+    __table_args__ = (
+        db.Index('ix_grades_subject_date', 'subject_id', 'date', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -120,6 +141,36 @@ class Grade(db.Model):
         return f'<Grade {self.grade}>'
 
 
+class StudentGradeStat(db.Model):
+    # Running grade totals per (student, subject), maintained by grade_stats.py
+    __tablename__ = 'student_grade_stats'
+    
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    min_grade = db.Column(db.Integer, nullable=True)
+    max_grade = db.Column(db.Integer, nullable=True)
+    
+    def __repr__(self):
+        return f'<StudentGradeStat {self.student_id} - {self.subject_id}>'
+
+
+class ClassGradeStat(db.Model):
+    # Running grade totals per (class, subject), maintained by grade_stats.py
+    __tablename__ = 'class_grade_stats'
+    
+    class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    min_grade = db.Column(db.Integer, nullable=True)
+    max_grade = db.Column(db.Integer, nullable=True)
+    
+    def __repr__(self):
+        return f'<ClassGradeStat {self.class_id} - {self.subject_id}>'
+
+
 class Message(db.Model):
     __tablename__ = 'messages'
     
@@ -155,20 +206,91 @@ class Schedule(db.Model):
         return f'<Schedule {self.day_of_week} - Lesson {self.lesson_number}>'
 
 
+class TeacherUnavailability(db.Model):
+    # Timetable slots in which a teacher cannot be given lessons
+    __tablename__ = 'teacher_unavailability'
+    
+    teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day_of_week = db.Column(db.String(20), primary_key=True)
+    lesson_number = db.Column(db.Integer, primary_key=True)
+    
+    def __repr__(self):
+        return f'<TeacherUnavailability {self.teacher_id} - {self.day_of_week} {self.lesson_number}>'
+
+
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_audience_class', 'audience', 'class_id'),
+        db.Index('ix_notifications_created', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    audience = db.Column(db.String(20), nullable=False, default='individual')  # individual, class, all_students
+    receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)  # audience == 'individual'
+    class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), nullable=True)  # audience == 'class'
     title = db.Column(db.String(200), nullable=False)
     message = db.Column(db.Text, nullable=False)
-    is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Read state of the requesting user, filled in by notifications.inbox()
+    is_read = db.query_expression(default_expr=db.false())
+    
     # Relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_notifications')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_notifications')
+    reads = db.relationship('NotificationRead', backref='notification', cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<Notification {self.title}>'
+
+
+class NotificationRead(db.Model):
+    # One row per (notification, user) that has been read
+    __tablename__ = 'notification_reads'
+    
+    notification_id = db.Column(db.Integer, db.ForeignKey('notifications.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    read_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<NotificationRead {self.notification_id} by {self.user_id}>'
+
+
+class ArchivedYear(db.Model):
+    # Academic years moved out of the live tables by archive.py
+    __tablename__ = 'archived_years'
+    
+    first_year = db.Column(db.Integer, primary_key=True)  # 2024 for 2024/2025
+    grades = db.Column(db.Integer, nullable=False, default=0)
+    attendance = db.Column(db.Integer, nullable=False, default=0)
+    notifications = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ArchivedYear {self.first_year}>'
+
+
+class Graduation(db.Model):
+    # Students who left their class at a year-end rollover (rollover.py)
+    __tablename__ = 'graduations'
+    
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    first_year = db.Column(db.Integer, primary_key=True)  # academic year finished, 2025 for 2025/2026
+    class_name = db.Column(db.String(50), nullable=False)
+    graduated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Graduation {self.student_id} - {self.class_name}>'
+
+
+class CacheVersion(db.Model):
+    # Change counter per in-process cache, shared by every process (cache_versions.py)
+    __tablename__ = 'cache_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
     
     def __repr__(self):
-        return f'<Notification {self.title}>'
\ No newline at end of file
+        return f'<CacheVersion {self.name} {self.version}>'
\ No newline at end of file
@@ -0,0 +1,166 @@
+from datetime import datetime
+
+from sqlalchemy import and_, or_, case, exists, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, with_expression
+
+import events
+from models import db, User, Notification, NotificationRead
+
+# Broadcast notifications
+#
+# A send stores a single notifications row addressed to one student, one
+# class or all students. Read state lives in notification_reads, one row per
+# (notification, reader), so storage grows with reads rather than with
+# school size. A student's inbox is a single query over the rows visible to
+# them; broadcasts only count from the moment the student's account existed.
+#
+# Unread counters
+#
+# users.unread_notifications is kept in step by every write below with one
+# set-based UPDATE, so the sidebar badge never has to touch the inbox: it
+# reads the counter column with one primary-key lookup. Class broadcasts
+# are counted for the class's students at send time but shown by the
+# student's current class, so whatever moves students between classes
+# recomputes their counters.
+#
+# Every change is also pushed to the recipients' event streams (events.py):
+# a 'notification' event on send, which open pages treat as one more unread,
+# and an 'unread' event carrying the new count when a student reads.
+
+
+def _visible_to(user_id, class_id, since):
+    """Condition selecting the notifications addressed to a student"""
+    broadcast = or_(
+        Notification.audience == 'all_students',
+        and_(Notification.audience == 'class', Notification.class_id == class_id)
+    )
+    return or_(
+        Notification.receiver_id == user_id,
+        and_(broadcast, Notification.created_at >= since)
+    )
+
+
+def _visible_to_user(user):
+    return _visible_to(user.id, user.class_id, user.created_at or datetime.min)
+
+
+def _read_by(user_id):
+    return exists().where(
+        NotificationRead.notification_id == Notification.id,
+        NotificationRead.user_id == user_id
+    ).correlate_except(NotificationRead)
+
+
+def send_notification(sender_id, title, message, audience, class_id=None, receiver_id=None):
+    """Store one notification row for the audience and bump the recipients' counters.
+
+    Returns the number of students reached.
+    """
+    recipients = User.query.filter(User.role == 'student')
+    if audience == 'class':
+        recipients = recipients.filter(User.class_id == class_id)
+    elif audience == 'individual':
+        recipients = recipients.filter(User.id == receiver_id)
+    reached = recipients.update(
+        {User.unread_notifications: User.unread_notifications + 1},
+        synchronize_session=False
+    )
+    notification = None
+    if reached:
+        notification = Notification(
+            sender_id=sender_id,
+            audience=audience,
+            class_id=class_id if audience == 'class' else None,
+            receiver_id=receiver_id if audience == 'individual' else None,
+            title=title,
+            message=message
+        )
+        db.session.add(notification)
+    db.session.commit()
+    if notification is not None:
+        events.publish(events.notification_channel(audience, class_id, receiver_id), 'notification', {
+            'id': notification.id,
+            'title': title,
+            'message': message,
+        })
+    return reached
+
+
+def inbox(user):
+    """Query for the notifications a student can see, newest first, with read state"""
+    return Notification.query.options(
+        joinedload(Notification.sender),
+        with_expression(Notification.is_read, _read_by(user.id))
+    ).filter(_visible_to_user(user)).order_by(Notification.created_at.desc())
+
+
+def mark_read(notification_id, user):
+    """Record that the user read a notification; returns True if it was unread"""
+    visible = Notification.query.filter(
+        Notification.id == notification_id, _visible_to_user(user)
+    ).with_entities(Notification.id).first()
+    if visible is None or db.session.get(NotificationRead, (notification_id, user.id)):
+        return False
+    db.session.add(NotificationRead(notification_id=notification_id, user_id=user.id))
+    User.query.filter_by(id=user.id).update(
+        {User.unread_notifications: case(
+            (User.unread_notifications > 0, User.unread_notifications - 1), else_=0
+        )},
+        synchronize_session=False
+    )
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request recorded the same read first
+        db.session.rollback()
+        return False
+    _publish_unread(user.id)
+    return True
+
+
+def mark_all_read(user):
+    """Mark every unread notification of the user as read in a single INSERT ... SELECT"""
+    unread = select(
+        Notification.id, literal(user.id), literal(datetime.utcnow())
+    ).where(_visible_to_user(user), ~_read_by(user.id))
+    result = db.session.execute(
+        insert(NotificationRead).from_select(['notification_id', 'user_id', 'read_at'], unread)
+    )
+    User.query.filter_by(id=user.id).update(
+        {User.unread_notifications: 0}, synchronize_session=False
+    )
+    db.session.commit()
+    events.publish('user:%d' % user.id, 'unread', {'count': 0})
+    return result.rowcount
+
+
+def _publish_unread(user_id):
+    events.publish('user:%d' % user_id, 'unread', {'count': _stored_unread(user_id)})
+
+
+def _stored_unread(user_id):
+    return db.session.query(User.unread_notifications).filter(User.id == user_id).scalar() or 0
+
+
+def unread_count(user):
+    """Unread notification count for the sidebar badge"""
+    return _stored_unread(user.id)
+
+
+def rebuild_unread_counts():
+    """Recompute every student's counter from notifications and read receipts"""
+    recompute_unread_counts()
+    db.session.commit()
+
+
+def recompute_unread_counts(user_ids=None):
+    """Recompute the counters of every student, or of the given ones (caller commits)"""
+    unread = select(db.func.count(Notification.id)).where(
+        _visible_to(User.id, User.class_id, db.func.coalesce(User.created_at, datetime.min)),
+        ~_read_by(User.id)
+    ).scalar_subquery()
+    students = User.query.filter(User.role == 'student')
+    if user_ids is not None:
+        students = students.filter(User.id.in_(user_ids))
+    students.update({User.unread_notifications: unread}, synchronize_session=False)
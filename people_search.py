@@ -0,0 +1,140 @@
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import namedtuple
+
+from sqlalchemy import select
+
+import cache_versions
+from models import db, User, Class
+
+# People search
+#
+# Typeahead over users' full names and usernames. The index is a sorted list
+# of (token, user id) pairs with one token per word of the name plus the
+# username, so a prefix lookup is a bisect into that list and each keystroke
+# costs O(log n + matches) however large the school grows. Every word of
+# the query has to prefix-match a token of the same user ("ay ber" finds
+# "Aýna Berdiýewa"). Tokens and queries are case- and accent-folded, so
+# "ayna" also finds "Aýna".
+#
+# The index is built lazily from two SELECTs and dropped in every process
+# (cache_versions.bump('people_search')) whenever users, classes or parent
+# links change. INDEX_TTL remains as a backstop for writes that bypass
+# the app (SQL run by hand).
+
+INDEX_TTL = 300
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+Person = namedtuple('Person', 'id username full_name role class_id parent_id')
+
+
+def fold(text):
+    """Lower-case text and strip accents (ý -> y, ň -> n, ä -> a)"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+class PeopleIndex:
+    def __init__(self, people, classes):
+        self.people = {person.id: person for person in people}
+        self.folded = {person.id: fold(person.full_name) for person in people}
+        self.class_names = {class_id: name for class_id, name, _ in classes}
+        self.homerooms = {}
+        for class_id, _, teacher_id in classes:
+            self.homerooms.setdefault(teacher_id, []).append(class_id)
+        pairs = set()
+        for person in people:
+            for token in self.folded[person.id].split() + [fold(person.username)]:
+                pairs.add((token, person.id))
+        self._pairs = sorted(pairs)
+        self._tokens = [token for token, _ in self._pairs]
+
+    def _prefixed(self, prefix):
+        """Ids of the people with a token starting with ``prefix``"""
+        start = bisect_left(self._tokens, prefix)
+        end = bisect_left(self._tokens, prefix + '\U0010ffff', start)
+        return {person_id for _, person_id in self._pairs[start:end]}
+
+    def homeroom_class_ids(self, teacher_id):
+        return list(self.homerooms.get(teacher_id, ()))
+
+    def has(self, roles=None, class_ids=None):
+        """Whether anyone matches the filters, without a search term"""
+        return any(self._allowed(person, roles, class_ids, False) for person in self.people.values())
+
+    @staticmethod
+    def _allowed(person, roles, class_ids, unlinked):
+        return ((roles is None or person.role in roles)
+                and (class_ids is None or person.class_id in class_ids)
+                and not (unlinked and person.parent_id is not None))
+
+    def search(self, text, roles=None, class_ids=None, unlinked=False, limit=DEFAULT_LIMIT):
+        """Top ``limit`` people matching every word of ``text``, best first"""
+        words = fold(text).split()
+        if not words:
+            return []
+        ids = None
+        for word in sorted(words, key=len, reverse=True):
+            matched = self._prefixed(word)
+            ids = matched if ids is None else ids & matched
+            if not ids:
+                return []
+        matches = (
+            person for person in map(self.people.get, ids)
+            if self._allowed(person, roles, class_ids, unlinked)
+        )
+        # Names that start with the query first, then alphabetical
+        query = ' '.join(words)
+        best = heapq.nsmallest(limit, matches, key=lambda person: (
+            not self.folded[person.id].startswith(query), self.folded[person.id], person.id
+        ))
+        return [self.as_dict(person) for person in best]
+
+    def as_dict(self, person):
+        return {
+            'id': person.id,
+            'full_name': person.full_name,
+            'username': person.username,
+            'role': person.role,
+            'class_id': person.class_id,
+            'class': self.class_names.get(person.class_id),
+        }
+
+
+_index = None
+_built_at = 0.0
+_lock = threading.Lock()
+
+
+def _build():
+    people = [Person(*row) for row in db.session.execute(select(
+        User.id, User.username, User.full_name, User.role, User.class_id, User.parent_id
+    ))]
+    classes = db.session.execute(select(Class.id, Class.name, Class.teacher_id)).all()
+    return PeopleIndex(people, classes)
+
+
+def index():
+    """The current index, rebuilt when invalidated or older than INDEX_TTL"""
+    global _index, _built_at
+    with _lock:
+        if _index is None or time.monotonic() - _built_at > INDEX_TTL:
+            _index = _build()
+            _built_at = time.monotonic()
+        return _index
+
+
+def search(text, **filters):
+    return index().search(text, **filters)
+
+
+def invalidate():
+    global _index
+    _index = None
+
+
+cache_versions.register('people_search', invalidate)
@@ -0,0 +1,192 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Request profiling
+#
+# Opt-in with PROFILING = True. Every request is split into time spent in
+# SQL (timed between before/after_cursor_execute), in Jinja (between the
+# before_render_template and template_rendered signals) and the rest, which
+# is returned to the browser as a Server-Timing header. Statements slower
+# than SLOW_QUERY_MS are logged with the endpoint that issued them.
+#
+# Per-endpoint figures are kept in memory: cumulative latency buckets for
+# the Prometheus text endpoint and a window of the most recent requests for
+# the percentiles on the director's metrics page. Figures are per process.
+# Streamed bodies (exports, the event stream) are timed up to the moment
+# the response starts.
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+RECENT_SAMPLES = 500
+
+
+class EndpointStats:
+    """Latency histogram and running totals for one endpoint"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.sql_ms = 0.0
+        self.sql_queries = 0
+        self.template_ms = 0.0
+        self.slow_queries = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def add(self, total_ms, sql_ms, sql_queries, template_ms, slow_queries):
+        index = next((i for i, bound in enumerate(BUCKETS_MS) if total_ms <= bound), len(BUCKETS_MS))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += total_ms
+        self.sql_ms += sql_ms
+        self.sql_queries += sql_queries
+        self.template_ms += template_ms
+        self.slow_queries += slow_queries
+        self.recent.append(total_ms)
+
+    def percentile(self, p):
+        ordered = sorted(self.recent)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class Metrics:
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, *figures):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.add(*figures)
+
+    def summary(self):
+        """Per-endpoint averages and recent percentiles, slowest p95 first"""
+        with self._lock:
+            rows = [
+                {
+                    'endpoint': endpoint,
+                    'count': stats.count,
+                    'avg_ms': stats.total_ms / stats.count,
+                    'p50_ms': stats.percentile(50),
+                    'p95_ms': stats.percentile(95),
+                    'p99_ms': stats.percentile(99),
+                    'sql_ms': stats.sql_ms / stats.count,
+                    'sql_queries': stats.sql_queries / stats.count,
+                    'template_ms': stats.template_ms / stats.count,
+                    'slow_queries': stats.slow_queries,
+                }
+                for endpoint, stats in self._endpoints.items()
+            ]
+        return sorted(rows, key=lambda row: row['p95_ms'] or 0, reverse=True)
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = [
+            '# HELP edms_request_duration_seconds Time to produce a response, by endpoint.',
+            '# TYPE edms_request_duration_seconds histogram',
+        ]
+        counters = {
+            'edms_sql_duration_seconds_total': ('Time spent in SQL statements.', []),
+            'edms_sql_queries_total': ('SQL statements issued.', []),
+            'edms_template_duration_seconds_total': ('Time spent rendering templates.', []),
+            'edms_slow_queries_total': ('SQL statements slower than SLOW_QUERY_MS.', []),
+        }
+        with self._lock:
+            for endpoint, stats in sorted(self._endpoints.items()):
+                label = 'endpoint="%s"' % endpoint
+                cumulative = 0
+                for bound, count in zip(BUCKETS_MS + ('+Inf',), stats.buckets):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else '%g' % (bound / 1000)
+                    lines.append('edms_request_duration_seconds_bucket{%s,le="%s"} %d' % (label, le, cumulative))
+                lines.append('edms_request_duration_seconds_sum{%s} %.6f' % (label, stats.total_ms / 1000))
+                lines.append('edms_request_duration_seconds_count{%s} %d' % (label, stats.count))
+                counters['edms_sql_duration_seconds_total'][1].append('{%s} %.6f' % (label, stats.sql_ms / 1000))
+                counters['edms_sql_queries_total'][1].append('{%s} %d' % (label, stats.sql_queries))
+                counters['edms_template_duration_seconds_total'][1].append(
+                    '{%s} %.6f' % (label, stats.template_ms / 1000))
+                counters['edms_slow_queries_total'][1].append('{%s} %d' % (label, stats.slow_queries))
+        for name, (help_text, samples) in counters.items():
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s counter' % name)
+            lines.extend(name + sample for sample in samples)
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+metrics = Metrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('profiling_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('profiling_started')
+    if not started or not has_request_context():
+        return
+    elapsed = (time.perf_counter() - started.pop()) * 1000
+    g.profile_sql_ms = g.get('profile_sql_ms', 0.0) + elapsed
+    g.profile_sql_queries = g.get('profile_sql_queries', 0) + 1
+    if elapsed >= g.get('profile_slow_ms', float('inf')):
+        g.profile_slow_queries = g.get('profile_slow_queries', 0) + 1
+        logger.warning('Slow query (%.1f ms) in %s: %s', elapsed, request.endpoint, ' '.join(statement.split()))
+
+
+def _before_render(sender, template, context, **extra):
+    g.profile_template_started = time.perf_counter()
+
+
+def _rendered(sender, template, context, **extra):
+    started = g.pop('profile_template_started', None)
+    if started is not None:
+        g.profile_template_ms = g.get('profile_template_ms', 0.0) + (time.perf_counter() - started) * 1000
+
+
+def init_profiling(app):
+    """Install the profiling hooks when PROFILING is enabled"""
+    app.config.setdefault('PROFILING', False)
+    app.config.setdefault('SLOW_QUERY_MS', 100)
+    if not app.config['PROFILING']:
+        return
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    @app.before_request
+    def start_profile():
+        g.profile_started = time.perf_counter()
+        g.profile_slow_ms = app.config['SLOW_QUERY_MS']
+
+    @app.after_request
+    def finish_profile(response):
+        started = g.get('profile_started')
+        if started is None or request.endpoint in (None, 'static'):
+            return response
+        total = (time.perf_counter() - started) * 1000
+        sql_ms = g.get('profile_sql_ms', 0.0)
+        sql_queries = g.get('profile_sql_queries', 0)
+        template_ms = g.get('profile_template_ms', 0.0)
+        response.headers.add('Server-Timing', 'sql;dur=%.1f;desc="%d queries"' % (sql_ms, sql_queries))
+        response.headers.add('Server-Timing', 'tpl;dur=%.1f' % template_ms)
+        response.headers.add('Server-Timing', 'app;dur=%.1f' % max(total - sql_ms - template_ms, 0))
+        response.headers.add('Server-Timing', 'total;dur=%.1f' % total)
+        metrics.record(request.endpoint, total, sql_ms, sql_queries, template_ms, g.get('profile_slow_queries', 0))
+        return response
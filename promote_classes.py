@@ -0,0 +1,78 @@
+import argparse
+import sys
+
+from flask_migrate import upgrade
+
+from app import app, db
+from models import Class
+import rollover
+
+
+def parse_move(value):
+    source, sep, target = value.partition('=')
+    if not sep or not source.strip():
+        raise argparse.ArgumentTypeError('expected CLASS=TARGET, e.g. 5A=6A or 11A=graduate')
+    return source.strip(), target.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move every class up a grade at the end of the academic year')
+    parser.add_argument('--map', dest='moves', type=parse_move, action='append', metavar='CLASS=TARGET',
+                        help='where a class goes: an existing or new class name, "graduate" or "stay"; '
+                             'overrides the default of the next grade, e.g. 5A=6A, highest grade graduates')
+    parser.add_argument('--only', action='store_true', help='apply only the --map entries, not the default plan')
+    parser.add_argument('--homeroom-follows', action='store_true',
+                        help='class teachers move up with their students')
+    parser.add_argument('--year', type=int, metavar='YYYY',
+                        help='academic year being closed, e.g. 2025 for 2025/2026 (default: the current one)')
+    parser.add_argument('--dry-run', action='store_true', help='print the plan without applying it')
+    args = parser.parse_args()
+
+    with app.app_context():
+        upgrade()
+        classes = db.session.query(Class.id, Class.name).order_by(Class.name).all()
+        ids = {name.strip().casefold(): class_id for class_id, name in classes}
+        names = dict(classes)
+
+        plan = {} if args.only else rollover.suggest_plan(classes)
+        for source, target in args.moves or []:
+            if source.casefold() not in ids:
+                print("Unknown class: %s" % source)
+                return 1
+            source_id = ids[source.casefold()]
+            if target.casefold() == 'stay':
+                plan.pop(source_id, None)
+            elif target.casefold() == rollover.GRADUATE:
+                plan[source_id] = rollover.GRADUATE
+            else:
+                plan[source_id] = ids.get(target.casefold(), target)
+        if not plan:
+            print("Nothing to do")
+            return 0
+
+        for class_id, target in sorted(plan.items(), key=lambda item: names[item[0]]):
+            if target == rollover.GRADUATE:
+                where = 'graduates'
+            elif isinstance(target, int):
+                where = names[target]
+            else:
+                where = '%s (new)' % target
+            print("  %-8s -> %s" % (names[class_id], where))
+        if args.dry_run:
+            print("\nDry run: nothing was changed")
+            return 0
+
+        report = rollover.rollover(plan, homeroom_follows=args.homeroom_follows, first_year=args.year)
+        print("\n✓ %d student(s) moved, %d graduated" % (report['moved'], report['graduated']))
+        if report['created']:
+            print("✓ %d class(es) created: %s (%d subjects, %d lessons copied)" % (
+                len(report['created']), ', '.join(report['created']), report['subjects'], report['lessons']))
+        if report['free_teachers']:
+            print("Teachers without a class: %s" % ', '.join(report['free_teachers']))
+        if report['conflicts']:
+            print("%d timetable conflict(s) in the copied lessons: fix them in the week editor "
+                  "or run generate_timetable.py" % report['conflicts'])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
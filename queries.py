@@ -0,0 +1,239 @@
+import logging
+from datetime import date, datetime
+from functools import wraps
+
+from flask import g, has_request_context, request
+from sqlalchemy import and_, case, event, func, or_, select, union_all
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import aliased, joinedload, selectinload
+
+from models import db, User, Class, Subject, LessonPlan, Grade, Schedule
+from schedule_conflicts import WEEKDAYS
+
+logger = logging.getLogger(__name__)
+
+
+# Eager-loading queries
+#
+# Each helper loads exactly the relationships its templates walk, so a list
+# page costs a fixed number of SELECTs instead of one lazy load per row.
+
+def users_with_class():
+    """All users with their class, for the director user list"""
+    return User.query.options(joinedload(User.student_class)).order_by(User.id)
+
+
+def students_with_class(class_ids=None, parent_id=None):
+    """Students with their class; optionally limited to classes or a parent"""
+    query = User.query.options(joinedload(User.student_class)).filter(User.role == 'student')
+    if class_ids is not None:
+        query = query.filter(User.class_id.in_(class_ids))
+    if parent_id is not None:
+        query = query.filter(User.parent_id == parent_id)
+    return query.order_by(User.full_name)
+
+
+def children_by_parent(parent_ids):
+    """Students of the given parents with their class, keyed by parent id"""
+    children = {parent_id: [] for parent_id in parent_ids}
+    if parent_ids:
+        for student in students_with_class().filter(User.parent_id.in_(parent_ids)):
+            children[student.parent_id].append(student)
+    return children
+
+
+def classes_with_teacher_and_students(teacher_id=None):
+    """Classes with their class teacher and student roster"""
+    query = Class.query.options(joinedload(Class.teacher), selectinload(Class.students))
+    if teacher_id is not None:
+        query = query.filter(Class.teacher_id == teacher_id)
+    return query.order_by(Class.id)
+
+
+def classes_with_student_counts():
+    """(id, name, teacher_name, students) rows of every class, by name"""
+    student = aliased(User)
+    return db.session.query(
+        Class.id, Class.name, User.full_name.label('teacher_name'), func.count(student.id).label('students')
+    ).outerjoin(User, User.id == Class.teacher_id).outerjoin(
+        student, and_(student.class_id == Class.id, student.role == 'student')
+    ).group_by(Class.id, Class.name, User.full_name).order_by(Class.name)
+
+
+def subjects_with_class_and_teacher(class_id=None, teacher_id=None):
+    """Subjects with the class and teacher they belong to"""
+    query = Subject.query.options(joinedload(Subject.class_obj), joinedload(Subject.teacher))
+    if class_id is not None:
+        query = query.filter(Subject.class_id == class_id)
+    if teacher_id is not None:
+        query = query.filter(Subject.teacher_id == teacher_id)
+    return query.order_by(Subject.id)
+
+
+def schedules_with_subject(class_id=None, subject_ids=None, day_of_week=None, teacher_id=None):
+    """Timetable slots with subject, subject teacher and class"""
+    query = Schedule.query.options(
+        joinedload(Schedule.subject).joinedload(Subject.teacher),
+        joinedload(Schedule.class_obj)
+    )
+    if class_id is not None:
+        query = query.filter(Schedule.class_id == class_id)
+    if subject_ids is not None:
+        query = query.filter(Schedule.subject_id.in_(subject_ids))
+    if teacher_id is not None:
+        query = query.filter(Schedule.subject.has(Subject.teacher_id == teacher_id))
+    if day_of_week is not None:
+        query = query.filter(Schedule.day_of_week == day_of_week)
+    # Days in week order, not alphabetical
+    day_order = case({day: n for n, day in enumerate(WEEKDAYS)}, value=Schedule.day_of_week, else_=len(WEEKDAYS))
+    return query.order_by(day_order, Schedule.lesson_number)
+
+
+def lesson_plans_with_subject(subject_ids):
+    """Lesson plans with subject, subject class and subject teacher"""
+    return LessonPlan.query.options(
+        joinedload(LessonPlan.subject).joinedload(Subject.teacher),
+        joinedload(LessonPlan.subject).joinedload(Subject.class_obj)
+    ).filter(LessonPlan.subject_id.in_(subject_ids))
+
+
+def grades_with_subject(student_id):
+    """One student's grades with their subject"""
+    return Grade.query.options(joinedload(Grade.subject)).filter(Grade.student_id == student_id)
+
+
+def grades_with_student(subject_ids):
+    """Grades for a set of subjects with student, student class and subject"""
+    return Grade.query.options(
+        joinedload(Grade.student).joinedload(User.student_class),
+        joinedload(Grade.subject)
+    ).filter(Grade.subject_id.in_(subject_ids))
+
+
+# Keyset pagination
+#
+# Long lists are read one page at a time, ordered by a unique key such as
+# (date, id). The cursor of the next page is the key of the last row shown,
+# so every page is an index range scan no matter how deep the reader goes.
+#
+# A list filtered on several values of a leading index column (a teacher's
+# grades over subject_id IN (...)) cannot be read in key order from one
+# range: the database would sort every matching row for each page. With
+# ``partition`` each value gets its own LIMITed range scan, and only the
+# page's candidates, at most one page per value, are merged and sorted.
+
+PAGE_SIZE = 50
+
+
+def _encode_cursor(values):
+    return '_'.join(value.isoformat() if isinstance(value, (date, datetime)) else str(value) for value in values)
+
+
+def _decode_cursor(cursor, columns):
+    values = []
+    for raw, column in zip(cursor.split('_'), columns):
+        kind = column.type.python_type
+        if kind is datetime:
+            values.append(datetime.fromisoformat(raw))
+        elif kind is date:
+            values.append(date.fromisoformat(raw))
+        else:
+            values.append(kind(raw))
+    return values
+
+
+def _after(columns, values, descending):
+    """Condition selecting the rows that come after ``values`` in key order"""
+    if not columns:
+        return None
+    column, value = columns[0], values[0]
+    beyond = column < value if descending else column > value
+    rest = _after(columns[1:], values[1:], descending)
+    return beyond if rest is None else or_(beyond, and_(column == value, rest))
+
+
+def keyset_page(query, columns, cursor=None, per_page=PAGE_SIZE, descending=True, partition=None):
+    """Return one page of ``query`` ordered by ``columns`` and the cursor of the next page.
+
+    ``partition`` is an optional (column, values) pair the query is filtered
+    on; the page is then merged from one index range scan per value. The
+    last of ``columns`` must identify a row (the primary key).
+    """
+    after = None
+    if cursor:
+        try:
+            values = _decode_cursor(cursor, columns)
+        except ValueError:
+            values = None
+        if values and len(values) == len(columns):
+            after = _after(columns, values, descending)
+            query = query.filter(after)
+    order = [column.desc() if descending else column.asc() for column in columns]
+    if partition is not None:
+        column, values = partition
+        if not values:
+            return [], None
+        scans = [
+            select(columns[-1]).where(column == value, *([after] if after is not None else []))
+            .order_by(*order).limit(per_page + 1).subquery()
+            for value in values
+        ]
+        query = query.filter(columns[-1].in_(union_all(*[select(scan.c[0]) for scan in scans])))
+    rows = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = _encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
+
+
+# Query budgets
+#
+# Every SQL statement issued while handling a request is counted. Routes
+# declare how many statements they may issue with @query_budget(n); going
+# over logs a warning, or raises QueryBudgetExceeded when the app runs with
+# QUERY_BUDGET_STRICT (used by the test client to catch N+1 regressions).
+# Housekeeping that is not the view's own work (the periodic cache version
+# check) runs with execution option query_budget=False and is not counted.
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """Declare the maximum number of SQL statements a view may issue"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return view(*args, **kwargs)
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and (context is None or context.execution_options.get('query_budget', True)):
+        g.sql_statements = g.get('sql_statements', 0) + 1
+
+
+def statement_count():
+    """Number of SQL statements issued so far in the current request"""
+    return g.get('sql_statements', 0)
+
+
+def init_query_budget(app):
+    """Check every response against the budget declared by its view"""
+    app.config.setdefault('QUERY_BUDGET_STRICT', False)
+
+    @app.after_request
+    def check_query_budget(response):
+        view = app.view_functions.get(request.endpoint)
+        limit = getattr(view, 'query_budget', None)
+        count = statement_count()
+        if limit is not None and count > limit:
+            message = f'{request.endpoint} issued {count} SQL statements (budget {limit})'
+            if app.config['QUERY_BUDGET_STRICT']:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
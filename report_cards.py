@@ -0,0 +1,210 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+import archive
+from attendance import ATTENDANCE_STATUSES
+from models import db, User, Class, Subject, Grade, Attendance, StudentGradeStat, AttendanceMonthStat
+
+# Report cards
+#
+# One printable document per student with subject averages, attendance
+# rates and the class and teacher names. The data for a class is fetched in
+# five bulk queries (class, students, grade aggregates, subjects and
+# attendance counts) into plain dicts; rendering and writing the files then
+# needs no database and runs in a process pool. Without a date range the
+# aggregates come from the grade and attendance rollups, which cover the
+# live academic year; with one they come from the raw tables, including the
+# archived years the range reaches into.
+#
+# Output goes to <out_dir>/<class>/<student id>-<name>.<html|pdf>. Each
+# file is written to a temporary name and renamed when complete, so an
+# interrupted run can simply be started again: students whose card exists
+# are skipped unless force=True. PDF output needs the optional weasyprint
+# package.
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+TEMPLATE_NAME = 'report_card.html'
+
+_environment = None
+
+
+def _template():
+    global _environment
+    if _environment is None:
+        _environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape())
+    return _environment.get_template(TEMPLATE_NAME)
+
+
+def _slug(text):
+    return re.sub(r'[^\w-]+', '_', text, flags=re.UNICODE).strip('_') or 'x'
+
+
+def _grade_aggregates(student_ids, start, end):
+    """(student_id, subject_id, count, total, min, max) rows for the students"""
+    if start is None and end is None:
+        return db.session.execute(select(
+            StudentGradeStat.student_id, StudentGradeStat.subject_id, StudentGradeStat.count,
+            StudentGradeStat.total, StudentGradeStat.min_grade, StudentGradeStat.max_grade
+        ).where(StudentGradeStat.student_id.in_(student_ids))).all()
+    grades = archive.source(Grade, start, end).c
+    stmt = select(
+        grades.student_id, grades.subject_id, func.count(grades.id), func.sum(grades.grade),
+        func.min(grades.grade), func.max(grades.grade)
+    ).where(grades.student_id.in_(student_ids)).group_by(grades.student_id, grades.subject_id)
+    if start is not None:
+        stmt = stmt.where(grades.date >= start)
+    if end is not None:
+        stmt = stmt.where(grades.date <= end)
+    return db.session.execute(stmt).all()
+
+
+def _attendance_counts(student_ids, start, end):
+    """(student_id, status, count) rows for the students"""
+    if start is None and end is None:
+        return db.session.execute(select(
+            AttendanceMonthStat.student_id, AttendanceMonthStat.status, func.sum(AttendanceMonthStat.count)
+        ).where(AttendanceMonthStat.student_id.in_(student_ids))
+         .group_by(AttendanceMonthStat.student_id, AttendanceMonthStat.status)).all()
+    marks = archive.source(Attendance, start, end).c
+    stmt = select(marks.student_id, marks.status, func.count(marks.id)).where(
+        marks.student_id.in_(student_ids)
+    ).group_by(marks.student_id, marks.status)
+    if start is not None:
+        stmt = stmt.where(marks.date >= start)
+    if end is not None:
+        stmt = stmt.where(marks.date <= end)
+    return db.session.execute(stmt).all()
+
+
+def class_cards(class_id, student_ids=None, start=None, end=None):
+    """Report card data (plain dicts) for the students of a class"""
+    homeroom = aliased(User)
+    class_row = db.session.execute(
+        select(Class.id, Class.name, homeroom.full_name)
+        .outerjoin(homeroom, homeroom.id == Class.teacher_id)
+        .where(Class.id == class_id)
+    ).first()
+    if class_row is None:
+        return []
+    students_stmt = select(User.id, User.full_name).where(
+        User.role == 'student', User.class_id == class_id
+    ).order_by(User.full_name)
+    if student_ids is not None:
+        students_stmt = students_stmt.where(User.id.in_(student_ids))
+    students = db.session.execute(students_stmt).all()
+    if not students:
+        return []
+    ids = [student.id for student in students]
+
+    # Subjects of the class plus any other subject the students were graded in
+    teacher = aliased(User)
+    grades = _grade_aggregates(ids, start, end)
+    subject_ids = {row[1] for row in grades}
+    subjects = {
+        row.id: {'name': row.name, 'teacher': row.teacher_name}
+        for row in db.session.execute(
+            select(Subject.id, Subject.name, teacher.full_name.label('teacher_name'))
+            .outerjoin(teacher, teacher.id == Subject.teacher_id)
+            .where((Subject.class_id == class_id) | Subject.id.in_(subject_ids))
+            .order_by(Subject.name)
+        )
+    }
+    attendance = _attendance_counts(ids, start, end)
+
+    by_student = {student_id: {} for student_id in ids}
+    for student_id, subject_id, count, total, lowest, highest in grades:
+        by_student[student_id][subject_id] = (count, total, lowest, highest)
+    counts = {student_id: dict.fromkeys(ATTENDANCE_STATUSES, 0) for student_id in ids}
+    for student_id, status, count in attendance:
+        counts[student_id][status] = int(count)
+
+    generated = date.today().isoformat()
+    cards = []
+    for student in students:
+        rows = []
+        grade_count = grade_total = 0
+        for subject_id, subject in subjects.items():
+            count, total, lowest, highest = by_student[student.id].get(subject_id, (0, 0, None, None))
+            rows.append(dict(subject, count=count, min=lowest, max=highest,
+                             average=round(total / count, 2) if count else None))
+            grade_count += count
+            grade_total += total or 0
+        attended = counts[student.id]
+        days = sum(attended.values())
+        cards.append({
+            'student': {'id': student.id, 'full_name': student.full_name},
+            'class': {'id': class_row.id, 'name': class_row.name, 'teacher': class_row.full_name},
+            'period': {'start': start.isoformat() if start else None, 'end': end.isoformat() if end else None},
+            'generated': generated,
+            'subjects': rows,
+            'average': round(grade_total / grade_count, 2) if grade_count else None,
+            'attendance': {
+                'counts': attended,
+                'total': days,
+                'rates': {status: round(n / days * 100, 1) if days else 0 for status, n in attended.items()},
+            },
+        })
+    return cards
+
+
+def render_card(card):
+    return _template().render(card=card)
+
+
+def card_path(out_dir, card, fmt):
+    return os.path.join(
+        out_dir, _slug(card['class']['name']),
+        '%d-%s.%s' % (card['student']['id'], _slug(card['student']['full_name']), fmt)
+    )
+
+
+def write_card(card, out_dir, fmt='html'):
+    """Render one card and write it atomically; runs in the worker processes"""
+    path = card_path(out_dir, card, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    html = render_card(card)
+    partial = path + '.part'
+    if fmt == 'pdf':
+        from weasyprint import HTML
+        HTML(string=html, base_url=TEMPLATE_DIR).write_pdf(partial)
+    else:
+        with open(partial, 'w', encoding='utf-8') as output:
+            output.write(html)
+    os.replace(partial, path)
+    return path
+
+
+def generate(out_dir, class_ids=None, fmt='html', start=None, end=None, workers=None, force=False, progress=None):
+    """Write report cards for the given classes (default: the whole school).
+
+    ``progress`` is called as progress(done, total, path) after each card.
+    Returns (written, skipped).
+    """
+    if class_ids is None:
+        class_ids = db.session.scalars(select(Class.id).order_by(Class.name)).all()
+
+    pending = []
+    skipped = 0
+    for class_id in class_ids:
+        for card in class_cards(class_id, start=start, end=end):
+            if not force and os.path.exists(card_path(out_dir, card, fmt)):
+                skipped += 1
+            else:
+                pending.append(card)
+
+    total = len(pending)
+    if not pending:
+        return 0, skipped
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(write_card, card, out_dir, fmt) for card in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            path = future.result()
+            if progress is not None:
+                progress(done, total, path)
+    return total, skipped
@@ -0,0 +1,197 @@
+import re
+from datetime import date, datetime
+
+from sqlalchemy import case, func, insert, literal, or_, select
+from sqlalchemy.orm import aliased
+
+import cache_versions
+import grade_stats
+import notifications
+from models import db, User, Class, Subject, Schedule, LessonPlan, Grade, Graduation, Notification, NotificationRead
+from schedule_conflicts import school_conflicts
+from school_calendar import academic_year
+
+# Year-end rollover
+#
+# A plan maps classes to where their students go next year: another class
+# (by id), a new class (by name) or GRADUATE. Classes left out of the plan
+# keep their students. rollover() applies a plan in one transaction with a
+# handful of set-based statements, however many students there are:
+#
+#   - new classes are created, and the subjects and timetable of the class
+#     moving into them are copied with INSERT ... SELECT;
+#   - graduates are recorded in graduations with the class they finished
+#     and detached from it (class_id NULL); their accounts and marks stay;
+#   - every other student changes class in a single UPDATE ... CASE, so
+#     5A -> 6A and 6A -> 7A in the same plan do not chain;
+#   - optionally homeroom teachers move up with their students;
+#   - unread counters are recomputed, as class notifications now reach
+#     different students.
+#
+# A copied timetable keeps its teachers and times, so it clashes with the
+# class it was copied from; the report counts the clashes for the director
+# to resolve (week editor or generate_timetable.py).
+
+GRADUATE = 'graduate'
+
+_NUMBERED = re.compile(r'^(\d+)(\D*)$')
+
+
+def suggest_plan(classes):
+    """Default plan for (id, name) pairs: "5A" -> "6A", the highest grade graduates.
+
+    Targets that do not exist yet are given by name; classes whose name does
+    not start with a grade number are left out.
+    """
+    ids = {name.strip().casefold(): class_id for class_id, name in classes}
+    numbered = {}
+    for class_id, name in classes:
+        match = _NUMBERED.match(name.strip())
+        if match:
+            numbered[class_id] = (int(match.group(1)), match.group(2))
+    if not numbered:
+        return {}
+    top = max(grade for grade, _ in numbered.values())
+    plan = {}
+    for class_id, (grade, parallel) in numbered.items():
+        if grade == top:
+            plan[class_id] = GRADUATE
+        else:
+            name = '%d%s' % (grade + 1, parallel)
+            plan[class_id] = ids.get(name.casefold(), name)
+    return plan
+
+
+def _clone_timetable(source_id, class_id, now):
+    """Copy a class's subjects and lessons to another class; returns (subjects, lessons)"""
+    subjects = db.session.execute(insert(Subject).from_select(
+        ['name', 'class_id', 'teacher_id', 'weekly_hours', 'created_at'],
+        select(Subject.name, literal(class_id), Subject.teacher_id, Subject.weekly_hours, literal(now))
+        .where(Subject.class_id == source_id).order_by(Subject.id)
+    )).rowcount
+    original = aliased(Subject)
+    copy = aliased(Subject)
+    copied_subject = select(func.min(copy.id)).where(
+        copy.class_id == class_id, copy.name == original.name, copy.teacher_id == original.teacher_id
+    ).scalar_subquery()
+    lessons = db.session.execute(insert(Schedule).from_select(
+        ['class_id', 'day_of_week', 'lesson_number', 'subject_id', 'start_time', 'end_time', 'is_break', 'created_at'],
+        select(literal(class_id), Schedule.day_of_week, Schedule.lesson_number, copied_subject,
+               Schedule.start_time, Schedule.end_time, Schedule.is_break, literal(now))
+        .join(original, original.id == Schedule.subject_id)
+        .where(Schedule.class_id == source_id)
+    )).rowcount
+    return subjects, lessons
+
+
+def rollover(plan, homeroom_follows=False, first_year=None):
+    """Apply a plan in one transaction and return a report.
+
+    ``plan`` maps class ids to a class id, a new class name or GRADUATE.
+    ``first_year`` is the academic year being closed (default: the current one).
+    Raises ValueError for unknown classes or an empty plan.
+    """
+    classes = {row.id: row for row in db.session.execute(select(Class.id, Class.name, Class.teacher_id))}
+    if not plan:
+        raise ValueError('empty plan')
+    unknown = [value for source, target in plan.items() for value in (source, target)
+               if isinstance(value, int) and value not in classes]
+    if unknown:
+        raise ValueError('unknown class id: %s' % ', '.join(map(str, sorted(set(unknown)))))
+    first_year = academic_year(date.today()) if first_year is None else first_year
+    now = datetime.utcnow()
+    names = {row.name.strip().casefold(): class_id for class_id, row in classes.items()}
+
+    report = {'created': [], 'subjects': 0, 'lessons': 0, 'moved': 0, 'graduated': 0,
+              'free_teachers': [], 'conflicts': 0}
+    try:
+        # New classes, with the timetable of the class moving in
+        targets = {}
+        for source, target in sorted(plan.items()):
+            if target == GRADUATE:
+                targets[source] = None
+                continue
+            if isinstance(target, str):
+                name = target.strip()
+                if not name:
+                    raise ValueError('empty class name')
+                if name.casefold() not in names:
+                    new_class = Class(name=name)
+                    db.session.add(new_class)
+                    db.session.flush()
+                    names[name.casefold()] = new_class.id
+                    report['created'].append(name)
+                    subjects, lessons = _clone_timetable(source, new_class.id, now)
+                    report['subjects'] += subjects
+                    report['lessons'] += lessons
+                target = names[name.casefold()]
+            targets[source] = target
+
+        graduating = [source for source, target in targets.items() if target is None]
+        students = (User.role == 'student')
+        if graduating:
+            report['graduated'] = db.session.execute(insert(Graduation).from_select(
+                ['student_id', 'first_year', 'class_name', 'graduated_at'],
+                select(User.id, literal(first_year), Class.name, literal(now))
+                .join(Class, Class.id == User.class_id)
+                .where(students, User.class_id.in_(graduating))
+            )).rowcount
+
+        # Every student of the plan in one statement; graduates get NULL
+        changed = User.query.filter(students, User.class_id.in_(list(targets))).update(
+            {User.class_id: case(targets, value=User.class_id)}, synchronize_session=False
+        )
+        report['moved'] = changed - report['graduated']
+
+        if homeroom_follows:
+            homerooms = {target: classes[source].teacher_id for source, target in targets.items() if target is not None}
+            moving = set(homerooms.values()) - {None}
+            for class_id, row in classes.items():
+                # A teacher who moved up no longer leads the class they left
+                if class_id not in homerooms and row.teacher_id in moving:
+                    homerooms[class_id] = None
+            Class.query.filter(Class.id.in_(list(homerooms))).update(
+                {Class.teacher_id: case(homerooms, value=Class.id)}, synchronize_session=False
+            )
+            leading = set(db.session.execute(
+                select(Class.teacher_id).where(Class.teacher_id.isnot(None))).scalars())
+            freed = {row.teacher_id for row in classes.values() if row.teacher_id} - leading
+            if freed:
+                report['free_teachers'] = list(db.session.execute(
+                    select(User.full_name).where(User.id.in_(freed)).order_by(User.full_name)).scalars())
+
+        notifications.recompute_unread_counts()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    cache_versions.bump('identity', 'school_stats', 'people_search', 'timetable')
+    if report['lessons']:
+        report['conflicts'] = len(school_conflicts())
+    return report
+
+
+def delete_classes(class_ids):
+    """Delete classes with their subjects, lesson plans, grades and lessons (caller commits).
+
+    Set-based DELETEs instead of the ORM cascade, which loads every child
+    row. Notifications sent to the classes go with them; the classes'
+    students are detached and their unread counters recomputed.
+    """
+    subject_ids = select(Subject.id).where(Subject.class_id.in_(class_ids))
+    grade_stats.forget_subjects(subject_ids)
+    Schedule.query.filter(or_(
+        Schedule.class_id.in_(class_ids), Schedule.subject_id.in_(subject_ids)
+    )).delete(synchronize_session=False)
+    LessonPlan.query.filter(LessonPlan.subject_id.in_(subject_ids)).delete(synchronize_session=False)
+    Grade.query.filter(Grade.subject_id.in_(subject_ids)).delete(synchronize_session=False)
+    Subject.query.filter(Subject.class_id.in_(class_ids)).delete(synchronize_session=False)
+    broadcasts = select(Notification.id).where(Notification.class_id.in_(class_ids))
+    NotificationRead.query.filter(NotificationRead.notification_id.in_(broadcasts)).delete(synchronize_session=False)
+    Notification.query.filter(Notification.class_id.in_(class_ids)).delete(synchronize_session=False)
+    students = list(db.session.execute(select(User.id).where(User.class_id.in_(class_ids))).scalars())
+    if students:
+        User.query.filter(User.id.in_(students)).update({User.class_id: None}, synchronize_session=False)
+        notifications.recompute_unread_counts(students)
+    return Class.query.filter(Class.id.in_(class_ids)).delete(synchronize_session=False)
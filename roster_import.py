@@ -0,0 +1,194 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import bindparam, insert, select
+from werkzeug.security import generate_password_hash
+
+import cache_versions
+from models import db, User, Class
+
+# Bulk roster import
+#
+# Reads a CSV of users (one row per person) and creates them in a single
+# transaction. The file is streamed and validated row by row against
+# in-memory sets of the usernames and class names already in the database,
+# so validation costs two queries however long the file is. Passwords are
+# hashed in parallel, users are inserted in batches with executemany, and
+# parent links are resolved in one batched UPDATE at the end (a parent may
+# appear before or after their children in the file).
+#
+# The command line (import_users.py) hashes in a process pool across all
+# cores. Inside a web request, where forking worker processes would copy
+# the server, a few OS threads are used instead: hashlib releases the GIL
+# while it hashes, so they still run in parallel. Under gunicorn's gevent
+# worker the threading module is patched and its threads are greenlets that
+# would hash one after another on the hub, stalling every other request and
+# event stream; there the hashing goes to gevent's pool of real threads and
+# only the importing greenlet waits for it.
+#
+# A file with any invalid row imports nothing; the report lists every
+# problem with its line number. dry_run=True validates without writing.
+#
+# Columns: username, password, full_name, role, class, parent
+#   class  - class name, required for students
+#   parent - username of the student's parent (in the file or existing)
+
+ROLES = ('director', 'teacher', 'student', 'parent')
+COLUMNS = ('username', 'password', 'full_name', 'role', 'class', 'parent')
+BATCH_SIZE = 500
+# Below this many rows starting a pool costs more than it saves
+POOL_THRESHOLD = 20
+HASH_THREADS = 4
+
+
+def _hash_passwords(passwords, workers=None, processes=False):
+    if len(passwords) < POOL_THRESHOLD or workers == 1:
+        return [generate_password_hash(password) for password in passwords]
+    if processes:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(passwords) // (workers * 4))
+            return list(pool.map(generate_password_hash, passwords, chunksize=chunksize))
+    if _green_threads():
+        from gevent.threadpool import ThreadPool
+        pool = ThreadPool(workers or HASH_THREADS)
+        try:
+            return list(pool.imap(generate_password_hash, passwords))
+        finally:
+            pool.kill()
+    with ThreadPoolExecutor(max_workers=workers or HASH_THREADS) as pool:
+        return list(pool.map(generate_password_hash, passwords))
+
+
+def _green_threads():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def read_roster(lines):
+    """Validate a CSV roster; returns (valid rows, report)"""
+    existing = set(db.session.scalars(select(User.username)))
+    existing_parents = set(db.session.scalars(select(User.username).where(User.role == 'parent')))
+    classes = {name: class_id for class_id, name in db.session.execute(select(Class.id, Class.name))}
+
+    report = {'rows': 0, 'created': dict.fromkeys(ROLES, 0), 'parent_links': 0, 'errors': []}
+    reader = csv.DictReader(lines)
+    missing = [column for column in ('username', 'password', 'full_name', 'role')
+               if column not in (reader.fieldnames or ())]
+    if missing:
+        report['errors'].append((1, 'Sütün ýok: %s' % ', '.join(missing)))
+        return [], report
+
+    seen = set()
+    file_parents = set()
+    rows = []
+    for row in reader:
+        report['rows'] += 1
+        line = reader.line_num
+        username = (row.get('username') or '').strip()
+        password = row.get('password') or ''
+        full_name = (row.get('full_name') or '').strip()
+        role = (row.get('role') or '').strip().lower()
+        class_name = (row.get('class') or '').strip()
+        parent = (row.get('parent') or '').strip()
+
+        problems = []
+        if not username or not password or not full_name:
+            problems.append('ulanyjy ady, parol we doly ady hökmany')
+        if username in existing:
+            problems.append('"%s" ulanyjy ady eýýäm bar' % username)
+        elif username in seen:
+            problems.append('"%s" faýlda gaýtalanýar' % username)
+        if role not in ROLES:
+            problems.append('nädogry rol "%s"' % role)
+        if class_name and class_name not in classes:
+            problems.append('"%s" synpy ýok' % class_name)
+        elif role == 'student' and not class_name:
+            problems.append('okuwçy üçin synp hökmany')
+        if parent and role != 'student':
+            problems.append('ene-ata diňe okuwça baglanyp bilner')
+        if username:
+            seen.add(username)
+
+        if problems:
+            report['errors'].append((line, '; '.join(problems)))
+            continue
+        if role == 'parent':
+            file_parents.add(username)
+        rows.append({
+            'line': line,
+            'username': username,
+            'password': password,
+            'full_name': full_name,
+            'role': role,
+            'class_id': classes.get(class_name) if class_name else None,
+            'parent': parent or None,
+        })
+
+    # Parent links can point forward in the file, so they are checked last
+    for row in rows:
+        if row['parent'] and row['parent'] not in file_parents and row['parent'] not in existing_parents:
+            report['errors'].append((row['line'], '"%s" ene-atasy tapylmady' % row['parent']))
+    report['errors'].sort()
+    for row in rows:
+        report['created'][row['role']] += 1
+        report['parent_links'] += bool(row['parent'])
+    return rows, report
+
+
+def import_roster(lines, dry_run=False, workers=None, processes=False):
+    """Validate a CSV roster and, unless dry_run or invalid, create its users.
+
+    ``lines`` is any iterable of CSV text lines (an open file, an upload
+    stream). Passwords are hashed by ``workers`` threads, or processes with
+    ``processes=True`` (command line only). Returns the report;
+    report['imported'] says whether anything was written.
+    """
+    rows, report = read_roster(lines)
+    report['dry_run'] = dry_run
+    report['imported'] = False
+    if dry_run or report['errors'] or not rows:
+        return report
+
+    hashes = _hash_passwords([row['password'] for row in rows], workers, processes)
+    now = datetime.utcnow()
+    try:
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            db.session.execute(insert(User), [
+                {
+                    'username': row['username'],
+                    'password': password_hash,
+                    'full_name': row['full_name'],
+                    'role': row['role'],
+                    'class_id': row['class_id'],
+                    'created_at': now,
+                }
+                for row, password_hash in zip(batch, hashes[start:start + BATCH_SIZE])
+            ])
+
+        links = [row for row in rows if row['parent']]
+        if links:
+            parent_ids = dict(db.session.execute(
+                select(User.username, User.id).where(
+                    User.role == 'parent', User.username.in_({row['parent'] for row in links})
+                )
+            ).all())
+            users = User.__table__
+            db.session.execute(
+                users.update().where(users.c.username == bindparam('student_username'))
+                .values(parent_id=bindparam('parent_id')),
+                [{'student_username': row['username'], 'parent_id': parent_ids[row['parent']]} for row in links]
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    cache_versions.bump('school_stats', 'people_search')
+    report['imported'] = True
+    return report
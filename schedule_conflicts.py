@@ -0,0 +1,140 @@
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from models import db, User, Class, Subject, Schedule
+
+# Timetable conflicts
+#
+# Lesson times are stored as "HH:MM" strings. They are parsed once into
+# minutes since midnight, so every slot becomes a half-open interval
+# [start, end). Slots are indexed per (class, day) and per (teacher, day);
+# each index keeps its intervals sorted by start, and the slots that could
+# overlap a new one are found with a bisect on the end time instead of
+# comparing strings. A class may also not use a lesson number twice a day.
+# Checking every slot of a school is a single query plus a few milliseconds.
+
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday')
+DAY_NAMES = {
+    'Monday': 'Duşenbe', 'Tuesday': 'Sişenbe', 'Wednesday': 'Çarşenbe',
+    'Thursday': 'Penşenbe', 'Friday': 'Anna', 'Saturday': 'Şenbe',
+}
+
+Slot = namedtuple('Slot', 'id class_id teacher_id subject_id day lesson_number start end '
+                          'class_name subject_name teacher_name')
+
+
+def to_minutes(text):
+    """Minutes since midnight of an "HH:MM" time; ValueError if malformed"""
+    hours, _, minutes = (text or '').strip().partition(':')
+    value = int(hours) * 60 + int(minutes)
+    if not (0 <= int(hours) < 24 and 0 <= int(minutes) < 60):
+        raise ValueError('invalid time: %r' % text)
+    return value
+
+
+def format_minutes(value):
+    return '%02d:%02d' % divmod(value, 60)
+
+
+class IntervalIndex:
+    """Slots per key, sorted by start time"""
+
+    def __init__(self):
+        self._starts = {}
+        self._slots = {}
+
+    def add(self, key, slot):
+        starts = self._starts.setdefault(key, [])
+        position = bisect_left(starts, slot.start)
+        starts.insert(position, slot.start)
+        self._slots.setdefault(key, []).insert(position, slot)
+
+    def overlapping(self, key, start, end):
+        """Slots under ``key`` that overlap [start, end)"""
+        starts = self._starts.get(key)
+        if not starts:
+            return []
+        # Only slots starting before ``end`` can overlap
+        candidates = self._slots[key][:bisect_left(starts, end)]
+        return [slot for slot in candidates if slot.end > start]
+
+
+def find_conflicts(slots, existing=()):
+    """Conflicts of ``slots`` with each other and with ``existing`` slots.
+
+    Returns (slot, other, kind) triples where kind is 'time' (ends before
+    it starts), 'lesson' (lesson number used twice), 'class' or 'teacher'
+    (overlapping times); ``other`` is None for 'time'.
+    """
+    classes = IntervalIndex()
+    teachers = IntervalIndex()
+    numbers = {}
+    for slot in existing:
+        classes.add((slot.class_id, slot.day), slot)
+        teachers.add((slot.teacher_id, slot.day), slot)
+        numbers[slot.class_id, slot.day, slot.lesson_number] = slot
+
+    conflicts = []
+    for slot in slots:
+        if slot.end <= slot.start:
+            conflicts.append((slot, None, 'time'))
+            continue
+        same_number = numbers.get((slot.class_id, slot.day, slot.lesson_number))
+        if same_number is not None:
+            conflicts.append((slot, same_number, 'lesson'))
+        conflicts.extend((slot, other, 'class') for other in classes.overlapping(
+            (slot.class_id, slot.day), slot.start, slot.end) if other is not same_number)
+        conflicts.extend((slot, other, 'teacher') for other in teachers.overlapping(
+            (slot.teacher_id, slot.day), slot.start, slot.end) if other.class_id != slot.class_id)
+        classes.add((slot.class_id, slot.day), slot)
+        teachers.add((slot.teacher_id, slot.day), slot)
+        numbers[slot.class_id, slot.day, slot.lesson_number] = slot
+    return conflicts
+
+
+def load_slots(exclude_class_id=None):
+    """Every timetabled slot with its teacher and names, in one query"""
+    teacher = aliased(User)
+    stmt = (
+        select(Schedule.id, Schedule.class_id, Subject.teacher_id, Schedule.subject_id, Schedule.day_of_week,
+               Schedule.lesson_number, Schedule.start_time, Schedule.end_time,
+               Class.name, Subject.name, teacher.full_name)
+        .join(Subject, Subject.id == Schedule.subject_id)
+        .join(Class, Class.id == Schedule.class_id)
+        .outerjoin(teacher, teacher.id == Subject.teacher_id)
+    )
+    if exclude_class_id is not None:
+        stmt = stmt.where(Schedule.class_id != exclude_class_id)
+    slots = []
+    for row in db.session.execute(stmt):
+        try:
+            start, end = to_minutes(row[6]), to_minutes(row[7])
+        except ValueError:
+            continue
+        slots.append(Slot(row[0], row[1], row[2], row[3], row[4], row[5], start, end, row[8], row[9], row[10]))
+    return slots
+
+
+def school_conflicts():
+    """All conflicts in the current timetable"""
+    return find_conflicts(load_slots())
+
+
+def describe(conflict):
+    """A conflict as a message for the director"""
+    slot, other, kind = conflict
+    where = '%s, №%d sapak (%s-%s)' % (
+        DAY_NAMES.get(slot.day, slot.day), slot.lesson_number, format_minutes(slot.start), format_minutes(slot.end))
+    if kind == 'time':
+        return '%s: sapak başlanmazdan öň gutarýar' % where
+    if kind == 'lesson':
+        return '%s: %s synpynda №%d sapak eýýäm bar (%s)' % (
+            where, slot.class_name, slot.lesson_number, other.subject_name)
+    if kind == 'class':
+        return '%s: %s synpynyň %s we %s sapaklarynyň wagty gabat gelýär' % (
+            where, slot.class_name, slot.subject_name, other.subject_name)
+    return '%s: %s şol wagt %s synpynda %s sapagyny berýär' % (
+        where, slot.teacher_name, other.class_name, other.subject_name)
@@ -0,0 +1,158 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date, timedelta
+
+from sqlalchemy import select
+
+import cache_versions
+from models import db, Holiday
+from schedule_conflicts import WEEKDAYS
+
+# School calendar
+#
+# An academic year runs from 1 September to 31 August; lessons are held
+# from YEAR_START to LAST_TERM_DAY on the weekdays of the timetable
+# (Monday to Saturday), except during holidays. The school days of a year
+# are materialized once into a sorted array of date ordinals, so "is this a
+# school day", "next school day" and "school days between two dates" are
+# bisects instead of holiday queries. A year takes one SELECT of the
+# holidays overlapping it and a few kilobytes.
+#
+# Built years are dropped in every process when a holiday is created or
+# deleted (cache_versions.bump('school_calendar')); CALENDAR_TTL remains as
+# a backstop for writes that bypass the app.
+
+CALENDAR_TTL = 300
+YEAR_START = (9, 1)
+LAST_TERM_DAY = (5, 31)
+
+HolidayRange = namedtuple('HolidayRange', 'id name start_date end_date description')
+
+
+def academic_year(day):
+    """Calendar year in which the academic year containing ``day`` starts"""
+    return day.year if (day.month, day.day) >= YEAR_START else day.year - 1
+
+
+class SchoolYear:
+    def __init__(self, first_year, holidays):
+        self.first_year = first_year
+        self.start = date(first_year, *YEAR_START)
+        self.end = date(first_year + 1, *YEAR_START) - timedelta(days=1)
+        self.last_term_day = date(first_year + 1, *LAST_TERM_DAY)
+        self.holidays = sorted(holidays, key=lambda holiday: (holiday.start_date, holiday.id))
+        self._holiday_starts = [holiday.start_date for holiday in self.holidays]
+
+        first = self.start.toordinal()
+        flags = bytearray(
+            (self.start + timedelta(days=offset)).weekday() < len(WEEKDAYS)
+            for offset in range((self.last_term_day - self.start).days + 1)
+        )
+        for holiday in self.holidays:
+            lo = max(holiday.start_date.toordinal() - first, 0)
+            hi = min(holiday.end_date.toordinal() - first + 1, len(flags))
+            if lo < hi:
+                flags[lo:hi] = bytes(hi - lo)
+        self._days = array('i', (first + offset for offset, flag in enumerate(flags) if flag))
+
+    def __len__(self):
+        return len(self._days)
+
+    def is_school_day(self, day):
+        ordinal = day.toordinal()
+        position = bisect_left(self._days, ordinal)
+        return position < len(self._days) and self._days[position] == ordinal
+
+    def next_school_day(self, day):
+        """First school day of this year after ``day``, or None"""
+        position = bisect_right(self._days, day.toordinal())
+        return date.fromordinal(self._days[position]) if position < len(self._days) else None
+
+    def count(self, start, end):
+        """Number of school days from ``start`` to ``end`` (inclusive)"""
+        return max(bisect_right(self._days, end.toordinal()) - bisect_left(self._days, start.toordinal()), 0)
+
+    def closed_days(self, start, end):
+        """Dates from ``start`` to ``end`` (inclusive) within the school year that are not school days"""
+        first = max(start, self.start).toordinal()
+        last = min(end, self.last_term_day).toordinal()
+        open_days = set(self._days[bisect_left(self._days, first):bisect_right(self._days, last)])
+        return [date.fromordinal(ordinal) for ordinal in range(first, last + 1) if ordinal not in open_days]
+
+    def holidays_starting(self, start, end):
+        """Holidays that start between ``start`` and ``end`` (inclusive)"""
+        return self.holidays[bisect_left(self._holiday_starts, start):bisect_right(self._holiday_starts, end)]
+
+
+_years = {}
+_built_at = 0.0
+_lock = threading.Lock()
+
+
+def _build(first_year):
+    start = date(first_year, *YEAR_START)
+    end = date(first_year + 1, *YEAR_START) - timedelta(days=1)
+    holidays = [HolidayRange(*row) for row in db.session.execute(
+        select(Holiday.id, Holiday.name, Holiday.start_date, Holiday.end_date, Holiday.description)
+        .where(Holiday.start_date <= end, Holiday.end_date >= start)
+    )]
+    return SchoolYear(first_year, holidays)
+
+
+def school_year(day=None):
+    """The academic year containing ``day`` (default: today)"""
+    global _built_at
+    first_year = academic_year(day or date.today())
+    with _lock:
+        if time.monotonic() - _built_at > CALENDAR_TTL:
+            _years.clear()
+            _built_at = time.monotonic()
+        year = _years.get(first_year)
+        if year is None:
+            year = _years[first_year] = _build(first_year)
+        return year
+
+
+def is_school_day(day=None):
+    day = day or date.today()
+    return school_year(day).is_school_day(day)
+
+
+def next_school_day(day=None):
+    """First school day after ``day``, looking into the next academic year if needed"""
+    day = day or date.today()
+    year = school_year(day)
+    following = year.next_school_day(day)
+    if following is None:
+        following = school_year(year.end + timedelta(days=1)).next_school_day(year.end)
+    return following
+
+
+def school_days_in_range(start, end):
+    """Number of school days from ``start`` to ``end`` (inclusive)"""
+    return sum(
+        school_year(date(first_year, *YEAR_START)).count(start, end)
+        for first_year in range(academic_year(start), academic_year(end) + 1)
+    )
+
+
+def upcoming_holidays(today=None, days=7):
+    """Holidays starting within ``days`` days of ``today``"""
+    today = today or date.today()
+    until = today + timedelta(days=days)
+    holidays = {}
+    for first_year in range(academic_year(today), academic_year(until) + 1):
+        for holiday in school_year(date(first_year, *YEAR_START)).holidays_starting(today, until):
+            holidays[holiday.id] = holiday
+    return sorted(holidays.values(), key=lambda holiday: (holiday.start_date, holiday.id))
+
+
+def invalidate():
+    """Drop every built year after a holiday change"""
+    _years.clear()
+
+
+cache_versions.register('school_calendar', invalidate)
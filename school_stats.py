@@ -0,0 +1,63 @@
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, select
+
+import cache_versions
+from cache import TTLCache
+from models import db, User, Class, Subject, Attendance, Grade
+
+# Director dashboard statistics
+#
+# Every figure on the director dashboard is a scalar subquery of a single
+# SELECT, so the page costs one round-trip however many figures it shows.
+# The result is cached per day; creating or deleting users, classes and
+# subjects drops it in every process (cache_versions.bump('school_stats')),
+# while the figures that move with daily work (attendance, grades, unread
+# counters) are refreshed by the short TTL.
+
+STATS_TTL = 60
+
+_stats_cache = TTLCache(maxsize=4, ttl=STATS_TTL)
+
+
+def _count(model, *criteria):
+    return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+
+def _compute(today):
+    week_start = datetime.combine(today - timedelta(days=today.weekday()), time.min)
+    students = User.role == 'student'
+    row = db.session.execute(select(
+        _count(User, students).label('total_students'),
+        _count(User, User.role == 'teacher').label('total_teachers'),
+        _count(Class).label('total_classes'),
+        _count(Subject).label('total_subjects'),
+        _count(Attendance, Attendance.date == today).label('attendance_marked'),
+        _count(Attendance, Attendance.date == today,
+               Attendance.status.in_(('present', 'late'))).label('attendance_present'),
+        _count(Grade, Grade.created_at >= week_start).label('grades_this_week'),
+        select(func.coalesce(func.sum(User.unread_notifications), 0))
+        .where(students).scalar_subquery().label('unread_notifications'),
+        _count(User, students, User.unread_notifications > 0).label('students_with_unread'),
+    )).one()
+    stats = dict(row._mapping)
+    marked = stats['attendance_marked']
+    stats['attendance_rate'] = round(stats['attendance_present'] / marked * 100, 1) if marked else None
+    return stats
+
+
+def school_stats():
+    """School-wide counts and today's activity for the director dashboard"""
+    today = date.today()
+    stats = _stats_cache.get(today)
+    if stats is None:
+        stats = _compute(today)
+        _stats_cache.set(today, stats)
+    return stats
+
+
+def invalidate():
+    _stats_cache.clear()
+
+
+cache_versions.register('school_stats', invalidate)
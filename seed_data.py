@@ -0,0 +1,222 @@
+import argparse
+import random
+import sys
+from datetime import date, datetime, time, timedelta
+
+from flask_migrate import stamp, upgrade
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from models import User, Class, Subject, Schedule, Attendance, Grade, Notification, LessonPlan, Holiday
+from notifications import rebuild_unread_counts
+from grade_stats import rebuild_grade_stats
+from timetable_solver import WEEKDAYS, lesson_times
+from attendance import rebuild_attendance_stats
+
+# Synthetic school for development and benchmarking. Everything is derived
+# from --seed, so the same arguments always produce the same school. Rows
+# are written with batched executemany inserts; the derived counters and
+# rollups are rebuilt at the end exactly as init_db.py does.
+
+SUBJECT_NAMES = [
+    'Matematika', 'Türkmen dili', 'Edebiýat', 'Iňlis dili', 'Rus dili', 'Fizika',
+    'Himiýa', 'Biologiýa', 'Taryh', 'Geografiýa', 'Informatika', 'Bedenterbiýe',
+]
+FIRST_NAMES = ['Aman', 'Merdan', 'Serdar', 'Döwlet', 'Kerim', 'Aýna', 'Maral', 'Jeren', 'Gülşat', 'Bahar',
+               'Myrat', 'Rustam', 'Ogulgerek', 'Aýgül', 'Batyr', 'Dowran', 'Leýli', 'Selbi', 'Ata', 'Näzik']
+LAST_NAMES = ['Öwezow', 'Annaýew', 'Berdiýew', 'Gurbanow', 'Hojaýew', 'Nurýew', 'Orazow', 'Saparow',
+              'Täçmyradow', 'Ýazmyradow', 'Çaryýew', 'Durdyýew']
+STATUSES = (('present', 88), ('late', 5), ('absent', 5), ('excused', 2))
+BATCH_SIZE = 5000
+
+
+def insert_rows(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def person(rng):
+    return '%s %s' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+
+
+def seed_school(classes=12, students_per_class=25, subjects_per_class=8, lessons_per_day=6,
+                days=180, password='password123', seed=1):
+    """Create a school with a year of activity ending today; returns row counts"""
+    rng = random.Random(seed)
+    today = date.today()
+    first_day = today - timedelta(days=days)
+    opened = datetime.combine(first_day, time(7, 0))
+    password_hash = generate_password_hash(password)
+
+    def users(prefix, count, role, **fields):
+        made = [User(username='%s%d' % (prefix, n + 1), password=password_hash, full_name=person(rng),
+                     role=role, created_at=opened, **fields) for n in range(count)]
+        db.session.add_all(made)
+        return made
+
+    if not User.query.filter_by(username='director').first():
+        users('director', 1, 'director')[0].username = 'director'
+    teachers = users('teacher', max(1, classes * subjects_per_class // 6), 'teacher')
+    db.session.flush()
+
+    class_rows = []
+    for n in range(classes):
+        class_rows.append(Class(name='%d%s' % (5 + n // 3, 'ABC'[n % 3]), teacher_id=teachers[n % len(teachers)].id))
+    db.session.add_all(class_rows)
+    db.session.flush()
+
+    # Weekly hours fill the week: the first subjects get the odd lessons
+    week = len(WEEKDAYS) * lessons_per_day
+    subjects = {}
+    for n, class_obj in enumerate(class_rows):
+        subjects[class_obj.id] = [
+            Subject(name=name, class_id=class_obj.id, teacher_id=teachers[(n * subjects_per_class + j) % len(teachers)].id,
+                    weekly_hours=week // subjects_per_class + (j < week % subjects_per_class))
+            for j, name in enumerate(SUBJECT_NAMES[:subjects_per_class])
+        ]
+        db.session.add_all(subjects[class_obj.id])
+
+    students = {}
+    parents = users('parent', classes * students_per_class // 2 + 1, 'parent')
+    db.session.flush()
+    for class_obj in class_rows:
+        students[class_obj.id] = users('student%d_' % class_obj.id, students_per_class, 'student', class_id=class_obj.id)
+    db.session.flush()
+    for n, student in enumerate(s for roster in students.values() for s in roster):
+        student.parent_id = parents[n // 2].id
+    db.session.flush()
+
+    # Weekly timetable: no teacher teaches two classes in the same slot
+    schedule_rows = []
+    for d, day in enumerate(WEEKDAYS):
+        for lesson in range(1, lessons_per_day + 1):
+            busy = set()
+            start_time, end_time = lesson_times(lesson)
+            for c, class_obj in enumerate(class_rows):
+                options = subjects[class_obj.id]
+                offset = d * lessons_per_day + lesson + c
+                for k in range(len(options)):
+                    subject = options[(offset + k) % len(options)]
+                    if subject.teacher_id not in busy:
+                        busy.add(subject.teacher_id)
+                        schedule_rows.append({
+                            'class_id': class_obj.id, 'day_of_week': day, 'lesson_number': lesson,
+                            'subject_id': subject.id, 'start_time': start_time, 'end_time': end_time,
+                        })
+                        break
+    insert_rows(Schedule, schedule_rows)
+
+    holidays = [
+        ('Güýzki dynç alyş', today - timedelta(days=days // 2), today - timedelta(days=days // 2 - 6)),
+        ('Garaşsyzlyk güni', today + timedelta(days=10), today + timedelta(days=11)),
+    ]
+    for name, start, end in holidays:
+        db.session.add(Holiday(name=name, start_date=start, end_date=end))
+
+    def is_school_day(day):
+        return day.weekday() < 6 and not any(start <= day <= end for _, start, end in holidays)
+
+    school_days = [first_day + timedelta(days=n) for n in range(days + 1)]
+    school_days = [day for day in school_days if is_school_day(day)]
+
+    statuses = [status for status, _ in STATUSES]
+    weights = [weight for _, weight in STATUSES]
+    attendance_rows = []
+    grade_rows = []
+    for class_obj in class_rows:
+        class_subjects = subjects[class_obj.id]
+        for student in students[class_obj.id]:
+            marks = rng.choices(statuses, weights, k=len(school_days))
+            attendance_rows.extend(
+                {'student_id': student.id, 'date': day, 'status': status, 'created_at': opened}
+                for day, status in zip(school_days, marks)
+            )
+            # Roughly one grade per subject per week
+            for day in school_days:
+                for subject in class_subjects:
+                    if rng.random() < 1 / 6:
+                        grade_rows.append({
+                            'student_id': student.id, 'subject_id': subject.id,
+                            'grade': rng.choices((2, 3, 4, 5), (5, 25, 40, 30))[0], 'date': day,
+                            'created_at': datetime.combine(day, time(12, 0)),
+                        })
+    insert_rows(Attendance, attendance_rows)
+    insert_rows(Grade, grade_rows)
+
+    director_id = User.query.filter_by(username='director').first().id
+    notification_rows = []
+    all_students = [s for roster in students.values() for s in roster]
+    for day in school_days:
+        sent = datetime.combine(day, time(9, 0))
+        if day.weekday() == 0:
+            notification_rows.append({'sender_id': director_id, 'audience': 'all_students',
+                                      'title': 'Hepdelik habar', 'message': 'Täze hepde başlady.', 'created_at': sent})
+        class_obj = rng.choice(class_rows)
+        notification_rows.append({'sender_id': class_obj.teacher_id, 'audience': 'class', 'class_id': class_obj.id,
+                                  'title': 'Synp habary', 'message': 'Ertir öý işini getirmegi unutmaň.',
+                                  'created_at': sent})
+        student = rng.choice(all_students)
+        notification_rows.append({'sender_id': director_id, 'audience': 'individual', 'receiver_id': student.id,
+                                  'title': 'Şahsy habar', 'message': 'Direktoryň ýanyna geliň.', 'created_at': sent})
+    insert_rows(Notification, notification_rows)
+
+    plan_rows = []
+    for class_subjects in subjects.values():
+        for subject in class_subjects:
+            for week in range(1, days // 7 + 3):
+                plan_rows.append({
+                    'subject_id': subject.id, 'week': week, 'date': first_day + timedelta(weeks=week - 1),
+                    'topic': '%s: %d-nji tema' % (subject.name, week), 'homework': '%d-nji gönükme' % week,
+                    'created_at': opened,
+                })
+    insert_rows(LessonPlan, plan_rows)
+    db.session.commit()
+
+    rebuild_unread_counts()
+    rebuild_grade_stats()
+    rebuild_attendance_stats()
+    return {
+        'classes': len(class_rows),
+        'teachers': len(teachers),
+        'students': len(all_students),
+        'parents': len(parents),
+        'schedules': len(schedule_rows),
+        'attendance': len(attendance_rows),
+        'grades': len(grade_rows),
+        'notifications': len(notification_rows),
+        'lesson_plans': len(plan_rows),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill the database with a synthetic school')
+    parser.add_argument('--classes', type=int, default=12)
+    parser.add_argument('--students-per-class', type=int, default=25)
+    parser.add_argument('--subjects-per-class', type=int, default=8, choices=range(1, len(SUBJECT_NAMES) + 1),
+                        metavar='N')
+    parser.add_argument('--lessons-per-day', type=int, default=6)
+    parser.add_argument('--days', type=int, default=180, help='length of the simulated school year so far')
+    parser.add_argument('--password', default='password123', help='password of every generated user')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true', help='drop all tables first')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+            stamp(revision='base')
+        upgrade()
+        if User.query.filter(User.role != 'director').first():
+            print("The database already has users; use --reset to start from scratch")
+            return 1
+        counts = seed_school(args.classes, args.students_per_class, args.subjects_per_class,
+                             args.lessons_per_day, args.days, args.password, args.seed)
+    for name, count in counts.items():
+        print("✓ %-14s %d" % (name, count))
+    print("\nGenerated users (director, teacher1, parent1, student<class id>_1, ...) share the password '%s'"
+          % args.password)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Concurrency stress test for the database engine profile.
+
+Simulates the morning rush against a throw-away SQLite file: writer threads
+submit attendance and grades class by class while reader threads load the
+student summaries, inboxes and the director statistics. Reports throughput,
+latency percentiles and "database is locked" failures.
+
+    python stress_db.py --writers 8 --readers 16 --seconds 10
+    SQLITE_PRAGMAS=0 python stress_db.py     # same run with SQLite defaults
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from flask_migrate import upgrade
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='SQLite file to use (default: a new temporary file)')
+    parser.add_argument('--writers', type=int, default=8, help='concurrent teachers (one class each)')
+    parser.add_argument('--readers', type=int, default=16, help='concurrent readers')
+    parser.add_argument('--students', type=int, default=30, help='students per class')
+    parser.add_argument('--seconds', type=float, default=10.0, help='duration of the run')
+    return parser.parse_args()
+
+
+def seed(db, models, classes, students_per_class):
+    """Create one teacher, class and three subjects per writer; returns the class rosters"""
+    User, Class, Subject = models.User, models.Class, models.Subject
+    rosters = []
+    for n in range(classes):
+        teacher = User(username='stress_teacher_%d' % n, password='!', full_name='Teacher %d' % n, role='teacher')
+        db.session.add(teacher)
+        db.session.flush()
+        class_obj = Class(name='S-%d' % n, teacher_id=teacher.id)
+        db.session.add(class_obj)
+        db.session.flush()
+        subjects = [Subject(name='Subject %d' % i, class_id=class_obj.id, teacher_id=teacher.id) for i in range(3)]
+        students = [
+            User(username='stress_student_%d_%d' % (n, i), password='!', full_name='Student %d %d' % (n, i),
+                 role='student', class_id=class_obj.id)
+            for i in range(students_per_class)
+        ]
+        db.session.add_all(subjects + students)
+        db.session.flush()
+        rosters.append((teacher.id, [s.id for s in subjects], [s.id for s in students]))
+    db.session.commit()
+    return rosters
+
+
+class Recorder:
+    """Thread-safe collection of per-operation latencies and failures"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def run(self, kind, operation):
+        started = time.perf_counter()
+        try:
+            operation()
+        except Exception as exc:
+            with self._lock:
+                key = (kind, 'database is locked' if 'locked' in str(exc) else type(exc).__name__)
+                self.errors[key] = self.errors.get(key, 0) + 1
+            return False
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.setdefault(kind, []).append(elapsed)
+        return True
+
+
+def main():
+    args = parse_args()
+    path = os.path.abspath(args.database or os.path.join(tempfile.mkdtemp(prefix='edms-stress-'), 'stress.db'))
+    # The engine profile reads the URI at import time
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+
+    from app import app, db
+    import models
+    import attendance
+    import grade_stats
+    import notifications
+    import school_stats
+
+    with app.app_context():
+        upgrade()
+        rosters = seed(db, models, args.writers, args.students)
+        settings = {name: db.session.execute(db.text('PRAGMA %s' % name)).scalar()
+                    for name in ('journal_mode', 'busy_timeout', 'synchronous', 'cache_size')}
+    print('Database: %s' % path)
+    print('Connection settings: %s' % ', '.join('%s=%s' % item for item in settings.items()))
+
+    recorder = Recorder()
+    deadline = time.monotonic() + args.seconds
+    today = date.today()
+    all_students = [student for _, _, students in rosters for student in students]
+
+    def writer(teacher_id, subject_ids, student_ids):
+        rng = random.Random(teacher_id)
+        with app.app_context():
+            while time.monotonic() < deadline:
+                day = today - timedelta(days=rng.randrange(60))
+                marks = {sid: rng.choice(attendance.ATTENDANCE_STATUSES) for sid in student_ids}
+
+                def submit_attendance():
+                    try:
+                        attendance.record_attendance(day, marks)
+                    finally:
+                        db.session.rollback()
+                        db.session.remove()
+
+                def submit_grade():
+                    try:
+                        grade_stats.record_grade(models.Grade(
+                            student_id=rng.choice(student_ids), subject_id=rng.choice(subject_ids),
+                            grade=rng.randint(2, 5), date=day
+                        ))
+                    finally:
+                        db.session.rollback()
+                        db.session.remove()
+
+                recorder.run('attendance write', submit_attendance)
+                recorder.run('grade write', submit_grade)
+
+    def reader(seed_value):
+        rng = random.Random(seed_value)
+        with app.app_context():
+            while time.monotonic() < deadline:
+                student_id = rng.choice(all_students)
+
+                def student_pages():
+                    try:
+                        student = db.session.get(models.User, student_id)
+                        attendance.attendance_summary(student_id)
+                        grade_stats.student_summary(student_id)
+                        notifications.inbox(student).limit(20).all()
+                    finally:
+                        db.session.remove()
+
+                def director_stats():
+                    try:
+                        school_stats._compute(today)
+                    finally:
+                        db.session.remove()
+
+                recorder.run('student read', student_pages)
+                if rng.random() < 0.1:
+                    recorder.run('director read', director_stats)
+
+    threads = [threading.Thread(target=writer, args=roster) for roster in rosters]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(args.readers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    print('\n%-18s %8s %9s %9s %9s %9s' % ('operation', 'ops', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for kind, samples in sorted(recorder.latencies.items()):
+        cuts = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+        print('%-18s %8d %9.1f %9.1f %9.1f %9.1f' % (
+            kind, len(samples), len(samples) / elapsed, cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000))
+    if recorder.errors:
+        print('\nFailures:')
+        for (kind, error), count in sorted(recorder.errors.items()):
+            print('  %-18s %-24s %d' % (kind, error, count))
+    else:
+        print('\nNo failures.')
+    return 1 if recorder.errors else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,136 @@
+import os
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+# The app reads DATABASE_URL on import, so point it at a scratch database first
+_db_dir = tempfile.mkdtemp(prefix='edms-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'edms.db')
+os.environ['LIVE_EVENTS'] = 'poll'
+
+from flask_migrate import upgrade
+
+from app import app as flask_app
+from models import db, User, Class, Subject, Schedule, Attendance, Grade, Notification, LessonPlan, Holiday
+from notifications import rebuild_unread_counts
+from grade_stats import rebuild_grade_stats
+from attendance import rebuild_attendance_stats
+import identity
+import people_search
+import school_calendar
+import school_stats
+import timetable
+
+PASSWORD = 'password123'
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+STATUSES = ['present', 'absent', 'late', 'excused']
+
+
+def _seed():
+    """A small school: 3 classes with 3 subjects each, 4 students per class"""
+    # One hashing round keeps the fixture fast; logins check it like any other hash
+    password = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1')
+    today = date.today()
+
+    director = User(username='director', password=password, full_name='Direktor', role='director')
+    teachers = [User(username=f'teacher{i}', password=password, full_name=f'Mugallym {i}', role='teacher')
+                for i in range(1, 4)]
+    db.session.add(director)
+    db.session.add_all(teachers)
+    db.session.flush()
+
+    classes = [Class(name=f'{grade}A', teacher_id=teacher.id) for grade, teacher in zip((5, 6, 7), teachers)]
+    db.session.add_all(classes)
+    db.session.flush()
+
+    subjects = [Subject(name=f'{name} {class_obj.name}', class_id=class_obj.id, teacher_id=teacher.id)
+                for class_obj in classes
+                for name, teacher in zip(('Matematika', 'Fizika', 'Edebiýat'), teachers)]
+    db.session.add_all(subjects)
+    db.session.flush()
+
+    parents = [User(username=f'parent{i}', password=password, full_name=f'Ene-ata {i}', role='parent')
+               for i in range(1, 7)]
+    db.session.add_all(parents)
+    db.session.flush()
+
+    students = [User(username=f'student{i}', password=password, full_name=f'Okuwçy {i}', role='student',
+                     class_id=classes[i % 3].id, parent_id=parents[i % 6].id if i < 10 else None)
+                for i in range(1, 13)]
+    db.session.add_all(students)
+    db.session.flush()
+
+    for class_obj in classes:
+        class_subjects = [subject for subject in subjects if subject.class_id == class_obj.id]
+        for day in WEEKDAYS:
+            for lesson in range(1, 5):
+                db.session.add(Schedule(class_id=class_obj.id, day_of_week=day, lesson_number=lesson,
+                                        subject_id=class_subjects[lesson % 3].id,
+                                        start_time=f'{7 + lesson:02d}:00', end_time=f'{7 + lesson:02d}:45'))
+
+    for n, student in enumerate(students):
+        class_subjects = [subject for subject in subjects if subject.class_id == student.class_id]
+        for k in range(15):
+            db.session.add(Attendance(student_id=student.id, date=today - timedelta(days=2 * k),
+                                      status=STATUSES[(n + k) % 4]))
+            db.session.add(Grade(student_id=student.id, subject_id=class_subjects[k % 3].id,
+                                 grade=1 + (n + k) % 5, date=today - timedelta(days=k)))
+        for k in range(3):
+            db.session.add(Notification(sender_id=director.id, audience='individual', receiver_id=student.id,
+                                        title=f'Habar {k}', message='Ýatlatma'))
+
+    for subject in subjects:
+        for week in range(1, 4):
+            db.session.add(LessonPlan(subject_id=subject.id, week=week, date=today + timedelta(days=week),
+                                      topic='Tema', homework='Öý işi'))
+    db.session.add(Holiday(name='Dynç alyş', start_date=today + timedelta(days=2), end_date=today + timedelta(days=4)))
+    db.session.commit()
+
+    rebuild_unread_counts()
+    rebuild_grade_stats()
+    rebuild_attendance_stats()
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True, QUERY_BUDGET_STRICT=True)
+    with flask_app.app_context():
+        upgrade()
+        _seed()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def cold_caches():
+    """Start every test with empty in-process caches, as a fresh worker would"""
+    school_stats.invalidate()
+    timetable.invalidate()
+    timetable.invalidate_homework()
+    people_search.invalidate()
+    school_calendar.invalidate()
+
+
+@pytest.fixture
+def login(app):
+    def login(username):
+        client = app.test_client()
+        response = client.post('/login', data={'username': username, 'password': PASSWORD})
+        assert response.status_code == 302, f'login failed for {username}'
+        # Login primes the identity cache; budgets must hold for a cold one
+        identity.clear()
+        return client
+    return login
+
+
+@pytest.fixture
+def ids(app):
+    """Ids the parametrized URLs refer to"""
+    with app.app_context():
+        parent = User.query.filter_by(username='parent1').one()
+        child = User.query.filter_by(role='student', parent_id=parent.id).order_by(User.id).first()
+        return {'class_id': child.class_id, 'user_id': child.id, 'child_id': child.id}
@@ -0,0 +1,89 @@
+from datetime import date
+
+import pytest
+
+import attendance
+from models import db, User, Attendance, AttendanceMonthStat
+
+# A day outside the seeded school year, so the other tests never see these marks
+DAY = date(2020, 3, 10)
+MONTH = date(2020, 3, 1)
+
+
+@pytest.fixture
+def cleanup(app):
+    yield
+    with app.app_context():
+        Attendance.query.filter(Attendance.date == DAY).delete()
+        AttendanceMonthStat.query.filter(AttendanceMonthStat.month == MONTH).delete()
+        db.session.commit()
+
+
+@pytest.fixture
+def ctx(app, cleanup):
+    with app.app_context():
+        yield
+
+
+def _student_id(username):
+    return User.query.filter_by(username=username).one().id
+
+
+def _marks(student_id):
+    return [(mark.id, mark.status) for mark in Attendance.query.filter_by(student_id=student_id, date=DAY)]
+
+
+def _month_stats(student_id):
+    return {stat.status: stat.count
+            for stat in AttendanceMonthStat.query.filter_by(student_id=student_id, month=MONTH)}
+
+
+def test_resubmitting_a_day_updates_the_mark_in_place(ctx):
+    student_id = _student_id('student2')
+    attendance.record_attendance(DAY, {student_id: 'absent'})
+    [(mark_id, _)] = _marks(student_id)
+
+    attendance.record_attendance(DAY, {student_id: 'late'})
+    assert _marks(student_id) == [(mark_id, 'late')]
+
+
+def test_resubmitting_the_same_marks_leaves_the_month_rollup_unchanged(ctx):
+    student_id = _student_id('student2')
+    attendance.record_attendance(DAY, {student_id: 'present'})
+    before = _month_stats(student_id)
+
+    attendance.record_attendance(DAY, {student_id: 'present'})
+    assert _month_stats(student_id) == before == {'present': 1}
+
+
+def test_changing_a_mark_moves_it_between_statuses_in_the_rollup(ctx):
+    student_id = _student_id('student2')
+    attendance.record_attendance(DAY, {student_id: 'present'})
+    attendance.record_attendance(DAY, {student_id: 'excused'})
+    assert _month_stats(student_id) == {'excused': 1}
+
+
+def test_rollup_matches_a_rebuild_after_resubmissions(ctx):
+    students = [_student_id('student2'), _student_id('student5')]
+    attendance.record_attendance(DAY, dict.fromkeys(students, 'absent'))
+    attendance.record_attendance(DAY, {students[0]: 'late'})
+    recorded = {student_id: _month_stats(student_id) for student_id in students}
+
+    attendance.rebuild_attendance_stats()
+    assert {student_id: _month_stats(student_id) for student_id in students} == recorded
+
+
+def test_teacher_resubmitting_the_roll_call_keeps_one_mark(app, cleanup, login):
+    # teacher1 leads 5A, whose students include student3. No app context is
+    # held around the requests, so each one counts its own statements.
+    with app.app_context():
+        student_id = _student_id('student3')
+    client = login('teacher1')
+    for status in ('absent', 'present'):
+        response = client.post('/teacher/attendance', data={
+            'date': DAY.isoformat(), 'student_ids': [str(student_id)], 'status_%d' % student_id: status,
+        })
+        assert response.status_code == 302
+    with app.app_context():
+        assert [status for _, status in _marks(student_id)] == ['present']
+        assert _month_stats(student_id) == {'present': 1}
@@ -0,0 +1,52 @@
+import cache_versions
+import timetable
+from models import db, Class, CacheVersion
+
+
+def _bump_elsewhere(monkeypatch, name):
+    """Move a cache's counter the way another process would, leaving ours alone"""
+    with monkeypatch.context() as patch:
+        patch.setattr(cache_versions, '_invalidators', {})
+        cache_versions.bump(name)
+
+
+def _sync_now(monkeypatch):
+    monkeypatch.setattr(cache_versions, '_checked_at', float('-inf'))
+    cache_versions.sync()
+
+
+def test_bump_in_another_process_clears_the_cache(app, monkeypatch):
+    with app.app_context():
+        class_id = Class.query.first().id
+        _sync_now(monkeypatch)
+        timetable.class_day(class_id, 'Monday')
+        assert len(timetable._timetable_cache) == 1
+
+        _bump_elsewhere(monkeypatch, 'timetable')
+        cache_versions.sync()
+        assert len(timetable._timetable_cache) == 1, 'checked again before CHECK_SECONDS'
+
+        _sync_now(monkeypatch)
+        assert len(timetable._timetable_cache) == 0
+
+
+def test_bump_clears_the_cache_in_this_process(app):
+    with app.app_context():
+        timetable.class_day(Class.query.first().id, 'Monday')
+        cache_versions.bump('timetable')
+        assert len(timetable._timetable_cache) == 0
+
+
+def test_version_check_is_not_counted_against_the_budget(app, login, monkeypatch):
+    client = login('student1')
+    client.get('/events/poll')  # loads the identity the login fixture cleared
+    # A warm poll is the unread badge alone; the version check must not add to it
+    monkeypatch.setattr(app.view_functions['event_poll'], 'query_budget', 1)
+    monkeypatch.setattr(cache_versions, '_checked_at', float('-inf'))
+    assert client.get('/events/poll').status_code == 200
+
+
+def test_every_shared_cache_has_a_counter_row(app):
+    # A missing row costs bump() two extra statements on the writing route
+    with app.app_context():
+        assert set(cache_versions._invalidators) <= set(db.session.scalars(db.select(CacheVersion.name)))
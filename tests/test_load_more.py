@@ -0,0 +1,20 @@
+from flask import render_template
+
+
+def _render(app, url, next_cursor):
+    with app.test_request_context(url):
+        return render_template('components/load_more.html', next_cursor=next_cursor, load_more_target='#rows')
+
+
+def test_next_page_link_keeps_the_filters_and_replaces_the_cursor(app):
+    html = _render(app, '/director/users?role=student&class_id=1&class_id=2&after=old', 'next')
+    assert 'href="/director/users?role=student&amp;class_id=1&amp;class_id=2&amp;after=next"' in html
+
+
+def test_next_page_link_keeps_the_view_args(app):
+    html = _render(app, '/parent/child/5/attendance?after=old', 'next')
+    assert 'href="/parent/child/5/attendance?after=next"' in html
+
+
+def test_last_page_has_no_link(app):
+    assert _render(app, '/director/users?role=student', None).strip() == ''
@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import archive
+import notifications
+from models import db, User, Class, Notification, NotificationRead, ArchivedYear
+
+
+@pytest.fixture
+def ctx(app):
+    """App context that removes the notifications and users a test adds"""
+    with app.app_context():
+        last_notification = db.session.query(db.func.max(Notification.id)).scalar() or 0
+        last_user = db.session.query(db.func.max(User.id)).scalar()
+        yield
+        db.session.rollback()
+        added = Notification.id > last_notification
+        NotificationRead.query.filter(
+            NotificationRead.notification_id.in_(db.select(Notification.id).where(added))
+        ).delete(synchronize_session=False)
+        Notification.query.filter(added).delete(synchronize_session=False)
+        User.query.filter(User.id > last_user).delete(synchronize_session=False)
+        ArchivedYear.query.delete()
+        notifications.rebuild_unread_counts()
+
+
+def _user(username):
+    return User.query.filter_by(username=username).one()
+
+
+def _class(name):
+    return Class.query.filter_by(name=name).one()
+
+
+def _new_student(class_id, username, created_at=None):
+    student = User(username=username, password='-', full_name=username, role='student',
+                   class_id=class_id, created_at=created_at or datetime.utcnow())
+    db.session.add(student)
+    db.session.commit()
+    return student
+
+
+def _counter(user):
+    db.session.expire_all()
+    return db.session.get(User, user.id).unread_notifications
+
+
+def _recomputed(user):
+    """The counter as recompute_unread_counts() derives it from notifications and receipts"""
+    notifications.recompute_unread_counts([user.id])
+    db.session.commit()
+    return _counter(user)
+
+
+def _send_to_class(class_id, title='Synp ýygnagy'):
+    director = _user('director')
+    return notifications.send_notification(director.id, title, 'Ertir', 'class', class_id=class_id)
+
+
+def test_class_broadcast_reaches_the_class_only(ctx):
+    fifth, sixth = _class('5A'), _class('6A')
+    inside = _new_student(fifth.id, 'inside')
+    outside = _new_student(sixth.id, 'outside')
+
+    reached = _send_to_class(fifth.id)
+    assert reached == User.query.filter_by(role='student', class_id=fifth.id).count()
+
+    assert [n.title for n in notifications.inbox(inside)] == ['Synp ýygnagy']
+    assert notifications.inbox(outside).all() == []
+    assert _counter(inside) == _recomputed(inside) == 1
+    assert _counter(outside) == _recomputed(outside) == 0
+
+
+def test_student_created_after_a_broadcast_does_not_see_it(ctx):
+    fifth = _class('5A')
+    _send_to_class(fifth.id)
+    sent_at = Notification.query.order_by(Notification.id.desc()).first().created_at
+
+    newcomer = _new_student(fifth.id, 'newcomer', created_at=sent_at + timedelta(seconds=1))
+    assert notifications.inbox(newcomer).all() == []
+    assert _recomputed(newcomer) == 0
+    assert not notifications.mark_read(Notification.query.order_by(Notification.id.desc()).first().id, newcomer)
+
+
+def test_mark_read_records_one_receipt_and_never_goes_negative(ctx):
+    student = _new_student(_class('5A').id, 'reader')
+    _send_to_class(student.class_id)
+    notification = notifications.inbox(student).first()
+
+    assert notifications.mark_read(notification.id, student)
+    assert not notifications.mark_read(notification.id, student)
+    assert NotificationRead.query.filter_by(notification_id=notification.id, user_id=student.id).count() == 1
+    assert notifications.inbox(student).first().is_read
+    assert _counter(student) == 0
+
+    # A counter already at zero (drifted) stays at zero on the next read
+    _send_to_class(student.class_id, 'Ikinji')
+    User.query.filter_by(id=student.id).update({User.unread_notifications: 0})
+    db.session.commit()
+    assert notifications.mark_read(notifications.inbox(student).first().id, student)
+    assert _counter(student) == 0
+
+
+def test_mark_all_read_clears_the_counter(ctx):
+    student = _new_student(_class('5A').id, 'skimmer')
+    director = _user('director')
+    _send_to_class(student.class_id)
+    notifications.send_notification(director.id, 'Şahsy', 'Salam', 'individual', receiver_id=student.id)
+    notifications.send_notification(director.id, 'Hemmä', 'Salam', 'all_students')
+    assert _counter(student) == 3
+
+    assert notifications.mark_all_read(student) == 3
+    assert _counter(student) == _recomputed(student) == 0
+    assert all(n.is_read for n in notifications.inbox(student))
+    assert notifications.mark_all_read(student) == 0
+
+
+def test_archiving_a_year_drops_its_notifications_from_the_counter(ctx):
+    student = _new_student(_class('5A').id, 'archived', created_at=datetime(2023, 9, 1))
+    director = _user('director')
+    notifications.send_notification(director.id, 'Köne', 'Geçen ýyl', 'individual', receiver_id=student.id)
+    notifications.send_notification(director.id, 'Täze', 'Şu ýyl', 'individual', receiver_id=student.id)
+    old = Notification.query.filter_by(title='Köne', receiver_id=student.id).one()
+    old.created_at = datetime(2023, 10, 1)
+    db.session.commit()
+    assert _counter(student) == 2
+
+    moved = archive.archive_year(2023)
+    assert moved['notifications'] == 1
+    assert [n.title for n in notifications.inbox(student)] == ['Täze']
+    assert _counter(student) == _recomputed(student) == 1
@@ -0,0 +1,68 @@
+import pytest
+
+from queries import QueryBudgetExceeded
+
+# Every budgeted page, fetched as the role it serves. The app runs with
+# QUERY_BUDGET_STRICT, so a route issuing more statements than its
+# @query_budget fails the request with QueryBudgetExceeded.
+ROUTES = [
+    ('director', '/director/dashboard'),
+    ('director', '/director/users'),
+    ('director', '/director/user/create'),
+    ('director', '/director/user/edit/{user_id}'),
+    ('director', '/director/classes'),
+    ('director', '/director/subjects'),
+    ('director', '/director/schedules'),
+    ('director', '/director/schedule/{class_id}'),
+    ('director', '/director/schedule/{class_id}/week'),
+    ('director', '/director/parents'),
+    ('director', '/director/holidays'),
+    ('director', '/director/notifications'),
+    ('director', '/director/metrics'),
+    ('director', '/exports'),
+    ('director', '/api/people/search?q=Okuw&role=student'),
+    ('director', '/events/poll'),
+    ('teacher1', '/teacher/dashboard'),
+    ('teacher1', '/teacher/students'),
+    ('teacher1', '/teacher/attendance'),
+    ('teacher1', '/teacher/grades'),
+    ('teacher1', '/teacher/lesson-plans'),
+    ('teacher1', '/teacher/schedule'),
+    ('teacher1', '/teacher/notifications'),
+    ('teacher1', '/exports'),
+    ('teacher1', '/api/lessons/today'),
+    ('teacher1', '/api/people/search?q=Okuw'),
+    ('student1', '/student/dashboard'),
+    ('student1', '/student/grades'),
+    ('student1', '/student/attendance'),
+    ('student1', '/student/lesson-plans'),
+    ('student1', '/student/schedule'),
+    ('student1', '/student/notifications'),
+    ('student1', '/api/lessons/today'),
+    ('student1', '/events/poll'),
+    ('parent1', '/parent/dashboard'),
+    ('parent1', '/parent/child/{child_id}/grades'),
+    ('parent1', '/parent/child/{child_id}/attendance'),
+    ('parent1', '/parent/child/{child_id}/report-card'),
+]
+
+
+@pytest.mark.parametrize('username,url', ROUTES)
+def test_route_stays_within_query_budget(login, ids, username, url):
+    response = login(username).get(url.format(**ids))
+    assert response.status_code == 200
+
+
+def test_every_budgeted_page_is_covered(app):
+    covered = {app.url_map.bind('localhost').match(url.split('?')[0].format(user_id=1, class_id=1, child_id=1))[0]
+               for _, url in ROUTES}
+    budgeted = {rule.endpoint for rule in app.url_map.iter_rules()
+                if 'GET' in rule.methods and hasattr(app.view_functions[rule.endpoint], 'query_budget')}
+    assert budgeted <= covered
+
+
+def test_strict_mode_raises_over_budget(app, login, monkeypatch):
+    client = login('director')
+    monkeypatch.setattr(app.view_functions['director_dashboard'], 'query_budget', 0)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/director/dashboard')
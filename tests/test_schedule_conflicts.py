@@ -0,0 +1,46 @@
+from schedule_conflicts import IntervalIndex, Slot, find_conflicts, to_minutes
+
+
+def _slot(class_id, teacher_id, day, lesson_number, start, end, slot_id=None):
+    return Slot(slot_id, class_id, teacher_id, class_id * 10 + teacher_id, day, lesson_number,
+                to_minutes(start), to_minutes(end), '%dA' % class_id, 'Ders', 'Mugallym %d' % teacher_id)
+
+
+def test_interval_index_treats_intervals_as_half_open():
+    index = IntervalIndex()
+    first = _slot(1, 1, 'Monday', 1, '08:00', '08:45')
+    second = _slot(1, 1, 'Monday', 2, '08:55', '09:40')
+    index.add('key', second)
+    index.add('key', first)
+
+    assert index.overlapping('key', to_minutes('08:45'), to_minutes('08:55')) == []
+    assert index.overlapping('key', to_minutes('08:30'), to_minutes('09:00')) == [first, second]
+    assert index.overlapping('key', to_minutes('09:39'), to_minutes('10:00')) == [second]
+    assert index.overlapping('other', 0, 24 * 60) == []
+
+
+def test_teacher_in_two_classes_at_overlapping_times():
+    existing = [_slot(1, 7, 'Monday', 1, '08:00', '08:45', slot_id=1)]
+    new = _slot(2, 7, 'Monday', 1, '08:40', '09:25')
+    assert [(slot, other.id, kind) for slot, other, kind in find_conflicts([new], existing)] == [
+        (new, 1, 'teacher')
+    ]
+
+
+def test_back_to_back_lessons_do_not_conflict():
+    week = [_slot(1, 7, 'Monday', 1, '08:00', '08:45'), _slot(2, 7, 'Monday', 2, '08:45', '09:30'),
+            _slot(1, 8, 'Monday', 2, '08:45', '09:30'), _slot(1, 7, 'Tuesday', 1, '08:00', '08:45')]
+    assert find_conflicts(week) == []
+
+
+def test_class_overlaps_and_repeated_lesson_numbers():
+    first = _slot(1, 7, 'Monday', 1, '08:00', '08:45')
+    overlapping = _slot(1, 8, 'Monday', 2, '08:30', '09:15')
+    same_number = _slot(1, 9, 'Monday', 1, '10:00', '10:45')
+    kinds = [(slot, other, kind) for slot, other, kind in find_conflicts([first, overlapping, same_number])]
+    assert kinds == [(overlapping, first, 'class'), (same_number, first, 'lesson')]
+
+
+def test_lesson_ending_before_it_starts():
+    backwards = _slot(1, 7, 'Monday', 1, '09:00', '08:15')
+    assert find_conflicts([backwards]) == [(backwards, None, 'time')]
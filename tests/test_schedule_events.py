@@ -0,0 +1,35 @@
+from sqlalchemy import select
+
+import events
+from models import db, Schedule, Subject
+
+
+def test_deleted_lesson_is_published_after_the_commit(app, login, monkeypatch):
+    with app.app_context():
+        schedule = Schedule.query.order_by(Schedule.id.desc()).first()
+        teacher_id = db.session.get(Subject, schedule.subject_id).teacher_id
+        lesson = dict(class_id=schedule.class_id, day_of_week=schedule.day_of_week,
+                      lesson_number=schedule.lesson_number, subject_id=schedule.subject_id,
+                      start_time=schedule.start_time, end_time=schedule.end_time)
+        schedule_id = schedule.id
+
+    published = []
+
+    def publish(channel, kind, payload):
+        # A separate connection only sees committed rows
+        with db.engine.connect() as connection:
+            row = connection.execute(select(Schedule.id).where(Schedule.id == schedule_id)).first()
+        published.append((channel, kind, payload, row is None))
+
+    monkeypatch.setattr(events, 'publish', publish)
+    client = login('director')
+    try:
+        response = client.post('/director/schedule/delete/%d' % schedule_id)
+        assert response.status_code == 302
+        day = {'day': lesson['day_of_week']}
+        assert published == [('class:%d' % lesson['class_id'], 'schedule', day, True),
+                             ('teacher:%d' % teacher_id, 'schedule', day, True)]
+    finally:
+        with app.app_context():
+            db.session.add(Schedule(**lesson))
+            db.session.commit()
@@ -0,0 +1,75 @@
+from collections import Counter
+
+import timetable_solver
+from schedule_conflicts import Slot, find_conflicts, to_minutes, WEEKDAYS
+
+
+def _problem(units, days=2, lessons_per_day=4, fixed=None, blocked=None):
+    return {
+        'lessons_per_day': lessons_per_day,
+        'slot_count': days * lessons_per_day,
+        'units': units,
+        'fixed': fixed or {},
+        'blocked': {teacher_id: frozenset(slots) for teacher_id, slots in (blocked or {}).items()},
+    }
+
+
+def _double_bookings(problem, result):
+    """(class, slot) and (teacher, slot) pairs holding more than one lesson"""
+    classes, teachers = Counter(), Counter()
+    for unit, slot in result['slots'].items():
+        _, class_id, teacher_id = problem['units'][unit]
+        classes[class_id, slot] += 1
+        teachers[teacher_id, slot] += 1
+    return [('class',) + key for key, count in classes.items() if count > 1] + \
+        [('teacher',) + key for key, count in teachers.items() if count > 1]
+
+
+def test_solved_timetable_has_no_double_bookings():
+    # Three classes sharing three teachers, 6 of the 8 slots of each class filled
+    units = [(class_id * 10 + teacher_id, class_id, teacher_id)
+             for class_id in (1, 2, 3) for teacher_id in (1, 2, 3) for _ in range(2)]
+    problem = _problem(units)
+    result = timetable_solver.solve(problem, attempts=2, workers=1)
+
+    assert result['unplaced'] == []
+    assert len(result['slots']) == len(units)
+    assert _double_bookings(problem, result) == []
+
+
+def test_solver_keeps_pinned_lessons_and_blocked_slots():
+    units = [(11, 1, 1), (11, 1, 1), (21, 2, 1), (22, 2, 2)]
+    problem = _problem(units, fixed={0: 0}, blocked={1: {1, 2, 3}})
+    result = timetable_solver.solve(problem, attempts=2, workers=1)
+
+    assert result['unplaced'] == []
+    assert 0 not in result['slots']
+    assert not {slot for unit, slot in result['slots'].items() if units[unit][2] == 1} & {0, 1, 2, 3}
+    assert _double_bookings(problem, result) == []
+
+
+def test_overfull_teacher_is_reported_not_double_booked():
+    # One teacher, two slots, three lessons: one cannot be placed
+    units = [(11, 1, 1), (21, 2, 1), (31, 3, 1)]
+    problem = _problem(units, days=1, lessons_per_day=2)
+    result = timetable_solver.solve(problem, attempts=2, workers=1)
+
+    assert len(result['unplaced']) == 1
+    assert _double_bookings(problem, result) == []
+
+
+def test_school_timetable_passes_the_conflict_checker(app):
+    with app.app_context():
+        problem, _ = timetable_solver.build_problem()
+    result = timetable_solver.solve(problem, attempts=2, workers=1)
+    assert result['unplaced'] == []
+
+    per_day = problem['lessons_per_day']
+    slots = []
+    for unit, slot in result['slots'].items():
+        subject_id, class_id, teacher_id = problem['units'][unit]
+        day, lesson = divmod(slot, per_day)
+        start, end = timetable_solver.lesson_times(lesson + 1)
+        slots.append(Slot(None, class_id, teacher_id, subject_id, WEEKDAYS[day], lesson + 1,
+                          to_minutes(start), to_minutes(end), '', '', ''))
+    assert find_conflicts(slots) == []
@@ -0,0 +1,120 @@
+from datetime import timedelta
+
+from jinja2.utils import htmlsafe_json_dumps
+
+import cache_versions
+import queries
+from cache import TTLCache
+from models import LessonPlan
+
+# Daily timetable cache
+#
+# The live lesson widget on the teacher and student dashboards embeds the
+# day's lessons as JSON. The timetable only changes when the director edits
+# it, so the lessons and their serialized payload are cached per (class,
+# weekday) and per (teacher, weekday) and dropped whenever schedules,
+# subjects, classes or teacher names change, in every process, through
+# cache_versions.bump('timetable').
+#
+# Homework for the widget comes from the latest lesson plan of each subject
+# dated on or before the lesson day; it is cached per (subjects, day) and
+# dropped by cache_versions.bump('homework') when a plan is created.
+
+HOMEWORK_LOOKBACK_DAYS = 14
+
+_timetable_cache = TTLCache(maxsize=4096, ttl=24 * 3600)
+_homework_cache = TTLCache(maxsize=4096, ttl=3600)
+
+
+def serialize_lessons(schedules):
+    """JSON-ready form of timetable slots, as the live lesson widget expects"""
+    return [{
+        'id': schedule.id,
+        'lesson_number': schedule.lesson_number,
+        'start_time': schedule.start_time,
+        'end_time': schedule.end_time,
+        'subject': {
+            'id': schedule.subject.id,
+            'name': schedule.subject.name,
+            'teacher': {
+                'id': schedule.subject.teacher.id,
+                'full_name': schedule.subject.teacher.full_name
+            }
+        },
+        'class': {
+            'id': schedule.class_obj.id,
+            'name': schedule.class_obj.name
+        }
+    } for schedule in schedules]
+
+
+def _cached_day(key, load):
+    entry = _timetable_cache.get(key)
+    if entry is None:
+        lessons = serialize_lessons(load().all())
+        entry = {'lessons': lessons, 'json': htmlsafe_json_dumps(lessons)}
+        _timetable_cache.set(key, entry)
+    return entry
+
+
+def _class_entry(class_id, day_name):
+    return _cached_day(('class', class_id, day_name),
+                       lambda: queries.schedules_with_subject(class_id=class_id, day_of_week=day_name))
+
+
+def _teacher_entry(teacher_id, day_name):
+    return _cached_day(('teacher', teacher_id, day_name),
+                       lambda: queries.schedules_with_subject(teacher_id=teacher_id, day_of_week=day_name))
+
+
+def class_day(class_id, day_name):
+    """Serialized lessons of a class on a weekday"""
+    return _class_entry(class_id, day_name)['json']
+
+
+def teacher_day(teacher_id, day_name):
+    """Serialized lessons a teacher gives on a weekday"""
+    return _teacher_entry(teacher_id, day_name)['json']
+
+
+def class_lessons(class_id, day_name):
+    """Lessons of a class on a weekday (shared, do not modify)"""
+    return _class_entry(class_id, day_name)['lessons']
+
+
+def teacher_lessons(teacher_id, day_name):
+    """Lessons a teacher gives on a weekday (shared, do not modify)"""
+    return _teacher_entry(teacher_id, day_name)['lessons']
+
+
+def homework_for(subject_ids, day):
+    """Homework text by subject id, from each subject's latest plan up to ``day``"""
+    key = (tuple(sorted(subject_ids)), day)
+    homework = _homework_cache.get(key)
+    if homework is None:
+        homework = {}
+        if subject_ids:
+            plans = LessonPlan.query.filter(
+                LessonPlan.subject_id.in_(subject_ids),
+                LessonPlan.homework.isnot(None),
+                LessonPlan.date <= day,
+                LessonPlan.date >= day - timedelta(days=HOMEWORK_LOOKBACK_DAYS)
+            ).order_by(LessonPlan.date.desc(), LessonPlan.id.desc()).all()
+            for plan in plans:
+                homework.setdefault(plan.subject_id, plan.homework)
+        _homework_cache.set(key, homework)
+    return homework
+
+
+def invalidate():
+    """Drop every cached day in this process"""
+    _timetable_cache.clear()
+
+
+def invalidate_homework():
+    """Drop cached homework in this process"""
+    _homework_cache.clear()
+
+
+cache_versions.register('timetable', invalidate)
+cache_versions.register('homework', invalidate_homework)
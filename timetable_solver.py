@@ -0,0 +1,376 @@
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+
+import cache_versions
+from models import db, Subject, Schedule, TeacherUnavailability
+from schedule_conflicts import WEEKDAYS
+
+# Timetable generation
+#
+# Every subject needs Subject.weekly_hours lessons a week. A lesson goes into
+# a slot (day, lesson number) where its class and its teacher are both free
+# and the teacher is not marked unavailable (TeacherUnavailability). Softer
+# wishes are scored: a subject at most once a day, and lessons packed at the
+# start of the day without gaps.
+#
+# The search is a randomized greedy placement, hardest teachers first,
+# followed by repair: a lesson with no free slot either moves the lessons
+# blocking a slot elsewhere, or evicts them and puts them back on the queue.
+# The result depends on the random seed, so several seeds are searched at
+# once in a process pool and the best timetable wins (fewest unplaced
+# lessons, then lowest score). A complete timetable is then polished by
+# moving or swapping lessons within each class while the score drops.
+# Workers get plain tuples and need no database.
+#
+# An incremental re-solve (after a teacher's availability changes) keeps
+# every other lesson where it is and only re-places that teacher's lessons,
+# widening to all lessons of the teacher's classes if that is not enough.
+# Either way the old rows are replaced in a single transaction.
+
+LESSONS_PER_DAY = 6
+FIRST_LESSON = '08:00'
+LESSON_MINUTES = 45
+BREAK_MINUTES = 10
+ATTEMPTS = 8
+STEPS_PER_LESSON = 50
+IMPROVE_ROUNDS = 2
+
+
+def lesson_times(lesson_number):
+    """Start and end ("HH:MM") of a lesson in the bell schedule"""
+    start = datetime.strptime(FIRST_LESSON, '%H:%M') + timedelta(
+        minutes=(LESSON_MINUTES + BREAK_MINUTES) * (lesson_number - 1))
+    return start.strftime('%H:%M'), (start + timedelta(minutes=LESSON_MINUTES)).strftime('%H:%M')
+
+
+class _Search:
+    """One randomized search over a problem built by build_problem()"""
+
+    def __init__(self, problem, seed):
+        self.rng = random.Random(seed)
+        self.per_day = problem['lessons_per_day']
+        self.slot_count = problem['slot_count']
+        self.units = problem['units']
+        self.fixed = problem['fixed']
+        self.blocked = problem['blocked']
+        self.slot_of = {}
+        self.class_at = {}
+        self.teacher_at = {}
+        self.subject_days = Counter()
+
+    def assign(self, unit, slot):
+        subject_id, class_id, teacher_id = self.units[unit]
+        self.slot_of[unit] = slot
+        self.class_at[class_id, slot] = unit
+        self.teacher_at[teacher_id, slot] = unit
+        self.subject_days[subject_id, slot // self.per_day] += 1
+
+    def unassign(self, unit):
+        subject_id, class_id, teacher_id = self.units[unit]
+        slot = self.slot_of.pop(unit)
+        del self.class_at[class_id, slot]
+        del self.teacher_at[teacher_id, slot]
+        self.subject_days[subject_id, slot // self.per_day] -= 1
+
+    def allowed(self, unit):
+        """Slots the unit's teacher can teach in"""
+        blocked = self.blocked.get(self.units[unit][2], ())
+        return [slot for slot in range(self.slot_count) if slot not in blocked]
+
+    def blockers(self, unit, slot):
+        _, class_id, teacher_id = self.units[unit]
+        return {self.class_at.get((class_id, slot)), self.teacher_at.get((teacher_id, slot))} - {None}
+
+    def best_slot(self, unit):
+        """Cheapest free slot for the unit, or None"""
+        subject_id = self.units[unit][0]
+        best = None
+        for slot in self.allowed(unit):
+            if self.blockers(unit, slot):
+                continue
+            day, lesson = divmod(slot, self.per_day)
+            cost = self.subject_days[subject_id, day] * self.per_day + lesson + self.rng.random()
+            if best is None or cost < best[0]:
+                best = (cost, slot)
+        return best[1] if best else None
+
+    def relocate(self, unit):
+        """Free a slot for the unit by moving the lessons that block it"""
+        slots = self.allowed(unit)
+        self.rng.shuffle(slots)
+        for slot in slots:
+            blocking = self.blockers(unit, slot)
+            if any(other in self.fixed for other in blocking):
+                continue
+            for other in blocking:
+                self.unassign(other)
+            self.assign(unit, slot)
+            moved = []
+            for other in blocking:
+                target = self.best_slot(other)
+                if target is None:
+                    break
+                self.assign(other, target)
+                moved.append(other)
+            else:
+                return True
+            for other in moved:
+                self.unassign(other)
+            self.unassign(unit)
+            for other in blocking:
+                self.assign(other, slot)
+        return False
+
+    def kick(self, unit):
+        """Take a random slot, evicting its lessons; returns them or None"""
+        options = [slot for slot in self.allowed(unit)
+                   if not any(other in self.fixed for other in self.blockers(unit, slot))]
+        if not options:
+            return None
+        slot = self.rng.choice(options)
+        evicted = list(self.blockers(unit, slot))
+        for other in evicted:
+            self.unassign(other)
+        self.assign(unit, slot)
+        return evicted
+
+    def _day_score(self, class_id, subject_ids, days):
+        """Soft score of a class on some days, for the subjects being moved"""
+        score = 0
+        for day in days:
+            lessons = [lesson for lesson in range(self.per_day)
+                       if (class_id, day * self.per_day + lesson) in self.class_at]
+            score += max(lessons) + 1 - len(lessons) if lessons else 0
+            score += sum(max(self.subject_days[subject_id, day] - 1, 0) for subject_id in subject_ids) * self.per_day
+        return score
+
+    def improve(self):
+        """Move or swap lessons within their class while that lowers the soft score"""
+        for unit in list(self.slot_of):
+            if unit in self.fixed:
+                continue
+            subject_id, class_id, teacher_id = self.units[unit]
+            for target in self.allowed(unit):
+                slot = self.slot_of[unit]
+                if target // self.per_day == slot // self.per_day:
+                    continue
+                other = self.class_at.get((class_id, target))
+                if other in self.fixed:
+                    continue
+                moving = {subject_id} if other is None else {subject_id, self.units[other][0]}
+                days = {slot // self.per_day, target // self.per_day}
+                before = self._day_score(class_id, moving, days)
+                self.unassign(unit)
+                if other is not None:
+                    self.unassign(other)
+                fits = not self.blockers(unit, target) and (
+                    other is None or (slot in self.allowed(other) and not self.blockers(other, slot)))
+                if fits:
+                    self.assign(unit, target)
+                    if other is not None:
+                        self.assign(other, slot)
+                    if self._day_score(class_id, moving, days) < before:
+                        continue
+                    self.unassign(unit)
+                    if other is not None:
+                        self.unassign(other)
+                self.assign(unit, slot)
+                if other is not None:
+                    self.assign(other, target)
+
+    def penalty(self, slot_of):
+        """Soft score: repeated subjects in a day plus gaps in class days"""
+        per_subject = Counter()
+        per_class = {}
+        for unit, slot in slot_of.items():
+            subject_id, class_id, _ = self.units[unit]
+            day, lesson = divmod(slot, self.per_day)
+            per_subject[subject_id, day] += 1
+            per_class.setdefault((class_id, day), set()).add(lesson)
+        repeats = sum(count - 1 for count in per_subject.values() if count > 1)
+        gaps = sum(max(lessons) + 1 - len(lessons) for lessons in per_class.values())
+        return repeats * self.per_day + gaps
+
+    def run(self):
+        for unit, slot in self.fixed.items():
+            self.assign(unit, slot)
+        load = Counter(teacher_id for _, _, teacher_id in self.units)
+        free = [unit for unit in range(len(self.units)) if unit not in self.fixed]
+        randomness = {unit: self.rng.random() for unit in free}
+        # Hardest first: busy teachers with few allowed slots; popped from the end
+        free.sort(key=lambda unit: (len(self.allowed(unit)) - load[self.units[unit][2]], randomness[unit]),
+                  reverse=True)
+
+        pending = free
+        stuck = []
+        best = None
+        for _ in range(STEPS_PER_LESSON * len(free)):
+            if not pending:
+                break
+            unit = pending.pop()
+            slot = self.best_slot(unit)
+            if slot is not None:
+                self.assign(unit, slot)
+            elif not self.relocate(unit):
+                evicted = self.kick(unit)
+                if evicted is None:
+                    stuck.append(unit)
+                    continue
+                pending.extend(evicted)
+                if best is None or len(pending) + len(stuck) < best[0]:
+                    best = (len(pending) + len(stuck), dict(self.slot_of))
+
+        slot_of = self.slot_of
+        if best is not None and best[0] < len(pending) + len(stuck):
+            slot_of = best[1]
+        else:
+            for _ in range(IMPROVE_ROUNDS):
+                self.improve()
+        slots = {unit: slot for unit, slot in slot_of.items() if unit not in self.fixed}
+        return {
+            'slots': slots,
+            'unplaced': [unit for unit in free if unit not in slots],
+            'penalty': self.penalty(slot_of),
+        }
+
+
+def search(problem, seed):
+    """Run one seeded search; the unit of work of the process pool"""
+    return dict(_Search(problem, seed).run(), seed=seed)
+
+
+def solve(problem, attempts=ATTEMPTS, workers=None, seed=0):
+    """Search ``attempts`` seeds, in parallel unless workers == 1, and return the best result"""
+    seeds = [seed + n for n in range(attempts)]
+    if attempts == 1 or workers == 1:
+        results = [search(problem, s) for s in seeds]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(search, [problem] * attempts, seeds))
+    return min(results, key=lambda result: (len(result['unplaced']), result['penalty'], result['seed']))
+
+
+def build_problem(days=WEEKDAYS, lessons_per_day=LESSONS_PER_DAY, free_subject_ids=None):
+    """Solver input for the whole school.
+
+    With ``free_subject_ids`` only those subjects are (re)placed and every
+    other timetabled lesson is pinned to its current slot. Returns the
+    problem and the ids of the Schedule rows it replaces (None for all).
+    """
+    days = list(days)
+    subjects = db.session.execute(
+        select(Subject.id, Subject.class_id, Subject.teacher_id, Subject.weekly_hours).order_by(Subject.id)
+    ).all()
+    teacher_of = {subject.id: subject.teacher_id for subject in subjects}
+
+    units = []
+    fixed = {}
+    replaced = None
+    if free_subject_ids is not None:
+        replaced = []
+        for row in db.session.execute(select(
+            Schedule.id, Schedule.subject_id, Schedule.class_id, Schedule.day_of_week, Schedule.lesson_number
+        ).order_by(Schedule.id)):
+            if row.subject_id in free_subject_ids:
+                replaced.append(row.id)
+            elif row.subject_id in teacher_of and row.day_of_week in days and 1 <= row.lesson_number <= lessons_per_day:
+                fixed[len(units)] = days.index(row.day_of_week) * lessons_per_day + row.lesson_number - 1
+                units.append((row.subject_id, row.class_id, teacher_of[row.subject_id]))
+    for subject in subjects:
+        if free_subject_ids is None or subject.id in free_subject_ids:
+            units.extend([(subject.id, subject.class_id, subject.teacher_id)] * subject.weekly_hours)
+
+    blocked = {}
+    for row in db.session.execute(select(TeacherUnavailability)).scalars():
+        if row.day_of_week in days and 1 <= row.lesson_number <= lessons_per_day:
+            slot = days.index(row.day_of_week) * lessons_per_day + row.lesson_number - 1
+            blocked.setdefault(row.teacher_id, set()).add(slot)
+
+    problem = {
+        'lessons_per_day': lessons_per_day,
+        'slot_count': len(days) * lessons_per_day,
+        'units': units,
+        'fixed': fixed,
+        'blocked': {teacher_id: frozenset(slots) for teacher_id, slots in blocked.items()},
+    }
+    return problem, replaced
+
+
+def _write(problem, result, days, replaced):
+    """Replace the old rows with the solution in one transaction"""
+    per_day = problem['lessons_per_day']
+    rows = []
+    for unit, slot in sorted(result['slots'].items(), key=lambda item: item[1]):
+        subject_id, class_id, _ = problem['units'][unit]
+        day, lesson = divmod(slot, per_day)
+        start_time, end_time = lesson_times(lesson + 1)
+        rows.append({
+            'class_id': class_id, 'day_of_week': days[day], 'lesson_number': lesson + 1,
+            'subject_id': subject_id, 'start_time': start_time, 'end_time': end_time,
+        })
+    try:
+        if replaced is None:
+            db.session.execute(delete(Schedule))
+        elif replaced:
+            db.session.execute(delete(Schedule).where(Schedule.id.in_(replaced)))
+        if rows:
+            db.session.execute(insert(Schedule), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    cache_versions.bump('timetable')
+    return len(rows)
+
+
+def _report(problem, result, written):
+    return {
+        'lessons': len(result['slots']),
+        'written': written,
+        'unplaced': [problem['units'][unit] for unit in result['unplaced']],
+        'penalty': result['penalty'],
+        'seed': result['seed'],
+    }
+
+
+def generate(days=WEEKDAYS, lessons_per_day=LESSONS_PER_DAY, attempts=ATTEMPTS, workers=None, seed=0,
+             dry_run=False):
+    """Build a new timetable for the whole school, replacing the current one.
+
+    Returns a report with the number of lessons placed, the
+    (subject_id, class_id, teacher_id) of each lesson that did not fit,
+    the soft score and the winning seed.
+    """
+    problem, replaced = build_problem(days, lessons_per_day)
+    result = solve(problem, attempts, workers, seed)
+    written = 0 if dry_run else _write(problem, result, list(days), replaced)
+    return _report(problem, result, written)
+
+
+def resolve_teacher(teacher_id, days=WEEKDAYS, lessons_per_day=LESSONS_PER_DAY, attempts=ATTEMPTS, workers=None,
+                    seed=0, dry_run=False):
+    """Re-place one teacher's lessons around the rest of the timetable"""
+    subjects = db.session.execute(select(Subject.id, Subject.class_id).where(Subject.teacher_id == teacher_id)).all()
+    free = {subject.id for subject in subjects}
+    problem, replaced = build_problem(days, lessons_per_day, free)
+    result = solve(problem, attempts, workers, seed)
+    if result['unplaced']:
+        class_ids = {subject.class_id for subject in subjects}
+        free = set(db.session.scalars(select(Subject.id).where(Subject.class_id.in_(class_ids))))
+        problem, replaced = build_problem(days, lessons_per_day, free)
+        result = solve(problem, attempts, workers, seed)
+    written = 0 if dry_run else _write(problem, result, list(days), replaced)
+    return _report(problem, result, written)
+
+
+def set_unavailable(teacher_id, slots):
+    """Replace a teacher's unavailable (day, lesson number) slots"""
+    db.session.execute(delete(TeacherUnavailability).where(TeacherUnavailability.teacher_id == teacher_id))
+    rows = [{'teacher_id': teacher_id, 'day_of_week': day, 'lesson_number': lesson} for day, lesson in set(slots)]
+    if rows:
+        db.session.execute(insert(TeacherUnavailability), rows)
+    db.session.commit()